@@ -1,6 +1,9 @@
 """Module for keeping track of adapters.
 
-base.py provides the Adapter class
+base.py provides the Adapter class, and RangeAdapter for adapters that
+    are arithmetic progressions, like headstages.intan2gui_range, and
+    FrozenAdapter for immutable ones that can be hashed. Ground,
+    reference and unconnected pins are recognized by base.pin_class
 channels : the list of channels sorted geometrically as they are on each
     probe
 probes : the mapping between the channel numbers and the Samtec numbers
@@ -10,12 +13,30 @@ probe_adapters : the mapping from Samtec numbers through the various
     kinds of adapters that I've made. This is now the one we use for 
     almost everything, including stuff that doesn't go through Samtec.
 headstages : the mapping onto Intan stuff
+routes : the adapters as a graph between naming systems (Samtec, Omnetics,
+    Intan, ...), and the chained route between any two of them
 dataflow : constructing the complete flow of channels from probe to
-    headstage
+    headstage. Each dataflow is built the first time it is accessed,
+    see dataflow.get
+cache : opt-in on-disk cache of the built dataflows
+shared : the built dataflows published once in shared memory, for
+    many worker processes to attach to without building them again
+raw : reordering raw recordings from acquisition order into geometric
+    order, streaming through a memory map, and cached permutations
+    between any two orderings of a dataflow (raw.permutation)
+batch : reordering many recordings in parallel from a manifest, with
+    resume after interruption
+geometry : radius and nearest neighbor queries on the sites of a
+    dataflow, and the sparse adjacency in acquisition channel order
+reference : median or mean referencing within shanks or tetrodes, on
+    arrays or as a stage of raw.reorder_file
+impedance : loading a directory of nanoZ files into one table, mapped
+    through the wire dataflows to headstage channels and EIB holes
 """
 from __future__ import absolute_import
 
-from .base import Adapter
+from .base import Adapter, RangeAdapter, FrozenAdapter
+from .base import pin_class, SIGNAL, GROUND, REFERENCE, NOCONNECT
 from . import channels
 from . import probe_adapters
 from . import probes
@@ -3,9 +3,297 @@ from __future__ import print_function
 from builtins import str
 from builtins import zip
 from builtins import object
+import collections
+import json
+import re
+import struct
+import threading
 import numpy as np
 
 
+## Integer coding of channel ids
+# Each column of a table can be represented as an int32 array of codes.
+# Non-negative integer channel ids are stored as themselves, so NumPy
+# kernels can work on them directly. None is stored as NONE_CODE. Anything
+# else (eg 'GND', 'REF', '01A', 'top_00') is stored as a negative code that
+# indexes into a per-column tuple of symbols: code -2 is symbols[0], code -3
+# is symbols[1], and so on.
+NONE_CODE = -1
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def symbol_code(n):
+    """Return the code of the nth symbol in a column"""
+    return -2 - n
+
+
+def encode_column(values):
+    """Encode a list-like of channel ids as (codes, symbols)
+
+    codes : int32 array of the same length as `values`
+    symbols : tuple of the non-integer channel ids, in order of appearance
+
+    Integer valued floats, as from a DataFrame column, are stored as the
+    integer, since they are equal to it as dict keys.
+    """
+    # Fast path for integer arrays
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+        with np.errstate(invalid='ignore'):
+            is_int = values.dtype.kind != 'f' or np.all(
+                np.mod(values, 1) == 0)
+        if is_int and (len(values) == 0 or (
+                values.min() >= 0 and values.max() <= INT32_MAX)):
+            return values.astype(np.int32), ()
+
+    symbols = []
+    symbol2code = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for n, val in enumerate(values):
+        if val is None:
+            code = NONE_CODE
+        elif (isinstance(val, (int, np.integer)) and
+                not isinstance(val, (bool, np.bool_)) and
+                0 <= val <= INT32_MAX):
+            code = val
+        elif (isinstance(val, (float, np.floating)) and
+                float(val).is_integer() and 0 <= val <= INT32_MAX):
+            code = int(val)
+        else:
+            try:
+                code = symbol2code[val]
+            except KeyError:
+                code = symbol_code(len(symbols))
+                symbol2code[val] = code
+                symbols.append(val)
+        codes[n] = code
+    return codes, tuple(symbols)
+
+
+def decode_column(codes, symbols):
+    """Inverse of encode_column, returns an object array of channel ids"""
+    res = np.empty(len(codes), dtype=object)
+    res[:] = codes.tolist()
+
+    neg = np.flatnonzero(codes < 0)
+    if len(neg) > 0:
+        # Element 0 is None, element 1 is symbols[0], etc
+        lut = np.empty(len(symbols) + 1, dtype=object)
+        for n, symbol in enumerate(symbols):
+            lut[n + 1] = symbol
+        res[neg] = lut[-1 - codes[neg]]
+    return res
+
+
+## Pin classes
+# Every channel id is a signal pin, a ground, a reference, or a pin that
+# isn't connected. Non-signal pins are spelled differently on each
+# datasheet, so they are recognized by these patterns. Integer channel ids,
+# and any other symbol (eg '01A' or 'top_00'), are signal pins. None is not
+# connected. A suffix like '_2', as added by Adapter.stack, is ignored.
+SIGNAL, GROUND, REFERENCE, NOCONNECT = 0, 1, 2, 3
+PIN_CLASS_NAMES = ['signal', 'ground', 'reference', 'noconnect']
+PIN_CLASS_PATTERNS = [
+    (GROUND, re.compile(r'^(GND|G\d*)(_\d+)?$')),
+    (REFERENCE, re.compile(r'^(REF|R|[PH]R\d*)(_\d+)?$')),
+    (NOCONNECT, re.compile(r'^(NC|N[0-9A-F]|X)(_\d+)?$')),
+]
+
+
+def pin_class(val, strict=False):
+    """Return the pin class of a channel id, eg GROUND for 'GND'
+
+    strict : if True, raise ValueError for strings that are not in
+        PIN_CLASS_PATTERNS, eg a misspelled 'GDN', instead of taking them
+        for signals
+    """
+    if val is None:
+        return NOCONNECT
+    if isinstance(val, str):
+        for cls, pattern in PIN_CLASS_PATTERNS:
+            if pattern.match(val):
+                return cls
+        if strict:
+            raise ValueError("unknown pin label {!r}".format(val))
+    return SIGNAL
+
+
+def code_classes(codes, symbols):
+    """Return the int8 pin class of each of `codes` of a column"""
+    lut = np.array([NOCONNECT] + [pin_class(symbol) for symbol in symbols],
+        dtype=np.int8)
+    res = np.full(np.shape(codes), SIGNAL, dtype=np.int8)
+    neg = codes < 0
+    res[neg] = lut[-1 - codes[neg]]
+    return res
+
+
+def encode_table(table):
+    """Encode each column of an object table, returns (codes, symbols)"""
+    table = np.asarray(table, dtype=object)
+    codes = np.empty(table.shape, dtype=np.int32)
+    symbols = []
+    for ncol in range(table.shape[1]):
+        codes[:, ncol], col_symbols = encode_column(table[:, ncol])
+        symbols.append(col_symbols)
+    return codes, symbols
+
+
+def decode_table(codes, symbols):
+    """Inverse of encode_table, returns an object table"""
+    table = np.empty(codes.shape, dtype=object)
+    for ncol in range(codes.shape[1]):
+        table[:, ncol] = decode_column(codes[:, ncol], symbols[ncol])
+    return table
+
+
+class ColumnIndex(object):
+    """Vectorized lookup of the row that holds each channel id in a column.
+
+    This is the array equivalent of the in2out dict. It is built once from
+    the codes of one column and then answers lookups for whole arrays of
+    keys at a time.
+
+    If a channel id occurs more than once, `keep` determines whether the
+    'first' or the 'last' row is returned. 'last' matches the dicts.
+    """
+    def __init__(self, codes, symbols, keep='last'):
+        rows = np.flatnonzero(codes != NONE_CODE)
+        if keep == 'last':
+            rows = rows[::-1]
+        elif keep != 'first':
+            raise ValueError("keep must be 'first' or 'last'")
+
+        # np.unique returns the first occurrence of each key
+        self.keys, first = np.unique(codes[rows], return_index=True)
+        self.rows = rows[first]
+        self.n_duplicates = len(rows) - len(self.keys)
+        self.symbols = symbols
+        self.symbol2code = dict(
+            (symbol, symbol_code(n)) for n, symbol in enumerate(symbols))
+
+        # Dense lookup table for the integer channel ids, unless they are
+        # very sparse, in which case use searchsorted on self.keys instead
+        self.lut = None
+        n_neg = np.searchsorted(self.keys, 0)
+        if n_neg < len(self.keys):
+            max_key = self.keys[-1]
+            if max_key < max(4 * len(codes), 4096):
+                self.lut = np.full(max_key + 1, -1, dtype=np.intp)
+                self.lut[self.keys[n_neg:]] = self.rows[n_neg:]
+
+    @classmethod
+    def from_arrays(cls, keys, rows, lut, symbols, n_duplicates=0):
+        """Return an index made of arrays that were already built, eg
+        in shared memory, without copying them
+
+        keys, rows, lut : the attributes of the same names of an index,
+            with lut None if it has no lookup table
+        """
+        res = cls.__new__(cls)
+        res.keys = keys
+        res.rows = rows
+        res.lut = lut
+        res.n_duplicates = n_duplicates
+        res.symbols = symbols
+        res.symbol2code = dict(
+            (symbol, symbol_code(n)) for n, symbol in enumerate(symbols))
+        return res
+
+    def renumbered(self, new_rows):
+        """Return a copy of this index for the same column with its rows
+        reordered, where old row i is now new_rows[i]"""
+        res = ColumnIndex.__new__(ColumnIndex)
+        res.__dict__.update(self.__dict__)
+        res.rows = new_rows[self.rows]
+        if self.lut is not None:
+            res.lut = np.where(self.lut >= 0, new_rows[self.lut], -1)
+        return res
+
+    def translate(self, codes, symbols):
+        """Convert codes from another column into the codes of this column
+
+        codes : array of codes from another column
+        symbols : the symbols of that other column
+
+        Symbols that do not occur in this column become NONE_CODE, which
+        is never found.
+        """
+        codes = np.asarray(codes)
+        if len(symbols) == 0 or tuple(symbols) == tuple(self.symbols):
+            return codes
+
+        lut = np.empty(len(symbols) + 1, dtype=np.int32)
+        lut[0] = NONE_CODE
+        for n, symbol in enumerate(symbols):
+            lut[n + 1] = self.symbol2code.get(symbol, NONE_CODE)
+
+        res = codes.copy()
+        neg = codes < 0
+        res[neg] = lut[-1 - codes[neg]]
+        return res
+
+    def encode(self, keys):
+        """Convert channel ids into the codes of this column"""
+        if not isinstance(keys, np.ndarray):
+            arr = np.asarray(keys)
+            if arr.dtype.kind in 'US':
+                # Don't let mixed lists like ['GND', 1] become all strings
+                arr = np.asarray(keys, dtype=object)
+            keys = arr
+        if keys.dtype.kind in 'iuf':
+            return self._encode_numbers(keys)
+
+        codes, symbols = encode_column(keys.ravel())
+        return self.translate(codes, symbols).reshape(keys.shape)
+
+    def _encode_numbers(self, keys):
+        """encode for arrays of ints or floats, eg with a -1 sentinel or NaN
+
+        Only the distinct keys that are not int32 codes are looked up in
+        the symbols, the others are cast all at once.
+        """
+        flat = keys.ravel()
+        with np.errstate(invalid='ignore'):
+            # Integer valued floats, as from a DataFrame with NaN
+            is_code = (flat >= 0) & (flat <= INT32_MAX)
+            if keys.dtype.kind == 'f':
+                is_code &= np.mod(flat, 1) == 0
+        if np.all(is_code):
+            return keys.astype(np.int32)
+
+        res = np.full(len(flat), NONE_CODE, dtype=np.int32)
+        res[is_code] = flat[is_code]
+        if len(self.symbols) > 0:
+            others = ~is_code
+            distinct, inverse = np.unique(flat[others], return_inverse=True)
+            codes, symbols = encode_column(distinct)
+            res[others] = self.translate(codes, symbols)[inverse]
+        return res.reshape(keys.shape)
+
+    def find(self, codes):
+        """Return the row of each code in `codes`, or -1 if not found
+
+        codes : array of codes of this column, see `encode` and `translate`
+        """
+        codes = np.asarray(codes)
+        res = np.full(codes.shape, -1, dtype=np.intp)
+        if self.lut is not None:
+            in_lut = (codes >= 0) & (codes < len(self.lut))
+            res[in_lut] = self.lut[codes[in_lut]]
+            search = np.flatnonzero(~in_lut & (codes != NONE_CODE))
+        else:
+            search = np.flatnonzero(codes != NONE_CODE)
+
+        if len(search) > 0 and len(self.keys) > 0:
+            flat_res = res.reshape(-1)
+            flat_codes = codes.reshape(-1)[search]
+            pos = np.searchsorted(self.keys, flat_codes)
+            pos[pos == len(self.keys)] = 0
+            found = self.keys[pos] == flat_codes
+            flat_res[search[found]] = self.rows[pos[found]]
+        return res
+
+
 class Adapter(object):
     """Object representing inputs and outputs of a physical adapter.
     
@@ -19,16 +307,30 @@ class Adapter(object):
     inv : return an Adapter with outputs and inputs reversed
         This is useful for looking up an input for a given output
     sort_by : inplace sort. Change the order of inputs and outputs.
+    sorted_by : sorted copy, leaving the original unchanged
+    argsort_by : the permutation that sort_by would apply
+    map : vectorized look up of outputs for an array of inputs
+    lookup : vectorized look up between any two columns
+    chain : compose a series of adapters, like `+`, but not memoized
+    stack : concatenate adapters as blocks with offset channel ids
+    drop_nonsignal : copy without the ground, reference and no-connect rows
+    save, load : binary file of the codes, which can be memory-mapped
+    to_bytes, from_bytes : the same format in memory, also used by pickle
     
     Properties:
     in2out : dict-like, looks up output for a specified input
     out2in : dict-like, looks up input for a specified output
     ins : array of inputs
     outs : array of outputs
+    codes : int32 array of the same shape as `table`, see encode_column
+    symbols : list of the symbols for each column of `codes`
+    names : list of the name of each column, or None if unnamed
+    pin_classes : int8 array of the pin class of each entry, see pin_class
+    signal_mask : bool array, True for rows that are signal in every column
     
     
     """
-    def __init__(self, l1, l2=None):
+    def __init__(self, l1, l2=None, coded=False, names=None):
         """Initialize a new adapter.
         
         l1 : list-like, list of channel ids for each channel on the
@@ -36,6 +338,17 @@ class Adapter(object):
             object, including integers or strings, but not a list.
         l2 : list-like, of same length as `d_or_l1`, of the outputs of the
             adapter, and in corresponding order to l1.
+        coded : bool
+            If False, the table is stored as an object array.
+            If True, it is stored only as int32 `codes` and per-column
+            `symbols`, and `table` is decoded when it is accessed. This
+            uses much less memory for long tables.
+            Adapters derived from this one (with `+`, `inv`, etc) use the
+            same storage mode.
+        names : list-like of length 2, or None
+            Names of the input and output columns, eg ['Sam', 'Om']. These
+            are carried along by `+` and `inv`, and columns can be
+            addressed by name in `lookup`.
         
         If there is no corresponding input for a given output, put None
         at that point in the list (and vice versa). Therefore None cannot
@@ -45,9 +358,7 @@ class Adapter(object):
         An alternative method of initialization is to pass this sort of array
         as `l1` and leave l2 as None.
         """
-        self.table = None
-        self._in2out = None
-        self._out2in = None
+        self._init_storage(coded)
         
         # Determine type of initialization
         if l2 is not None:
@@ -58,87 +369,424 @@ class Adapter(object):
             a = l1
         
         # Convert to internal representation
-        self.table = np.asarray(a, dtype=object)
-        if self.table.ndim != 2 or self.table.shape[1] != 2:
+        table = np.asarray(a, dtype=object)
+        if table.ndim != 2 or table.shape[1] != 2:
             raise Exception("table should be a Nx2 array")
+        self.table = table
+        self.names = names
+
+    def _init_storage(self, coded):
+        self.coded = coded
+        self._table = None
+        self._codes = None
+        self._symbols = None
+        self._names = None
+
+        # Memoized things derived from the table, like in2out
+        self._cache = {}
+
+    @classmethod
+    def _from_table(cls, table, coded=False, names=None):
+        """Return a new Adapter from an object table with any number of
+        columns"""
+        a = cls.__new__(cls)
+        a._init_storage(coded)
+        a.table = table
+        a.names = names
+        return a
+
+    @classmethod
+    def _from_codes(cls, codes, symbols, coded=False, names=None):
+        """Return a new Adapter from codes and symbols"""
+        a = cls.__new__(cls)
+        a._init_storage(coded)
+        a._set_codes(codes, symbols)
+        a.names = names
+        return a
+
+    @property
+    def table(self):
+        if self._table is None:
+            # Coded storage, decode on demand
+            return decode_table(self._codes, self._symbols)
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        table = np.asarray(table, dtype=object)
+        if table.ndim != 2:
+            raise Exception("table should be a 2d array")
+
+        self._cache = {}
+        if self.coded:
+            self._table = None
+            self._codes, self._symbols = encode_table(table)
+        else:
+            self._table = table
+            self._codes, self._symbols = None, None
+
+        if self._names is not None and len(self._names) != table.shape[1]:
+            self._names = None
+
+    def _set_codes(self, codes, symbols):
+        """Replace the table with the provided codes and symbols"""
+        self._cache = {}
+        self._codes = codes
+        self._symbols = list(symbols)
+        if self.coded:
+            self._table = None
+        else:
+            self._table = decode_table(codes, symbols)
+
+    @property
+    def ncols(self):
+        if self._table is None:
+            return self._codes.shape[1]
+        return self._table.shape[1]
+
+    @property
+    def names(self):
+        if self._names is None:
+            return [None] * self.ncols
+        return list(self._names)
+
+    @names.setter
+    def names(self, names):
+        if names is not None:
+            names = list(names)
+            if len(names) != self.ncols:
+                raise ValueError("need one name for each of {} columns".format(
+                    self.ncols))
+            if all(name is None for name in names):
+                names = None
+        self._names = names
+
+    def column(self, col):
+        """Return the position of a column given by position or by name"""
+        if isinstance(col, (int, np.integer)):
+            if not -self.ncols <= col < self.ncols:
+                raise IndexError("no column {}".format(col))
+            return col % self.ncols
+        try:
+            return self.names.index(col)
+        except ValueError:
+            raise KeyError("no column named {!r}".format(col))
+
+    @property
+    def codes(self):
+        # Object storage encodes on first access
+        if self._codes is None:
+            self._codes, self._symbols = encode_table(self._table)
+        return self._codes
+
+    @property
+    def symbols(self):
+        if self._symbols is None:
+            self._codes, self._symbols = encode_table(self._table)
+        return self._symbols
     
     @property
     def in2out(self):
         # Return memoized dict
-        if self._in2out is None:
+        if 'in2out' not in self._cache:
             res = {}
-            for row in self.table:
-                i1, i2 = row[0], row[-1]
+            for i1, i2 in zip(self.ins, self.outs):
                 if i1 is None:
                     continue
-                if i1 in res:
+                if i1 in res and pin_class(i1) == SIGNAL:
                     print("warning: duplicate keys in 'in' column")
                 res[i1] = i2
-            self._in2out = res
-        return self._in2out
+            self._cache['in2out'] = res
+        return self._cache['in2out']
     
     @property
     def out2in(self):
         # Return memoized dict
-        if self._out2in is None:
+        if 'out2in' not in self._cache:
             res = {}
-            for row in self.table:
-                i2, i1 = row[0], row[-1]
+            for i2, i1 in zip(self.ins, self.outs):
                 if i1 is None:
                     continue
-                if i1 in res:
+                if i1 in res and pin_class(i1) == SIGNAL:
                     print("warning: duplicate keys in 'out' column")
                 res[i1] = i2
-            self._out2in = res
-        return self._out2in
+            self._cache['out2in'] = res
+        return self._cache['out2in']
     
     @property
     def outs(self):
-        return self.table[:, -1]
+        if self._table is None:
+            return decode_column(self._codes[:, -1], self._symbols[-1])
+        return self._table[:, -1]
     
     @property
     def ins(self):
-        return self.table[:, 0]
+        if self._table is None:
+            return decode_column(self._codes[:, 0], self._symbols[0])
+        return self._table[:, 0]
+
+    def __len__(self):
+        if self._table is None:
+            return len(self._codes)
+        return len(self._table)
     
     def __add__(self, a2):
-        """Append a new column and keep the intermediaries?"""
-        a3 = Adapter(self.ins.copy(), self.outs.copy())
-        a3.table = self.table.copy()
-        d = a2.in2out
+        """Append a new column and keep the intermediaries?
+
+        The result is memoized by the content of both adapters, see
+        `composition_cache_info`.
+        """
+        return _compose(self, a2)
+
+    @staticmethod
+    def chain(*adapters):
+        """Compose a series of adapters, keeping every intermediate column.
+
+        Adapter.chain(a1, a2, a3) is the same as a1 + a2 + a3, but the whole
+        chain is resolved in one pass. Each link looks up the last column
+        so far in the inputs of the next adapter using its ColumnIndex,
+        and the table is only assembled once at the end.
+
+        As with `+`, only the outputs of each following adapter are
+        appended. Channels that are not an input of the next adapter
+        continue as None.
+
+        Returns : Adapter
+            With the same storage mode as the first adapter
+        """
+        if len(adapters) == 0:
+            raise ValueError("chain requires at least one adapter")
+        first = adapters[0]
+
+        # Arithmetic adapters compose into another arithmetic adapter
+        if all(isinstance(adapter, RangeAdapter) for adapter in adapters):
+            folded = RangeAdapter._fold(adapters)
+            if folded is not None:
+                return folded
+
+        columns = [first.codes]
+        symbols = list(first.symbols)
+        names = first.names
+        last_codes = first.codes[:, -1]
+        for adapter in adapters[1:]:
+            if len(adapter) == 0:
+                last_codes = np.full(len(first), NONE_CODE, dtype=np.int32)
+            else:
+                rows = adapter._find_rows(0, last_codes, symbols[-1])
+                last_codes = np.where(
+                    rows >= 0, adapter._column_codes(-1, rows), NONE_CODE
+                    ).astype(np.int32)
+            columns.append(last_codes[:, None])
+            symbols.append(adapter.symbols[-1])
+            names.append(adapter.names[-1])
+
+        return Adapter._from_codes(np.concatenate(columns, axis=1), symbols,
+            coded=first.coded, names=names)
+
+    @staticmethod
+    def stack(adapters, in_offsets=None, out_offsets=None,
+        tag_symbols=False):
+        """Concatenate adapters as blocks, offsetting the channels of each.
+
+        This describes adapters that are the same block repeated, eg two
+        headstages or two Samtec connectors side by side:
+            Adapter.stack([omnetics2intan] * 2, 36, 32)
         
-        new_table = list(a3.table.transpose())
-        new_table.append(new_table[-1])
-        a3.table = np.asarray(new_table, dtype=object).transpose()
-        for n, i2 in enumerate(self.outs):
-            try:
-                a3.table[n, -1] = d[i2]
-            except KeyError:
-                a3.table[n, -1] = None
-        return a3
-    
+        adapters : list of Adapters with the same number of columns
+        in_offsets, out_offsets : offsets added to the integer channel ids
+            of the first and the last column of each block.
+            Either a list with one offset per block, or a single int, in
+            which case block n is offset by n times it. None for no
+            offset. Columns in between are not offset.
+        tag_symbols : if True, the symbols (eg 'GND') of block n after the
+            first are suffixed with n + 1, eg 'GND_2', so that they stay
+            unique across blocks. Otherwise they are kept as they are.
+
+        Returns : Adapter
+            With the storage mode and names of the first adapter
+        """
+        if len(adapters) == 0:
+            raise ValueError("stack requires at least one adapter")
+        first = adapters[0]
+        ncols = first.ncols
+        if any(adapter.ncols != ncols for adapter in adapters):
+            raise ValueError("all adapters must have the same columns")
+
+        # The offset of each column of each block
+        offsets = np.zeros((len(adapters), ncols), dtype=np.int64)
+        for ncol, col_offsets in [(0, in_offsets), (-1, out_offsets)]:
+            if col_offsets is None:
+                continue
+            if np.ndim(col_offsets) == 0:
+                col_offsets = np.arange(len(adapters)) * col_offsets
+            elif len(col_offsets) != len(adapters):
+                raise ValueError("need one offset for each adapter")
+            offsets[:, ncol] = col_offsets
+
+        # Symbols are merged in order of appearance, so each block's
+        # symbol codes are translated to the merged ones
+        symbols = [[] for ncol in range(ncols)]
+        symbol2code = [{} for ncol in range(ncols)]
+        blocks = []
+        for nblock, adapter in enumerate(adapters):
+            codes = adapter.codes.astype(np.int64)
+            for ncol in range(ncols):
+                col_codes = codes[:, ncol]
+                lut = np.empty(len(adapter.symbols[ncol]), dtype=np.int64)
+                for nsym, symbol in enumerate(adapter.symbols[ncol]):
+                    if tag_symbols and nblock > 0:
+                        symbol = '{}_{}'.format(symbol, nblock + 1)
+                    if symbol not in symbol2code[ncol]:
+                        symbol2code[ncol][symbol] = symbol_code(
+                            len(symbols[ncol]))
+                        symbols[ncol].append(symbol)
+                    lut[nsym] = symbol2code[ncol][symbol]
+                is_int = col_codes >= 0
+                is_symbol = col_codes < NONE_CODE
+                col_codes[is_int] += offsets[nblock, ncol]
+                col_codes[is_symbol] = lut[symbol_code(0) - col_codes[
+                    is_symbol]]
+            blocks.append(codes)
+
+        codes = np.concatenate(blocks, axis=0)
+        if len(codes) and codes.max() > INT32_MAX:
+            raise ValueError("offset channel ids don't fit in int32")
+        return Adapter._from_codes(codes.astype(np.int32),
+            [tuple(col_symbols) for col_symbols in symbols],
+            coded=first.coded, names=first.names)
+
     def __getitem__(self, key):
         try:
             res = self.in2out[key]
         except TypeError:
             # key was a list
-            res = np.array([self.in2out[kk] for kk in key], dtype=object)
+            index = self._index(0)
+            rows = index.find(index.encode(key))
+            if np.any(rows < 0):
+                raise KeyError(np.asarray(key)[rows < 0][0])
+            res = decode_column(self.codes[rows, -1], self.symbols[-1])
         except KeyError:
             # key not an input
             return None
         return res
-    
+
+    def _index(self, ncol, keep='last'):
+        """Return the memoized ColumnIndex of column `ncol`"""
+        key = ('index', self.column(ncol), keep)
+        if key not in self._cache:
+            index = ColumnIndex(
+                self.codes[:, key[1]], self.symbols[key[1]], keep=keep)
+            if index.n_duplicates > 0 and keep == 'last' and (
+                    self._has_signal_duplicates(key[1])):
+                # Same warnings as in2out and out2in
+                if key[1] == 0:
+                    print("warning: duplicate keys in 'in' column")
+                elif key[1] == self.ncols - 1:
+                    print("warning: duplicate keys in 'out' column")
+                else:
+                    print("warning: duplicate keys in column {}".format(
+                        key[1]))
+            self._cache[key] = index
+        return self._cache[key]
+
+    def _has_signal_duplicates(self, ncol):
+        # Repeated ground, reference or no-connect pins are expected
+        codes = self.codes[:, ncol]
+        codes = codes[self.pin_classes[:, ncol] == SIGNAL]
+        return len(np.unique(codes)) < len(codes)
+
+    def _find_rows(self, ncol, codes, symbols):
+        """Return the row of each of `codes` in column `ncol`, or -1
+
+        codes, symbols : codes of the keys, and the symbols they refer to
+        """
+        index = self._index(ncol)
+        return index.find(index.translate(codes, symbols))
+
+    def _column_codes(self, ncol, rows):
+        """Return the codes in column `ncol` at `rows`"""
+        return self.codes[rows, ncol]
+
+    def _take(self, ncol, rows, missing):
+        """Return the channel ids in column `ncol` at `rows`
+
+        Rows that are -1, or that hold None, are replaced with `missing`.
+        The result is an integer array if that column has no symbols and
+        `missing` is an integer, otherwise an object array.
+        """
+        if len(self) == 0:
+            codes = np.full(np.shape(rows), NONE_CODE, dtype=np.int32)
+        else:
+            codes = self.codes[:, ncol][rows]
+        unmapped = (rows < 0) | (codes == NONE_CODE)
+        symbols = self.symbols[ncol]
+        if len(symbols) == 0 and isinstance(missing, (int, np.integer)):
+            res = codes.astype(int)
+        else:
+            res = decode_column(codes.ravel(), symbols).reshape(codes.shape)
+        res[unmapped] = missing
+        return res
+
+    def map(self, keys, missing=-1):
+        """Look up the output for every input in `keys` at once.
+
+        This is the vectorized version of `__getitem__`, meant for long
+        arrays of channel ids. For the reverse direction use `inv.map`.
+
+        keys : array-like of inputs, of any shape
+        missing : value to return for keys that are not an input, or that
+            have no corresponding output
+
+        Returns : array of outputs, of the same shape as `keys`
+            This is an int array if all the outputs are integers and
+            `missing` is an integer, otherwise an object array.
+        """
+        return self.lookup(0, -1, keys, missing=missing)
+
+    def lookup(self, src_col, dst_col, keys, missing=-1):
+        """Look up the values in one column for keys in another column.
+
+        After composition with `+`, the table holds every intermediate
+        level of the dataflow. This goes from any of them to any other,
+        eg from Omnetics pin to probe channel, without a DataFrame.
+        Each column gets its own memoized ColumnIndex.
+
+        src_col, dst_col : int position or name of a column, see `names`
+        keys : a channel id in `src_col`, or an array-like of them
+        missing : value to return for keys that are not in `src_col`, or
+            that have no value in `dst_col`
+
+        Returns : a single value if `keys` is a single channel id,
+            otherwise an array of the same shape as `keys` (see `map`)
+        """
+        src_col = self.column(src_col)
+        dst_col = self.column(dst_col)
+        index = self._index(src_col)
+
+        single = not isinstance(keys, (list, tuple, np.ndarray))
+        if single:
+            keys = np.array([keys], dtype=object)
+        rows = index.find(index.encode(keys))
+        res = self._take(dst_col, rows, missing)
+        if single:
+            return res.tolist()[0]
+        return res
+
     @property
     def inv(self):
-        a = Adapter(self.outs, self.ins)
-        a.table = self.table[:, ::-1]
-        return a
+        if self.coded:
+            # Reversed view of the codes
+            return Adapter._from_codes(self._codes[:, ::-1],
+                self._symbols[::-1], coded=True, names=self.names[::-1])
+        return Adapter._from_table(
+            self.table[:, ::-1], names=self.names[::-1])
         
     
     def __str__(self):
         return str(self.table)
     
     def __repr__(self):
-        return "Adapter(\n" + repr(self.table) + ")"
+        return type(self).__name__ + "(\n" + repr(self.table) + ")"
     
     def __getslice__(self, slc1, slc2):
         """Returns outputs from slc1 to slc2 inclusive"""
@@ -147,6 +795,75 @@ class Adapter(object):
         return self.outs[i1:i2]
 
     
+    def argsort_by(self, keys, reverse=False):
+        """Return the permutation that `sort_by` would apply.
+
+        keys : list-like, or 1d array
+            This is a list of inputs
+            Each entry in `keys` must be an input
+
+        Returns : 1d int array
+            The row of each key in `table`, so that table[permutation]
+            is sorted by keys. Because the rows of an adapter are in the
+            same order as the channels in data, this can also be used
+            with np.take to reorder data the same way.
+        """
+        if reverse:
+            keys = keys[::-1]
+
+        # Like list.index, use the first row of any duplicate
+        index = self._index(0, keep='first')
+        permutation = index.find(index.encode(keys))
+        if np.any(permutation < 0):
+            raise ValueError("{!r} is not an input".format(
+                np.asarray(keys, dtype=object)[permutation < 0][0]))
+        return permutation
+
+    @property
+    def pin_classes(self):
+        # Memoized, and derived from the codes so that it follows the rows
+        # through `+`, `inv` and `sort_by`
+        if 'pin_classes' not in self._cache:
+            codes = self.codes
+            res = np.empty(codes.shape, dtype=np.int8)
+            for ncol, symbols in enumerate(self.symbols):
+                res[:, ncol] = code_classes(codes[:, ncol], symbols)
+            self._cache['pin_classes'] = res
+        return self._cache['pin_classes']
+
+    @property
+    def signal_mask(self):
+        return np.all(self.pin_classes == SIGNAL, axis=1)
+
+    def drop_nonsignal(self, strict=True):
+        """Return a copy without the rows that have a ground, reference
+        or no-connect pin (or None) in any column.
+
+        strict : if True, raise ValueError if a column has a string that
+            is not a known pin label (see pin_class), which may be
+            misspelled. If False, such strings are kept as signals, eg
+            EIB names like '01A'.
+
+        Returns : Adapter
+            With the same storage mode and names
+        """
+        if strict:
+            for col_symbols in self.symbols:
+                for symbol in col_symbols:
+                    pin_class(symbol, strict=True)
+        return self._subset(np.flatnonzero(self.signal_mask))
+
+    @property
+    def permutation(self):
+        """The permutation applied by the last `sort_by`, or None"""
+        return self._cache.get('permutation')
+
+    def _take_rows(self, rows):
+        """Return codes, symbols, and object table (or None) of `rows`"""
+        codes = None if self._codes is None else self._codes[rows]
+        table = None if self._table is None else self._table[rows]
+        return codes, self._symbols, table
+
     def sort_by(self, keys, reverse=False):
         """Inplace sort by keys.
         
@@ -157,20 +874,631 @@ class Adapter(object):
 
         Returns : self
             Sorts the `table` and returns self
+            The permutation that was applied is in `self.permutation`
+        """
+        permutation = self.argsort_by(keys, reverse=reverse)
+        codes, symbols, table = self._take_rows(permutation)
+
+        # Reset the memoized dicts and indexes
+        self._cache = {'permutation': permutation}
+        self._codes, self._symbols, self._table = codes, symbols, table
+        
+        return self
+
+    def sorted_by(self, keys, reverse=False):
+        """Return a sorted copy of this adapter, leaving this one unchanged.
+
+        See `sort_by`. The permutation that was applied is in
+        `permutation` of the result.
+        """
+        permutation = self.argsort_by(keys, reverse=reverse)
+        a = self._subset(permutation)
+        a._cache['permutation'] = permutation
+        return a
+
+    def freeze(self):
+        """Return an immutable and hashable copy, see FrozenAdapter"""
+        return FrozenAdapter(self)
+
+    def to_bytes(self):
+        """Return this adapter in the binary format, see BINARY_MAGIC"""
+        header, codes = _binary_parts(self)
+        return header + codes.tobytes()
+
+    @staticmethod
+    def from_bytes(data, symbols=None):
+        """Inverse of to_bytes
+
+        The codes are a read-only view of `data`, not a copy.
+        symbols : the symbols of each column, for data without them in the
+            header (as pickled by __reduce__)
         """
+        length = _header_length(data[:_PREFIX_SIZE])
+        meta, offset = _parse_header(
+            data[_PREFIX_SIZE:_PREFIX_SIZE + length])
+        shape = tuple(meta['shape'])
+        codes = np.frombuffer(data, dtype=BINARY_DTYPE,
+            count=shape[0] * shape[1], offset=offset)
+        return _from_binary(meta, codes.reshape(shape), symbols)
+
+    def save(self, path):
+        """Write this adapter to a binary file, see BINARY_MAGIC"""
+        header, codes = _binary_parts(self)
+        with open(path, 'wb') as fi:
+            fi.write(header)
+            fi.write(codes.tobytes())
+
+    @staticmethod
+    def load(path, mmap=True):
+        """Read an adapter written by `save`
+
+        mmap : if True, the codes are a read-only memory map of the file,
+            so they are only read when they are used, and processes that
+            load the same file share them. Otherwise they are read.
+
+        Returns : Adapter, or RangeAdapter or FrozenAdapter if that is what
+            was saved
+        """
+        with open(path, 'rb') as fi:
+            length = _header_length(fi.read(_PREFIX_SIZE))
+            meta, offset = _parse_header(fi.read(length))
+            shape = tuple(meta['shape'])
+            if mmap and shape[0] * shape[1] > 0:
+                codes = np.memmap(path, dtype=BINARY_DTYPE, mode='r',
+                    offset=offset, shape=shape)
+            else:
+                fi.seek(offset)
+                codes = np.fromfile(fi, dtype=BINARY_DTYPE,
+                    count=shape[0] * shape[1]).reshape(shape)
+        return _from_binary(meta, codes)
+
+    def __reduce__(self):
+        # Pickle the codes in the binary format rather than the object
+        # table, but the symbols as Python objects, since JSON can't hold
+        # all channel ids (eg tuples)
+        header, codes = _binary_parts(self, symbols=False)
+        return (Adapter.from_bytes, (header + codes.tobytes(),
+            tuple(tuple(col_symbols) for col_symbols in self.symbols)))
+
+    def _subset(self, rows):
+        """Return a new Adapter with `rows` of this one"""
+        codes, symbols, table = self._take_rows(rows)
+        a = Adapter.__new__(Adapter)
+        a._init_storage(self.coded)
+        a._codes, a._symbols, a._table = codes, symbols, table
+        a._names = self._names
+        return a
+
+
+class RangeAdapter(Adapter):
+    """Adapter whose columns are arithmetic progressions of channel ids.
+
+    Row i holds starts[c] + steps[c] * i in column c. For example
+    headstages.intan2gui_range, which maps Intan channels 0-35 to GUI
+    channels 1-36, is
+        RangeAdapter(36, starts=[0, 1])
+
+    Only these parameters are stored. Lookups are computed arithmetically,
+    without a table or an index, and chaining RangeAdapters (with `+` or
+    `chain`) folds them into a single RangeAdapter when every channel goes
+    through. When chained with a table, it is applied as one vectorized
+    arithmetic operation. `codes` and `table` are generated on demand.
+
+    Unlike Adapter, it can't be modified in place, so `sort_by` and
+    setting `table` raise TypeError. Use `sorted_by` instead.
+    """
+    def __init__(self, n, starts=(0, 0), steps=(1, 1), names=None,
+        coded=False):
+        """Initialize a new range adapter.
+
+        n : number of rows
+        starts : the channel id in the first row of each column
+        steps : the difference between consecutive rows of each column,
+            which can be negative but not 0
+        names : see Adapter
+        coded : storage mode of the Adapters derived from this one
+        """
+        starts = np.array(starts, dtype=np.int64)
+        steps = np.array(steps, dtype=np.int64)
+        if starts.ndim != 1 or len(starts) < 2 or (
+                starts.shape != steps.shape):
+            raise ValueError("need a start and a step for each column")
+        if np.any(steps == 0):
+            raise ValueError("steps can't be 0")
+        if n > 0:
+            ends = starts + steps * (n - 1)
+            if min(starts.min(), ends.min()) < 0 or (
+                    max(starts.max(), ends.max()) > INT32_MAX):
+                raise ValueError("channel ids must be non-negative int32")
+
+        self._init_storage(coded)
+        self.n = int(n)
+        self.starts = starts
+        self.steps = steps
+        self.names = names
+
+    @staticmethod
+    def _fold(adapters):
+        """Return the chain of RangeAdapters as a RangeAdapter, or None
+        if some channel doesn't go through all of them"""
+        first = adapters[0]
+        starts = list(first.starts)
+        steps = list(first.steps)
+        names = first.names
+        n = first.n
+        for adapter in adapters[1:]:
+            if n == 0 or adapter.n == 0:
+                return None
+
+            # Row i of the last column is row j0 + dj * i of the next
+            # adapter's input, if that is an integer and in range
+            diff = starts[-1] - adapter.starts[0]
+            if diff % adapter.steps[0] != 0 or (
+                    steps[-1] % adapter.steps[0] != 0):
+                return None
+            j0 = diff // adapter.steps[0]
+            dj = steps[-1] // adapter.steps[0]
+            j_last = j0 + dj * (n - 1)
+            if not (0 <= j0 < adapter.n and 0 <= j_last < adapter.n):
+                return None
+
+            starts.append(adapter.starts[-1] + adapter.steps[-1] * j0)
+            steps.append(adapter.steps[-1] * dj)
+            names.append(adapter.names[-1])
+        return RangeAdapter(n, starts, steps, names=names, coded=first.coded)
+
+    @property
+    def table(self):
+        return decode_table(self.codes, self.symbols)
+
+    @table.setter
+    def table(self, table):
+        raise TypeError("RangeAdapter can't be modified")
+
+    @property
+    def ncols(self):
+        return len(self.starts)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def codes(self):
+        if self._codes is None:
+            self._codes = (self.starts + self.steps * np.arange(
+                self.n)[:, None]).astype(np.int32)
+        return self._codes
+
+    @property
+    def symbols(self):
+        return [()] * self.ncols
+
+    @property
+    def outs(self):
+        return decode_column(self.codes[:, -1], ())
+
+    @property
+    def ins(self):
+        return decode_column(self.codes[:, 0], ())
+
+    def _find_rows(self, ncol, codes, symbols=()):
+        # Symbols and None (negative codes) are never found
+        codes = np.asarray(codes, dtype=np.int64)
+        offsets = codes - self.starts[ncol]
+        rows = offsets // self.steps[ncol]
+        found = ((codes >= 0) & (offsets % self.steps[ncol] == 0) &
+            (rows >= 0) & (rows < self.n))
+        return np.where(found, rows, -1)
+
+    def _column_codes(self, ncol, rows):
+        return self.starts[ncol] + self.steps[ncol] * np.asarray(rows)
+
+    def _take(self, ncol, rows, missing):
+        res = self._column_codes(ncol, rows).astype(int)
+        if not isinstance(missing, (int, np.integer)):
+            res = res.astype(object)
+        res[rows < 0] = missing
+        return res
+
+    def lookup(self, src_col, dst_col, keys, missing=-1):
+        """Look up the values in one column for keys in another column.
+
+        Computed arithmetically, see Adapter.lookup
+        """
+        src_col = self.column(src_col)
+        dst_col = self.column(dst_col)
+        single = not isinstance(keys, (list, tuple, np.ndarray))
+        if single:
+            keys = [keys]
+        if not isinstance(keys, np.ndarray):
+            keys = np.asarray(keys, dtype=object)
+        codes, symbols = encode_column(keys.ravel())
+        rows = self._find_rows(src_col, codes).reshape(keys.shape)
+        res = self._take(dst_col, rows, missing)
+        if single:
+            return res.tolist()[0]
+        return res
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple, np.ndarray)):
+            res = self.lookup(0, -1, key, missing=None)
+            if np.any(res == None):
+                raise KeyError(np.asarray(key)[res == None][0])
+            return res.astype(object)
+        return self.lookup(0, -1, key, missing=None)
+
+    @property
+    def inv(self):
+        return RangeAdapter(self.n, self.starts[::-1], self.steps[::-1],
+            names=self.names[::-1], coded=self.coded)
+
+    def __repr__(self):
+        return "RangeAdapter({}, starts={}, steps={})".format(
+            self.n, self.starts.tolist(), self.steps.tolist())
+
+    def argsort_by(self, keys, reverse=False):
         if reverse:
             keys = keys[::-1]
-    
-        l = list(self.table[:,0])
-        idxs = [l.index(key) for key in keys]
-    
-        #l2 = self[keys]
-        
-        #self.table = np.array([[ll1, ll2] for ll1, ll2 in zip(keys, l2)],
-        #    dtype=object)
-        self.table = self.table[idxs]
-        
+        codes, symbols = encode_column(keys)
+        permutation = self._find_rows(0, codes)
+        if np.any(permutation < 0):
+            raise ValueError("{!r} is not an input".format(
+                np.asarray(keys, dtype=object)[permutation < 0][0]))
+        return permutation
+
+    def _take_rows(self, rows):
+        codes = self.codes[rows]
+        table = None if self.coded else decode_table(codes, self.symbols)
+        return codes, self.symbols, table
+
+    def sort_by(self, keys, reverse=False):
+        raise TypeError("RangeAdapter can't be sorted in place, "
+            "use sorted_by")
+
+
+class FrozenAdapter(Adapter):
+    """Immutable Adapter, which can be hashed, eg to be used as a cache key.
+
+    It is stored as read-only codes, like a coded Adapter. Adapters with
+    the same channel ids and names are equal and have the same hash,
+    which is computed once.
+
+    Derived adapters share as much as possible with this one:
+    inv : a reversed view of the codes, which uses the indexes and dicts
+        of this adapter (its in2out is this out2in)
+    rows : a view for slices of rows
+    sorted_by : reuses the indexes of columns without duplicates
+    renamed : the same codes and indexes with other names
+    `+` of two FrozenAdapters is also frozen. Use `thaw` for a mutable copy.
+    """
+    __slots__ = ('_hash', '_base')
+
+    def __init__(self, l1, l2=None, names=None):
+        """Initialize a new frozen adapter.
+
+        l1, l2, names : see Adapter. l1 can also be an Adapter, which is
+            copied, with its names unless `names` is given.
+        """
+        if isinstance(l1, Adapter) and l2 is None:
+            codes, symbols = l1.codes.copy(), l1.symbols
+            if names is None:
+                names = l1.names
+        else:
+            adapter = Adapter(l1, l2, coded=True)
+            codes, symbols = adapter.codes, adapter.symbols
+        self._init_frozen(codes, symbols, names)
+
+    def _init_frozen(self, codes, symbols, names, base=None):
+        self._init_storage(True)
+        codes = codes.view()
+        codes.flags.writeable = False
+        self._codes = codes
+        self._symbols = tuple(tuple(col_symbols) for col_symbols in symbols)
+        self._hash = None
+
+        # The adapter that this one is the inverse of, or None
+        self._base = base
+        Adapter.names.fset(self, names)
+
+    @classmethod
+    def _frozen(cls, codes, symbols, names, base=None):
+        """Return a new FrozenAdapter that uses `codes` without a copy"""
+        a = cls.__new__(cls)
+        a._init_frozen(codes, symbols, names, base)
+        return a
+
+    def _modified(self, *args, **kwargs):
+        raise TypeError("FrozenAdapter can't be modified, use thaw() for "
+            "a mutable copy")
+    _set_codes = sort_by = _modified
+
+    @property
+    def table(self):
+        if 'table' not in self._cache:
+            table = decode_table(self._codes, self._symbols)
+            table.flags.writeable = False
+            self._cache['table'] = table
+        return self._cache['table']
+
+    @table.setter
+    def table(self, table):
+        self._modified()
+
+    @property
+    def names(self):
+        return Adapter.names.fget(self)
+
+    @names.setter
+    def names(self, names):
+        self._modified()
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self._codes.shape, self._codes.tobytes(),
+                self._symbols, tuple(self.names)))
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenAdapter):
+            return NotImplemented
+        return self is other or (hash(self) == hash(other) and
+            self._symbols == other._symbols and self.names == other.names and
+            np.array_equal(self._codes, other._codes))
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def freeze(self):
         return self
 
+    def thaw(self, coded=False):
+        """Return a mutable copy, see Adapter for `coded`"""
+        a = Adapter.__new__(Adapter)
+        a._init_storage(coded)
+        a._codes = self._codes.copy()
+        a._symbols = list(self._symbols)
+        # The memoized table is copied rather than decoded again
+        a._table = None if coded else self.table.copy()
+        a._names = self._names
+        return a
 
-    
+    @property
+    def inv(self):
+        if self._base is not None:
+            return self._base
+        if 'inv' not in self._cache:
+            self._cache['inv'] = FrozenAdapter._frozen(self._codes[:, ::-1],
+                self._symbols[::-1], self.names[::-1], base=self)
+        return self._cache['inv']
+
+    # The inverse of another adapter uses its indexes and dicts
+    def _index(self, ncol, keep='last'):
+        if self._base is not None:
+            return self._base._index(
+                self.ncols - 1 - self.column(ncol), keep=keep)
+        return Adapter._index(self, ncol, keep=keep)
+
+    @property
+    def in2out(self):
+        if self._base is not None:
+            return self._base.out2in
+        return Adapter.in2out.fget(self)
+
+    @property
+    def out2in(self):
+        if self._base is not None:
+            return self._base.in2out
+        return Adapter.out2in.fget(self)
+
+    @property
+    def pin_classes(self):
+        if self._base is not None:
+            return self._base.pin_classes[:, ::-1]
+        return Adapter.pin_classes.fget(self)
+
+    def renamed(self, names):
+        """Return this adapter with other column names"""
+        res = FrozenAdapter._frozen(self._codes, self._symbols, names)
+        res._cache.update((key, val) for key, val in self._cache.items()
+            if key not in ('inv', 'permutation'))
+        return res
+
+    def rows(self, rows):
+        """Return the adapter of a slice or an array of rows"""
+        return self._subset(rows)
+
+    def _subset(self, rows):
+        res = FrozenAdapter._frozen(
+            self._codes[rows], self._symbols, self._names)
+
+        # If the rows are reordered, the index of a column without
+        # duplicates finds the same keys, in the new rows
+        positions = np.arange(len(self))[rows]
+        if len(positions) == len(self):
+            inverse = np.full(len(self), -1, dtype=np.intp)
+            inverse[positions] = np.arange(len(positions))
+            if np.all(inverse >= 0):
+                for key, val in self._cache.items():
+                    if isinstance(val, ColumnIndex) and val.n_duplicates == 0:
+                        res._cache[key] = val.renumbered(inverse)
+        return res
+
+
+## Composition cache
+# The results of `+`, as FrozenAdapters, by the pair of operands frozen.
+# Frozen operands are hashed only once, so composing them again is a dict
+# lookup. Mutable operands are hashed once until they are modified, and
+# get a mutable copy of the result, which is still cheaper than composing
+# them. The least recently used results are evicted beyond the maximum
+# size. The cache is shared by all threads, and guarded by a lock.
+_compositions = collections.OrderedDict()
+_composition_maxsize = 256
+_composition_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_composition_lock = threading.Lock()
+
+def composition_cache_info():
+    """Return the hits, misses, evictions, size and maxsize of the cache
+    of `+`, as a dict"""
+    with _composition_lock:
+        res = dict(_composition_stats)
+        res['size'] = len(_compositions)
+        res['maxsize'] = _composition_maxsize
+    return res
+
+def clear_composition_cache():
+    """Empty the cache of `+` and reset its statistics"""
+    with _composition_lock:
+        _compositions.clear()
+        for key in _composition_stats:
+            _composition_stats[key] = 0
+
+def set_composition_cache_size(maxsize):
+    """Set the number of results of `+` that are kept
+
+    maxsize : int, 0 to disable the cache, or None for no limit
+    """
+    global _composition_maxsize
+    with _composition_lock:
+        _composition_maxsize = maxsize
+        _evict_compositions()
+
+def _evict_compositions():
+    # Called with the lock held
+    while (_composition_maxsize is not None and
+            len(_compositions) > _composition_maxsize):
+        _compositions.popitem(last=False)
+        _composition_stats['evictions'] += 1
+
+def _composition_key(adapter):
+    """Return the FrozenAdapter that `adapter` is looked up as
+
+    For a mutable adapter, it is a view of its codes rather than a copy,
+    memoized until the adapter is modified.
+    """
+    if isinstance(adapter, FrozenAdapter):
+        return adapter
+    if 'frozen' not in adapter._cache:
+        adapter._cache['frozen'] = FrozenAdapter._frozen(
+            adapter.codes, adapter.symbols, adapter._names)
+    return adapter._cache['frozen']
+
+def _compose(a1, a2):
+    """Return a1 + a2, frozen if both are frozen"""
+    if _composition_maxsize == 0 or (
+            isinstance(a1, RangeAdapter) or isinstance(a2, RangeAdapter)):
+        # RangeAdapters are applied arithmetically, which is cheaper than
+        # hashing them, and fold together without a table
+        res = Adapter.chain(a1, a2)
+        if isinstance(a1, FrozenAdapter) and isinstance(a2, FrozenAdapter):
+            res = FrozenAdapter._frozen(res.codes, res.symbols, res._names)
+        return res
+
+    key = (_composition_key(a1), _composition_key(a2))
+    with _composition_lock:
+        res = _compositions.get(key)
+        if res is not None:
+            _composition_stats['hits'] += 1
+            _compositions.move_to_end(key)
+    if res is None:
+        res = Adapter.chain(*key)
+        res = FrozenAdapter._frozen(res.codes, res.symbols, res._names)
+        # The keys of mutable operands are views, so store copies
+        key = (a1.freeze() if key[0] is not a1 else a1,
+            a2.freeze() if key[1] is not a2 else a2)
+        with _composition_lock:
+            _composition_stats['misses'] += 1
+            _compositions[key] = res
+            _evict_compositions()
+
+    if isinstance(a1, FrozenAdapter) and isinstance(a2, FrozenAdapter):
+        return res
+    thawed = res.thaw(coded=a1.coded)
+    # So that composing it again is a lookup without hashing
+    thawed._cache['frozen'] = res
+    return thawed
+
+
+## Binary format
+# An adapter is stored as BINARY_MAGIC, the length of a JSON header as a
+# little-endian uint32, the header, padding up to a multiple of
+# BINARY_ALIGN bytes, and then the codes as little-endian int32 in C order.
+# The header has the kind of adapter, the shape of the codes, the symbols
+# of each column, the names and the storage mode. RangeAdapters store only
+# their starts and steps, in the header. Symbols must be str, int or float
+# to be stored in the header.
+BINARY_MAGIC = b'ADAPTER1'
+BINARY_ALIGN = 64
+BINARY_DTYPE = np.dtype('<i4')
+
+_PREFIX_SIZE = len(BINARY_MAGIC) + 4
+
+def _binary_parts(adapter, symbols=True):
+    """Return the (header bytes, codes) of `adapter`
+
+    symbols : if False, the symbols are left out of the header
+    """
+    meta = {'names': adapter.names, 'coded': bool(adapter.coded)}
+    if isinstance(adapter, RangeAdapter):
+        meta['kind'] = 'range'
+        meta['n'] = adapter.n
+        meta['starts'] = adapter.starts.tolist()
+        meta['steps'] = adapter.steps.tolist()
+        codes = np.empty((0, adapter.ncols), dtype=BINARY_DTYPE)
+    else:
+        meta['kind'] = ('frozen' if isinstance(adapter, FrozenAdapter) else
+            'adapter')
+        codes = np.ascontiguousarray(adapter.codes, dtype=BINARY_DTYPE)
+    meta['shape'] = list(codes.shape)
+    if symbols:
+        meta['symbols'] = [_json_symbols(col_symbols, ncol)
+            for ncol, col_symbols in enumerate(adapter.symbols)]
+
+    header = json.dumps(meta).encode('utf-8')
+    size = _PREFIX_SIZE + len(header)
+    padding = -size % BINARY_ALIGN
+    return (BINARY_MAGIC + struct.pack('<I', len(header)) + header +
+        b' ' * padding, codes)
+
+def _json_symbols(col_symbols, ncol):
+    """Return the symbols of column `ncol` as a list for the JSON header"""
+    res = [val.item() if isinstance(val, np.generic) else val
+        for val in col_symbols]
+    for val in res:
+        if type(val) not in (str, int, float, bool):
+            raise TypeError("channel id {!r} in column {} can't be stored "
+                "in the binary format, only str, int and float can. Pickle "
+                "the adapter instead.".format(val, ncol))
+    return res
+
+def _header_length(prefix):
+    """Return the length of the header from the start of a file"""
+    prefix = bytes(prefix)
+    if len(prefix) != _PREFIX_SIZE or not prefix.startswith(BINARY_MAGIC):
+        raise ValueError("not an Adapter binary file")
+    return struct.unpack('<I', prefix[len(BINARY_MAGIC):])[0]
+
+def _parse_header(header):
+    """Return (header, offset of the codes)"""
+    size = _PREFIX_SIZE + len(header)
+    return (json.loads(bytes(header).decode('utf-8')),
+        size + (-size % BINARY_ALIGN))
+
+def _from_binary(meta, codes, symbols=None):
+    """Return the Adapter described by a header and its codes
+
+    symbols : the symbols of each column, if they are not in the header
+    """
+    if symbols is None:
+        symbols = meta['symbols']
+    symbols = [tuple(col_symbols) for col_symbols in symbols]
+    if codes.dtype != np.int32:
+        # Big-endian machines
+        codes = codes.astype(np.int32)
+    if meta['kind'] == 'range':
+        return RangeAdapter(meta['n'], meta['starts'], meta['steps'],
+            names=meta['names'], coded=meta['coded'])
+    elif meta['kind'] == 'frozen':
+        return FrozenAdapter._frozen(codes, symbols, meta['names'])
+    return Adapter._from_codes(
+        codes, symbols, coded=meta['coded'], names=meta['names'])
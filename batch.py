@@ -0,0 +1,129 @@
+"""Reorder many raw recordings in parallel.
+
+The jobs are listed in a manifest, a text file with one job per line:
+    input_path, dataflow_name, output_path
+Blank lines and lines starting with '#' are ignored. The dataflow names
+are the ones accepted by `dataflow.get`, eg h3_ON4 or wire64_big_dataflow.
+
+Each job is `raw.reorder_file` with a checkpoint file next to its output,
+so if the batch is interrupted, running it again resumes each unfinished
+job from its last chunk. Jobs whose output exists without a checkpoint
+are already complete and are skipped.
+
+Usage from the command line:
+    python -m Adapters.batch manifest.txt --workers 8
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import raw
+
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def read_manifest(path):
+    """Return a list of (input_path, dataflow_name, output_path)"""
+    jobs = []
+    with open(path) as fi:
+        for row in csv.reader(fi, skipinitialspace=True):
+            if len(row) == 0 or row[0].strip().startswith('#'):
+                continue
+            if len(row) != 3:
+                raise ValueError(
+                    "manifest line should be input, dataflow, output: "
+                    "{}".format(row))
+            jobs.append(tuple(val.strip() for val in row))
+    return jobs
+
+def is_complete(output_path):
+    """Return True if the job writing `output_path` has finished
+
+    `raw.reorder_file` writes the checkpoint before it creates the output,
+    and deletes it when the output is complete.
+    """
+    return (os.path.exists(output_path) and
+        not os.path.exists(output_path + CHECKPOINT_SUFFIX))
+
+def run_job(job, **kwargs):
+    """Run one (input_path, dataflow_name, output_path) job
+
+    kwargs are passed to `raw.reorder_file`.
+
+    Returns : the throughput report of `raw.reorder_file`, plus the job,
+        or None if the job was already complete
+    """
+    input_path, dataflow_name, output_path = job
+    if is_complete(output_path):
+        return None
+    report = raw.reorder_file(dataflow_name, input_path, output_path,
+        checkpoint_path=output_path + CHECKPOINT_SUFFIX, **kwargs)
+    report['job'] = job
+    return report
+
+def run(jobs, n_workers=None, verbose=True, **kwargs):
+    """Run jobs in a pool of processes
+
+    jobs : list of (input_path, dataflow_name, output_path)
+    n_workers : number of processes
+        If None, the number of cores, but no more than the number of jobs.
+        When the disk rather than the CPU is the bottleneck, use fewer.
+    verbose : print a report after each job and at the end
+    kwargs : passed to `raw.reorder_file`, eg chunk_samples or n_threads
+
+    Returns : list of the report of each job that was run
+    """
+    if n_workers is None:
+        n_workers = min(os.cpu_count() or 1, max(len(jobs), 1))
+
+    reports = []
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(n_workers) as executor:
+        futures = dict(
+            (executor.submit(run_job, job, **kwargs), job) for job in jobs)
+        for future in as_completed(futures):
+            report = future.result()
+            if report is None:
+                if verbose:
+                    print("{}: already complete".format(futures[future][2]))
+                continue
+            reports.append(report)
+            if verbose:
+                print("{}: ".format(report['job'][2]), end='')
+                raw.print_report(report)
+    seconds = time.perf_counter() - t_start
+
+    if verbose:
+        total_bytes = sum(report['bytes_read'] for report in reports)
+        print("{} jobs with {} workers: {:.1f} MB in {:.2f} s, "
+            "{:.1f} MB/s".format(len(reports), n_workers, total_bytes / 1e6,
+            seconds, total_bytes / 1e6 / max(seconds, 1e-9)))
+    return reports
+
+
+## Command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m Adapters.batch', description=__doc__.split('\n')[0])
+    parser.add_argument('manifest')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dtype', default='int16')
+    parser.add_argument('--chunk-samples', type=int,
+        default=raw.CHUNK_SAMPLES)
+    parser.add_argument('--threads', type=int, default=0,
+        help='threads per job, see raw.reorder_file')
+    args = parser.parse_args(argv)
+
+    run(read_manifest(args.manifest), n_workers=args.workers,
+        dtype=args.dtype, chunk_samples=args.chunk_samples,
+        n_threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
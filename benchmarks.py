@@ -0,0 +1,154 @@
+"""Benchmarks of the vectorized code paths against the old Python ones.
+
+Run all of them with
+    python -m Adapters.benchmarks
+"""
+from __future__ import print_function
+from __future__ import division
+import subprocess
+import sys
+import time
+import numpy as np
+
+from .base import Adapter
+
+
+def _time(func, *args, **kwargs):
+    """Return (result, seconds) of calling func once"""
+    start = time.perf_counter()
+    res = func(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def bench_map(n_keys=10000000, n_channels=1024, seed=0):
+    """Compare Adapter.map against a dict lookup per element
+
+    A GUI-to-site adapter with `n_channels` channels is used to translate
+    `n_keys` random GUI numbers, as when translating the channel of each
+    spike from a spike sorter.
+    """
+    rs = np.random.RandomState(seed)
+    gui = np.arange(1, n_channels + 1)
+    site = rs.permutation(n_channels)
+    adapter = Adapter(gui, site)
+    keys = rs.randint(1, n_channels + 1, size=n_keys)
+
+    # This is how a list of keys used to be looked up
+    old, old_time = _time(
+        lambda: np.array([adapter.in2out[kk] for kk in keys], dtype=object))
+    new, new_time = _time(adapter.map, keys)
+    assert np.all(old == new)
+
+    # Also look everything back up again
+    back, back_time = _time(adapter.inv.map, new)
+    assert np.all(back == keys)
+
+    print("map: {} keys, {} channels".format(n_keys, n_channels))
+    print("  dict per element: {:8.3f} s, {:10.1f} Mkeys/s".format(
+        old_time, n_keys / old_time / 1e6))
+    print("  Adapter.map:      {:8.3f} s, {:10.1f} Mkeys/s".format(
+        new_time, n_keys / new_time / 1e6))
+    print("  Adapter.inv.map:  {:8.3f} s, {:10.1f} Mkeys/s".format(
+        back_time, n_keys / back_time / 1e6))
+
+
+def bench_import(n_repeats=5):
+    """Time `import Adapters` in fresh processes, and check that it
+    doesn't import pandas"""
+    code = (
+        "import sys, time; start = time.perf_counter(); import Adapters; "
+        "print(time.perf_counter() - start, 'pandas' in sys.modules)")
+    durations = []
+    for n in range(n_repeats):
+        out = subprocess.check_output([sys.executable, '-c', code]).split()
+        durations.append(float(out[0]))
+        assert out[1] == b'False', "importing Adapters imported pandas"
+
+    print("import Adapters: best of {}: {:8.3f} s, without pandas".format(
+        n_repeats, min(durations)))
+
+
+def bench_reference(n_samples=1000000, dataflow='wire128_big_dataflow',
+    method='median', seed=0):
+    """Compare a Referencer against a Python loop over the groups"""
+    from .reference import Referencer
+
+    referencer = Referencer.from_dataflow(dataflow, method=method)
+    labels = referencer.labels
+    rs = np.random.RandomState(seed)
+    data = (rs.randn(n_samples, len(labels)) * 1000).astype(np.int16)
+    func = np.median if method == 'median' else np.mean
+
+    # This is how groups used to be referenced
+    def loop():
+        res = data.copy()
+        for group in np.unique(labels[labels >= 0]):
+            columns = np.flatnonzero(labels == group)
+            ref = np.rint(func(data[:, columns], axis=1))
+            res[:, columns] = data[:, columns] - ref[:, None]
+        return res
+
+    old, old_time = _time(loop)
+    new, new_time = _time(referencer, data.copy())
+    assert np.abs(old.astype(int) - new).max() <= 1
+
+    print("reference: {} x {} channels of {}, {} of {} groups".format(
+        n_samples, len(labels), dataflow, method, referencer.n_groups))
+    for label, seconds in [('loop over groups', old_time),
+            ('Referencer', new_time)]:
+        print("  {:17s} {:8.3f} s, {:10.1f} MB/s".format(
+            label + ':', seconds, data.nbytes / seconds / 1e6))
+
+
+def bench_pickle(sizes=(64, 1000, 100000), n_repeats=5, seed=0):
+    """Compare pickling Adapters with pickling their object tables
+
+    Each adapter maps `size` channels to a permutation of them, with a
+    'GND' every 32 channels. The object table is what used to be pickled.
+    Adapters are pickled in their binary format (see Adapter.to_bytes),
+    and also saved and memory-mapped with Adapter.save and Adapter.load.
+    """
+    import os
+    import pickle
+    import tempfile
+
+    rs = np.random.RandomState(seed)
+    print("pickle: best round trip of {}".format(n_repeats))
+    for size in sizes:
+        outs = rs.permutation(size).astype(object)
+        outs[::32] = 'GND'
+        for coded in (False, True):
+            adapter = Adapter(np.arange(size), outs, coded=coded)
+
+            def round_trip(obj):
+                data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+                return len(data), pickle.loads(data)
+
+            results = []
+            for label, obj in [('object table', adapter.table),
+                    ('Adapter', adapter)]:
+                seconds = min(_time(round_trip, obj)[1]
+                    for n in range(n_repeats))
+                n_bytes, res = round_trip(obj)
+                results.append((label, n_bytes, seconds))
+            assert res.table.tolist() == adapter.table.tolist()
+
+            path = os.path.join(tempfile.mkdtemp(), 'adapter.bin')
+            adapter.save(path)
+            seconds = min(_time(lambda: Adapter.load(path).codes.sum())[1]
+                for n in range(n_repeats))
+            results.append(('save/load mmap', os.path.getsize(path), seconds))
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+
+            print("  {} rows, coded={}".format(size, coded))
+            for label, n_bytes, seconds in results:
+                print("    {:15s} {:10d} bytes, {:10.3f} ms".format(
+                    label + ':', n_bytes, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    bench_import()
+    bench_map()
+    bench_reference()
+    bench_pickle()
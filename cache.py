@@ -0,0 +1,244 @@
+"""On-disk cache of built dataflows.
+
+Building a dataflow composes several adapters and joins DataFrames, and
+every process used to do this again even though the pin tables almost
+never change. When the cache is enabled, each dataflow is saved the first
+time it is built as an uncompressed npz file of integer code arrays, and
+later processes load that file instead of building it.
+
+The cache is opt-in. Either set the environment variable
+ADAPTERS_CACHE_DIR to a directory, or call `enable`.
+
+Each file is keyed by a hash of the source of the modules that define the
+pin tables and dataflows, so editing any of them makes the old entries
+stale. Stale entries are never loaded and are replaced when the dataflow
+is built again.
+"""
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+import re
+import zipfile
+import numpy as np
+
+from .base import Adapter, encode_column, decode_column
+
+
+CACHE_DIR_ENV = 'ADAPTERS_CACHE_DIR'
+
+# The modules whose contents determine the dataflows
+SOURCE_MODULES = [
+    '__init__', 'base', 'cache', 'channels', 'dataflow', 'dbc',
+    'headstages', 'probe_adapters', 'probes', 'routes',
+    ]
+
+_cache_dir = os.environ.get(CACHE_DIR_ENV) or None
+_source_hash = None
+
+
+def enable(cache_dir=None):
+    """Turn on the cache, in `cache_dir` or ~/.cache/Adapters"""
+    global _cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            os.path.expanduser('~'), '.cache', 'Adapters')
+    _cache_dir = cache_dir
+
+def disable():
+    """Turn off the cache. Nothing is deleted."""
+    global _cache_dir
+    _cache_dir = None
+
+def get_cache_dir():
+    """Return the cache directory, or None if the cache is disabled"""
+    return _cache_dir
+
+def source_hash():
+    """Return the hash of the source of the modules in SOURCE_MODULES"""
+    global _source_hash
+    if _source_hash is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        sha = hashlib.sha1()
+        for module in SOURCE_MODULES:
+            with open(os.path.join(package_dir, module + '.py'), 'rb') as fi:
+                sha.update(fi.read())
+        _source_hash = sha.hexdigest()[:16]
+    return _source_hash
+
+# Pattern of the filenames of entries
+ENTRY_PATTERN = re.compile(r'^(\w+)-([0-9a-f]{16})\.npz$')
+
+def entry_path(name):
+    """Return the path of the cache entry for dataflow `name`"""
+    return os.path.join(
+        _cache_dir, '{}-{}.npz'.format(name, source_hash()))
+
+
+## Conversion to and from dicts of arrays
+def _jsonable(values):
+    """Convert numpy scalars, which json can't handle, to Python ones"""
+    return [val.item() if isinstance(val, np.generic) else val
+        for val in values]
+
+def _dumps(obj):
+    return np.array(json.dumps(obj))
+
+def _loads(arr):
+    return json.loads(arr.item())
+
+def adapter_to_arrays(adapter, prefix=''):
+    """Return a dict of arrays that represents `adapter`"""
+    return {
+        prefix + 'codes': adapter.codes,
+        prefix + 'symbols': _dumps(
+            [_jsonable(col_symbols) for col_symbols in adapter.symbols]),
+        prefix + 'names': _dumps(_jsonable(adapter.names)),
+        prefix + 'coded': np.array(adapter.coded),
+        }
+
+def adapter_from_arrays(arrays, prefix=''):
+    """Inverse of adapter_to_arrays"""
+    symbols = [tuple(col_symbols)
+        for col_symbols in _loads(arrays[prefix + 'symbols'])]
+    return Adapter._from_codes(
+        np.asarray(arrays[prefix + 'codes']),
+        symbols,
+        coded=bool(arrays[prefix + 'coded']),
+        names=_loads(arrays[prefix + 'names']),
+        )
+
+def frame_to_arrays(df, prefix=''):
+    """Return a dict of arrays that represents the DataFrame `df`
+
+    Numeric columns are stored as they are. Object columns (eg 'ename')
+    are stored as codes and symbols, like an Adapter.
+    """
+    res = {}
+    for ncol in range(df.shape[1]):
+        values = df.iloc[:, ncol].values
+        key = '{}col{}'.format(prefix, ncol)
+        if values.dtype.kind in 'biuf':
+            res[key] = values
+        else:
+            codes, symbols = encode_column(values)
+            res[key] = codes
+            res[key + '_symbols'] = _dumps(_jsonable(symbols))
+    res[prefix + 'columns'] = _dumps(_jsonable(df.columns))
+
+    # Keep RangeIndex as a RangeIndex
+    index = df.index
+    if hasattr(index, 'start') and hasattr(index, 'step'):
+        res[prefix + 'range_index'] = np.array(
+            [index.start, index.stop, index.step])
+    else:
+        res[prefix + 'index'] = index.values
+    return res
+
+def frame_from_arrays(arrays, prefix='', copy=True):
+    """Inverse of frame_to_arrays
+
+    copy : if False, numeric columns are views of `arrays`
+    """
+    import pandas
+
+    columns = _loads(arrays[prefix + 'columns'])
+    data = {}
+    for ncol in range(len(columns)):
+        key = '{}col{}'.format(prefix, ncol)
+        values = np.asarray(arrays[key])
+        if key + '_symbols' in arrays:
+            values = decode_column(
+                values, tuple(_loads(arrays[key + '_symbols'])))
+        data[ncol] = values
+
+    if prefix + 'range_index' in arrays:
+        index = pandas.RangeIndex(*arrays[prefix + 'range_index'].tolist())
+    else:
+        index = pandas.Index(np.asarray(arrays[prefix + 'index']))
+
+    res = pandas.DataFrame(data, index=index, copy=copy)
+    res.columns = columns
+    return res
+
+def to_arrays(obj):
+    """Return a dict of arrays representing an Adapter or DataFrame"""
+    if isinstance(obj, Adapter):
+        res = adapter_to_arrays(obj)
+        res['kind'] = np.array('adapter')
+    else:
+        res = frame_to_arrays(obj)
+        res['kind'] = np.array('frame')
+    return res
+
+def from_arrays(arrays):
+    """Inverse of to_arrays"""
+    if arrays['kind'].item() == 'adapter':
+        return adapter_from_arrays(arrays)
+    return frame_from_arrays(arrays)
+
+
+## Reading and writing entries
+def load(name):
+    """Return dataflow `name` from the cache, or None if it's not there"""
+    if _cache_dir is None:
+        return None
+    path = entry_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as npz:
+            return from_arrays(npz)
+    except (IOError, OSError, KeyError, ValueError, EOFError,
+            zipfile.BadZipFile) as exc:
+        # Truncated or corrupt. Delete it, and it will be rebuilt.
+        print("warning: deleting unreadable cache entry {}: {}".format(
+            path, exc))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def store(name, obj):
+    """Save dataflow `name` into the cache, replacing any stale entries
+
+    Failing to write, eg to a read-only or full disk, only prints a
+    warning, since the dataflow was built anyway.
+    """
+    if _cache_dir is None:
+        return
+
+    # Write to a temporary file first, so that other processes never see
+    # a partial entry
+    path = entry_path(name)
+    tmp_path = '{}.{}.tmp.npz'.format(path[:-4], os.getpid())
+    try:
+        if not os.path.exists(_cache_dir):
+            os.makedirs(_cache_dir)
+        np.savez(tmp_path, **to_arrays(obj))
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as exc:
+        print("warning: could not write cache entry {}: {}".format(
+            path, exc))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+
+    # Remove stale entries for this name
+    for filename in os.listdir(_cache_dir):
+        match = ENTRY_PATTERN.match(filename)
+        if match and match.group(1) == name and (
+                match.group(2) != source_hash()):
+            try:
+                os.remove(os.path.join(_cache_dir, filename))
+            except OSError:
+                pass
+
+def clear():
+    """Delete every entry in the cache directory"""
+    if _cache_dir is None or not os.path.exists(_cache_dir):
+        return
+    for filename in os.listdir(_cache_dir):
+        if ENTRY_PATTERN.match(filename):
+            os.remove(os.path.join(_cache_dir, filename))
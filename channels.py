@@ -1,9 +1,11 @@
 """Lists of channels in the order they are on the probes.
 
 Seems like this file should be the one called probes.py
+
+This module doesn't import pandas until janelia_depth_df or h3_depth_df
+is accessed.
 """
 
-import pandas
 import numpy as np
 
 
@@ -46,12 +48,33 @@ janelia_bottom_sort_by_depth = [ch for ch in janelia_sort_by_depth
 
 ## Calculating the exact depth of each channel
 # Calculate the actual depth of the janelia channels (will use this later)
-janelia_depth_df = pandas.DataFrame.from_dict(
-    {'J': janelia_sort_by_depth})
-janelia_depth_df['Z'] = np.arange(0, 64 * 20, 20, dtype=int)
+# The DataFrames are made on first access by the module __getattr__
+# below, so that importing this module doesn't import pandas.
+def _janelia_depth_df():
+    import pandas
+    janelia_depth_df = pandas.DataFrame.from_dict(
+        {'J': janelia_sort_by_depth})
+    janelia_depth_df['Z'] = np.arange(0, 64 * 20, 20, dtype=int)
+    return janelia_depth_df
+
+def _h3_depth_df():
+    import pandas
+    h3_depth_df = pandas.DataFrame.from_dict(
+        {'Prb': h3_sort_by_depth})
+        
+    h3_depth_df['Z'] = np.arange(0, 64 * 20, 20, dtype=int)
+    return h3_depth_df
 
-h3_depth_df = pandas.DataFrame.from_dict(
-    {'Prb': h3_sort_by_depth})
-    
-h3_depth_df['Z'] = np.arange(0, 64 * 20, 20, dtype=int)
+_depth_dfs = {
+    'janelia_depth_df': _janelia_depth_df,
+    'h3_depth_df': _h3_depth_df,
+}
 
+def __getattr__(name):
+    if name in _depth_dfs:
+        # Cache as a regular module attribute
+        res = _depth_dfs[name]()
+        globals()[name] = res
+        return res
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
@@ -1,40 +1,17 @@
-"""Complete flow of data, from probe to adapter to headstage."""
+"""Complete flow of data, from probe to adapter to headstage.
+
+pandas is only imported when a DataFrame dataflow is built.
+"""
 from __future__ import absolute_import
 
 from builtins import range
-import pandas
+import functools
+import re
 import numpy as np
 
-from .probe_adapters import \
-    samtecflipped2omnetics, \
-    plexon64ch_samtec2plexonnumbers, \
-    plexon64ch_omnetics2plexonnumbers, \
-    ON2_samtec2omnetics, \
-    ON4_samtec2omnetics, \
-    A64OM32x2sm_samtec2omnetics, \
-    wire64_eib_numbers2names, \
-    wire64_slimstack2headstage, \
-    wire64_eib_names2headstage,\
-    wire128_eib_numbers2names, \
-    wire128_slimstack2headstage, \
-    wire128_eib_names2headstage, \
-    nza_SSB6_64,  \
-    nza_SSB6_128, \
-    nanoz_mux2samtec, \
-    nanoz_mux2samtec128
-
-from .probes import \
-    samtec2nn, \
-    samtec2janelia_top, \
-    samtec2janelia_bottom, \
-    samtec2janelia_64ch
-    
-from .headstages import \
-    intan2gui, \
-    omnetics2intan, \
-    omnetics2intan_64ch, \
-    intan2gui_64ch, \
-    omnetics2rhd2164
+from .base import Adapter
+from . import cache
+from .probe_adapters import nanoz_mux2samtec128, wire_adapters
 
 from .channels import \
     poly2_NN_sort_by_depth, \
@@ -42,9 +19,101 @@ from .channels import \
     janelia_top_sort_by_depth, \
     janelia_bottom_sort_by_depth, \
     janelia_sort_by_depth, \
-    janelia_depth_df, \
-    h3_sort_by_depth, \
-    h3_depth_df
+    h3_sort_by_depth
+from . import channels
+from . import dbc
+from . import headstages
+from . import probe_adapters
+from . import probes
+from . import routes
+
+## Registry of dataflows
+# Each dataflow is built by the function registered for its name the first
+# time that it is requested, and then cached. Nothing is built on import.
+# The module-level names (eg `dataflow_h3_ON4_df`) still work, they are
+# looked up in the registry by the module __getattr__ at the bottom.
+_builders = {}
+_built = {}
+
+# Names of wire dataflows with any number of channels
+WIRE_PATTERN = re.compile(r'^wire(\d+)_big_dataflow$')
+
+def _dataflow(name):
+    """Decorator that registers a function as the builder of `name`"""
+    def register(func):
+        _builders[name] = func
+        return func
+    return register
+
+def names():
+    """Return the names of all dataflows that can be built"""
+    return sorted(_builders)
+
+def get(name):
+    """Return the dataflow called `name`, building it on first access.
+    
+    name : the module-level name, eg 'dataflow_h3_ON4_df' or 
+        'wire64_big_dataflow', or the short name of a DataFrame, eg 
+        'h3_ON4' for 'dataflow_h3_ON4_df'. Wire EIBs with any multiple of
+        64 channels can be requested, eg 'wire256_big_dataflow'
+    
+    The result is cached, so the same object is returned every time.
+    If the on-disk cache is enabled (see the `cache` module), it is also
+    cached on disk for other processes.
+    """
+    if name not in _builders:
+        match = WIRE_PATTERN.match(name)
+        n_channels = int(match.group(1)) if match is not None else 0
+        if n_channels > 0 and n_channels % 64 == 0:
+            # Any number of wire EIB boards
+            _builders[name] = functools.partial(
+                wire_big_dataflow, n_channels)
+        else:
+            df_name = 'dataflow_{}_df'.format(name)
+            if df_name not in _builders:
+                raise KeyError("unknown dataflow: {!r}".format(name))
+            name = df_name
+    
+    if name not in _built:
+        # Use the on-disk cache if it is enabled
+        res = cache.load(name)
+        if res is None:
+            res = _builders[name]()
+            cache.store(name, res)
+        _built[name] = res
+    return _built[name]
+
+# Names that used to be imported here, by the module they are in
+_MOVED_NAMES = {
+    probe_adapters: [
+        'samtecflipped2omnetics', 'plexon64ch_samtec2plexonnumbers',
+        'plexon64ch_omnetics2plexonnumbers', 'ON2_samtec2omnetics',
+        'ON4_samtec2omnetics', 'A64OM32x2sm_samtec2omnetics',
+        'wire64_eib_numbers2names', 'wire64_slimstack2headstage',
+        'wire64_eib_names2headstage', 'wire128_eib_numbers2names',
+        'wire128_slimstack2headstage', 'wire128_eib_names2headstage',
+        'nza_SSB6_64', 'nza_SSB6_128', 'nanoz_mux2samtec'],
+    probes: ['samtec2nn', 'samtec2janelia_top', 'samtec2janelia_bottom',
+        'samtec2janelia_64ch'],
+    headstages: ['intan2gui', 'omnetics2intan', 'omnetics2intan_64ch',
+        'intan2gui_64ch', 'omnetics2rhd2164'],
+    channels: ['janelia_depth_df', 'h3_depth_df'],
+    }
+
+def __getattr__(name):
+    # Only called for names that are not already module attributes
+    if name in _builders:
+        return get(name)
+    for module, names in _MOVED_NAMES.items():
+        if name in names:
+            return getattr(module, name)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_builders) | set(
+        name for names in _MOVED_NAMES.values() for name in names))
+
 
 ## Construct the entire dataflow
 
@@ -69,201 +138,263 @@ Checks:
   from Tim
   Adapters.dataflow.wire64_big_dataflow.set_index('hs')['ename'].sort_index()
 """
-wire64_big_dataflow = pandas.DataFrame((
-    wire64_eib_numbers2names + # enum to ename
-    wire64_eib_names2headstage +  # ename to hs
-    nza_SSB6_64.inv + # hs to mux
-    nanoz_mux2samtec # mux to samtec
-    ).table, 
-    columns=['enum', 'ename', 'hs', 'mux', 'samtec'])
-
-wire64_big_dataflow = wire64_big_dataflow.join(
-    pandas.DataFrame(wire64_slimstack2headstage.table, 
-    columns=['slimstack', 'hs']).set_index('hs'), on='hs')
+# Built wire dataflows, by number of channels
+_wire_dataflows = {}
+
+def wire_big_dataflow(n_channels, mux2samtec=None):
+    """Return the big dataflow of a wire EIB with `n_channels` channels
+    
+    n_channels : a multiple of 64, one board per 64 channels. See
+        probe_adapters.wire_adapters
+    mux2samtec : the adapter from nanoZ MUX to Samtec. By default
+        the one from wire_adapters.
+    
+    Returns : DataFrame with one row per EIB hole and the columns 'enum',
+        'ename', 'hs', 'mux', 'samtec', 'slimstack', and the positions
+        'ycoord', 'xcoord' and 'kcoord' (the tetrode). The positions don't
+        correspond to the actual geometry, they just keep the channels on
+        a tetrode close together.
+    
+    The result is cached, except with a custom `mux2samtec`.
+    These are also available by name, eg `get('wire256_big_dataflow')`.
+    """
+    import pandas
+    
+    if mux2samtec is None and n_channels in _wire_dataflows:
+        return _wire_dataflows[n_channels]
+    adapters = wire_adapters(n_channels)
+    if mux2samtec is None:
+        mux2samtec = adapters['nanoz_mux2samtec']
+    
+    res = pandas.DataFrame(Adapter.chain(
+        adapters['eib_numbers2names'], # enum to ename
+        adapters['eib_names2headstage'],  # ename to hs
+        adapters['nza_SSB6'].inv, # hs to mux
+        mux2samtec, # mux to samtec
+        ).table, 
+        columns=['enum', 'ename', 'hs', 'mux', 'samtec'])
+
+    res = res.join(
+        pandas.DataFrame(adapters['slimstack2headstage'].table, 
+        columns=['slimstack', 'hs']).set_index('hs'), on='hs')
+    
+    # Each tetrode is a diamond: A below, B left, C above, D right
+    enum = res['enum'].values.astype(int)
+    tetrode, row = np.divmod(enum, 4)
+    res['ycoord'] = tetrode * 100 + np.array([-10, 0, 10, 0])[row]
+    res['xcoord'] = np.array([0, -10, 0, 10])[row]
+    
+    # Identify cluster groups for each tetrode
+    res['kcoord'] = 1 + tetrode
     
-# add x, y, and k
-# Generate position of each channel with each tetrode as small group
-# This doesn't correspond to actual geometry but just keeps the channels
-# on a tetrode close together
-wire64_big_dataflow['ycoord'] = (
-    wire64_big_dataflow['enum'].astype(int) // 4) * 100
-wire64_big_dataflow.loc[
-    np.mod(wire64_big_dataflow['enum'], 4) == 0, 'ycoord'] -= 10
-wire64_big_dataflow.loc[
-    np.mod(wire64_big_dataflow['enum'], 4) == 2, 'ycoord'] += 10
-
-wire64_big_dataflow['xcoord'] = 0
-wire64_big_dataflow.loc[
-    np.mod(wire64_big_dataflow['enum'], 4) == 1, 'xcoord'] -= 10
-wire64_big_dataflow.loc[
-    np.mod(wire64_big_dataflow['enum'], 4) == 3, 'xcoord'] += 10
-
-# Identify cluster groups for each tetrode
-wire64_big_dataflow['kcoord'] = 1 + (
-    wire64_big_dataflow['enum'].astype(int) // 4)
+    if mux2samtec is adapters['nanoz_mux2samtec']:
+        _wire_dataflows[n_channels] = res
+    return res
+
+@_dataflow('wire64_big_dataflow')
+def _build_wire64_big_dataflow():
+    return wire_big_dataflow(64)
 
 
 ## for wire128
-wire128_big_dataflow = pandas.DataFrame((
-    wire128_eib_numbers2names + # enum to ename
-    wire128_eib_names2headstage +  # ename to hs
-    nza_SSB6_128.inv + # hs to mux
-    nanoz_mux2samtec128 # mux to samtec
-    ).table, 
-    columns=['enum', 'ename', 'hs', 'mux', 'samtec'])
-
-wire128_big_dataflow = wire128_big_dataflow.join(
-    pandas.DataFrame(wire128_slimstack2headstage.table, 
-    columns=['slimstack', 'hs']).set_index('hs'), on='hs')
-
-# add x, y, and k
-# Generate position of each channel with each tetrode as small group
-# This doesn't correspond to actual geometry but just keeps the channels
-# on a tetrode close together
-wire128_big_dataflow['ycoord'] = (
-    wire128_big_dataflow['enum'].astype(int) // 4) * 100
-wire128_big_dataflow.loc[
-    np.mod(wire128_big_dataflow['enum'], 4) == 0, 'ycoord'] -= 10
-wire128_big_dataflow.loc[
-    np.mod(wire128_big_dataflow['enum'], 4) == 2, 'ycoord'] += 10
-
-wire128_big_dataflow['xcoord'] = 0
-wire128_big_dataflow.loc[
-    np.mod(wire128_big_dataflow['enum'], 4) == 1, 'xcoord'] -= 10
-wire128_big_dataflow.loc[
-    np.mod(wire128_big_dataflow['enum'], 4) == 3, 'xcoord'] += 10
-
-# Identify cluster groups for each tetrode
-wire128_big_dataflow['kcoord'] = 1 + (
-    wire128_big_dataflow['enum'].astype(int) // 4)
+@_dataflow('wire128_big_dataflow')
+def _build_wire128_big_dataflow():
+    # This has always used the 64 channel nanoZ mapping, so the Samtec
+    # pins of the second board are None
+    return wire_big_dataflow(128, mux2samtec=nanoz_mux2samtec128)
 
 
 ## Neuronexus probes
-dataflow_poly2 = (
-    samtec2nn.inv + samtecflipped2omnetics + omnetics2intan + intan2gui).sort_by(
-    poly2_NN_sort_by_depth)
-dataflow_edge = (
-    samtec2nn.inv + samtecflipped2omnetics + omnetics2intan + intan2gui).sort_by(
-    edge_NN_sort_by_depth)
+@_dataflow('dataflow_poly2')
+def _build_dataflow_poly2():
+    dataflow_poly2 = routes.route('nn', 'gui', via='ON1').thaw().sort_by(
+        poly2_NN_sort_by_depth)
+    dataflow_poly2.names = ['NN', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_poly2
+
+@_dataflow('dataflow_edge')
+def _build_dataflow_edge():
+    dataflow_edge = routes.route('nn', 'gui', via='ON1').thaw().sort_by(
+        edge_NN_sort_by_depth)
+    dataflow_edge.names = ['NN', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_edge
 
 # Janelia top and bottom
-dataflow_janelia_top = (
-    samtec2janelia_top.inv + 
-    samtecflipped2omnetics + 
-    omnetics2intan + 
-    intan2gui
-    ).sort_by(janelia_top_sort_by_depth)
-dataflow_janelia_bottom = (
-    samtec2janelia_bottom.inv + 
-    samtecflipped2omnetics + 
-    omnetics2intan + 
-    intan2gui
-    ).sort_by(janelia_bottom_sort_by_depth)
+@_dataflow('dataflow_janelia_top')
+def _build_dataflow_janelia_top():
+    dataflow_janelia_top = routes.route(
+        'janelia', 'gui', via=['janelia_top', 'ON1'],
+        ).thaw().sort_by(janelia_top_sort_by_depth)
+    dataflow_janelia_top.names = ['J', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_janelia_top
+
+@_dataflow('dataflow_janelia_bottom')
+def _build_dataflow_janelia_bottom():
+    dataflow_janelia_bottom = routes.route(
+        'janelia', 'gui', via=['janelia_bottom', 'ON1'],
+        ).thaw().sort_by(janelia_bottom_sort_by_depth)
+    dataflow_janelia_bottom.names = ['J', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_janelia_bottom
 
 # Janelia Plexon adapter
-dataflow_janelia_64ch_plexon = (
-    samtec2janelia_64ch.inv + 
-    plexon64ch_samtec2plexonnumbers + 
-    plexon64ch_omnetics2plexonnumbers.inv +
-    omnetics2intan_64ch + 
-    intan2gui_64ch
-    ).sort_by(janelia_sort_by_depth)
+@_dataflow('dataflow_janelia_64ch_plexon')
+def _build_dataflow_janelia_64ch_plexon():
+    dataflow_janelia_64ch_plexon = routes.route(
+        'janelia', 'gui', via='plexon').thaw().sort_by(janelia_sort_by_depth)
+    dataflow_janelia_64ch_plexon.names = [
+        'J', 'Sam', 'Plx', 'Om', 'Int', 'GUI']
+    return dataflow_janelia_64ch_plexon
 
 # Janelia ON2 and ON4
-dataflow_janelia_64ch_ON2 = (
-    samtec2janelia_64ch.inv + 
-    ON2_samtec2omnetics + 
-    omnetics2intan_64ch + 
-    intan2gui_64ch
-    ).sort_by(janelia_sort_by_depth)
-
-dataflow_janelia_64ch_ON4 = (
-    samtec2janelia_64ch.inv + 
-    ON4_samtec2omnetics + 
-    omnetics2intan_64ch + 
-    intan2gui_64ch
-    ).sort_by(janelia_sort_by_depth)
+@_dataflow('dataflow_janelia_64ch_ON2')
+def _build_dataflow_janelia_64ch_ON2():
+    dataflow_janelia_64ch_ON2 = routes.route(
+        'janelia', 'gui', via='ON2').thaw().sort_by(janelia_sort_by_depth)
+    dataflow_janelia_64ch_ON2.names = ['J', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_janelia_64ch_ON2
+
+@_dataflow('dataflow_janelia_64ch_ON4')
+def _build_dataflow_janelia_64ch_ON4():
+    dataflow_janelia_64ch_ON4 = routes.route(
+        'janelia', 'gui', via='ON4').thaw().sort_by(janelia_sort_by_depth)
+    dataflow_janelia_64ch_ON4.names = ['J', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_janelia_64ch_ON4
 
 # Helen's A64OM32x2sm and rhd2164 dataflow
-dataflow_helen_64ch = (
-    samtec2janelia_64ch.inv + # Defines ordering within the Samtec
-    A64OM32x2sm_samtec2omnetics + # Samtec to Omnetics
-    omnetics2rhd2164 + # Omnetics to Intan headstage
-    intan2gui_64ch # Intan to GUI numbers
-    ).sort_by(h3_sort_by_depth) # Sorts by H3 depth and excludes NC
-
-# Dataframe it
-dataflow_poly2_df = pandas.DataFrame(dataflow_poly2.table,
-    columns=['NN', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_edge_df = pandas.DataFrame(dataflow_edge.table,
-    columns=['NN', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_janelia_top_df = pandas.DataFrame(dataflow_janelia_top.table,
-    columns=['J', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_janelia_bottom_df = pandas.DataFrame(dataflow_janelia_bottom.table,
-    columns=['J', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_janelia_64ch_plexon_df = pandas.DataFrame(dataflow_janelia_64ch_plexon.table,
-    columns=['J', 'Sam', 'Plx', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_janelia_64ch_ON2_df = pandas.DataFrame(dataflow_janelia_64ch_ON2.table,
-    columns=['J', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-dataflow_janelia_64ch_ON4_df = pandas.DataFrame(dataflow_janelia_64ch_ON4.table,
-    columns=['J', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
+@_dataflow('dataflow_helen_64ch')
+def _build_dataflow_helen_64ch():
+    # Through the A64-OM32x2-sm adapter and the RHD2164 headstage, sorted
+    # by H3 depth, which excludes NC
+    dataflow_helen_64ch = routes.route(
+        'janelia', 'gui', via=['A64OM32x2sm', 'rhd2164'],
+        ).thaw().sort_by(h3_sort_by_depth)
+    dataflow_helen_64ch.names = ['Prb', 'Sam', 'Om', 'Int', 'GUI']
+    return dataflow_helen_64ch
+
+
+## Dataframe it
+# Neuronexus probes: join a depth column
+@_dataflow('dataflow_poly2_df')
+def _build_dataflow_poly2_df():
+    import pandas
+    dataflow_poly2 = get('dataflow_poly2')
+    dataflow_poly2_df = pandas.DataFrame(dataflow_poly2.table,
+        columns=dataflow_poly2.names, dtype=int)
+    dataflow_poly2_df['Z'] = list(range(0, 32 * 25, 25))
+    return dataflow_poly2_df
+
+@_dataflow('dataflow_edge_df')
+def _build_dataflow_edge_df():
+    import pandas
+    dataflow_edge = get('dataflow_edge')
+    dataflow_edge_df = pandas.DataFrame(dataflow_edge.table,
+        columns=dataflow_edge.names, dtype=int)
+    dataflow_edge_df['Z'] = list(range(0, 32 * 20, 20))
+    return dataflow_edge_df
+
+# Janelia: join a depth column, which also inserts channel numbers
+def _janelia_df(dataflow):
+    import pandas
+    return pandas.DataFrame(dataflow.table, 
+        columns=dataflow.names, dtype=int).join(
+        channels.janelia_depth_df.set_index('J'), on='J')
+
+@_dataflow('dataflow_janelia_top_df')
+def _build_dataflow_janelia_top_df():
+    return _janelia_df(get('dataflow_janelia_top'))
+
+@_dataflow('dataflow_janelia_bottom_df')
+def _build_dataflow_janelia_bottom_df():
+    return _janelia_df(get('dataflow_janelia_bottom'))
+
+@_dataflow('dataflow_janelia_64ch_plexon_df')
+def _build_dataflow_janelia_64ch_plexon_df():
+    return _janelia_df(get('dataflow_janelia_64ch_plexon'))
+
+# For ON2 and ON4, also join a Sorted column, which is 1+index after we've 
+# sorted by depth
+@_dataflow('dataflow_janelia_64ch_ON2_df')
+def _build_dataflow_janelia_64ch_ON2_df():
+    dataflow_janelia_64ch_ON2_df = _janelia_df(
+        get('dataflow_janelia_64ch_ON2'))
+    
+    # This isn't necessary for the Janelia ones because they were sorted 
+    # above
+    assert np.all(
+        np.sort(dataflow_janelia_64ch_ON2_df['Z'].values) == 
+        dataflow_janelia_64ch_ON2_df['Z'].values)
+    
+    dataflow_janelia_64ch_ON2_df.insert(
+        dataflow_janelia_64ch_ON2_df.shape[1],
+        'Srt',
+        dataflow_janelia_64ch_ON2_df.index.values + 1)
+    return dataflow_janelia_64ch_ON2_df
+
+@_dataflow('dataflow_janelia_64ch_ON4_df')
+def _build_dataflow_janelia_64ch_ON4_df():
+    dataflow_janelia_64ch_ON4_df = _janelia_df(
+        get('dataflow_janelia_64ch_ON4'))
+    
+    # This isn't necessary for the Janelia ones because they were sorted 
+    # above
+    assert np.all(
+        np.sort(dataflow_janelia_64ch_ON4_df['Z'].values) == 
+        dataflow_janelia_64ch_ON4_df['Z'].values)
+    
+    dataflow_janelia_64ch_ON4_df.insert(
+        dataflow_janelia_64ch_ON4_df.shape[1],
+        'Srt',
+        dataflow_janelia_64ch_ON4_df.index.values + 1)
+    return dataflow_janelia_64ch_ON4_df
 
 # The dataflow for H3 is actually the same as for the others, except for
 # the channel ordering (imposed below)
-dataflow_h3_ON4_df = pandas.DataFrame(dataflow_janelia_64ch_ON4.table.copy(),
-    columns=['Prb', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
+@_dataflow('dataflow_h3_ON4_df')
+def _build_dataflow_h3_ON4_df():
+    import pandas
+    dataflow_h3_ON4_df = pandas.DataFrame(
+        get('dataflow_janelia_64ch_ON4').table.copy(),
+        columns=['Prb', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
+    dataflow_h3_ON4_df = dataflow_h3_ON4_df.join(
+        channels.h3_depth_df.set_index('Prb'), on='Prb')
+
+    # Sort by depth
+    dataflow_h3_ON4_df = dataflow_h3_ON4_df.sort_values('Z')
+    dataflow_h3_ON4_df.index = np.arange(len(dataflow_h3_ON4_df), dtype=int)
+    
+    dataflow_h3_ON4_df.insert(dataflow_h3_ON4_df.shape[1],
+        'Srt',
+        dataflow_h3_ON4_df.index.values + 1)
+    return dataflow_h3_ON4_df
 
 # Construct the Helen dataflow
-dataflow_helen_64ch_df = pandas.DataFrame(dataflow_helen_64ch.table,
-    columns=['Prb', 'Sam', 'Om', 'Int', 'GUI'], dtype=int)
-
-# Join a depth column
-# For Janelia and H3, this also inserts channel numbers
-dataflow_poly2_df['Z'] = list(range(0, 32 * 25, 25))
-dataflow_edge_df['Z'] = list(range(0, 32 * 20, 20))
-dataflow_janelia_top_df = dataflow_janelia_top_df.join(
-    janelia_depth_df.set_index('J'), on='J')
-dataflow_janelia_bottom_df = dataflow_janelia_bottom_df.join(
-    janelia_depth_df.set_index('J'), on='J') 
-dataflow_janelia_64ch_plexon_df = dataflow_janelia_64ch_plexon_df.join(
-    janelia_depth_df.set_index('J'), on='J')
-dataflow_janelia_64ch_ON2_df = dataflow_janelia_64ch_ON2_df.join(
-    janelia_depth_df.set_index('J'), on='J')
-dataflow_janelia_64ch_ON4_df = dataflow_janelia_64ch_ON4_df.join(
-    janelia_depth_df.set_index('J'), on='J')
-dataflow_h3_ON4_df = dataflow_h3_ON4_df.join(
-    h3_depth_df.set_index('Prb'), on='Prb')
-
-# Join depth column on Helen
-dataflow_helen_64ch_df = dataflow_helen_64ch_df.join(
-    h3_depth_df.set_index('Prb'), on='Prb')
+@_dataflow('dataflow_helen_64ch_df')
+def _build_dataflow_helen_64ch_df():
+    import pandas
+    dataflow_helen_64ch = get('dataflow_helen_64ch')
+    dataflow_helen_64ch_df = pandas.DataFrame(dataflow_helen_64ch.table,
+        columns=dataflow_helen_64ch.names, dtype=int)
+
+    # Join depth column on Helen
+    dataflow_helen_64ch_df = dataflow_helen_64ch_df.join(
+        channels.h3_depth_df.set_index('Prb'), on='Prb')
+
+    assert np.all(
+        np.sort(dataflow_helen_64ch_df['Z'].values) == 
+        dataflow_helen_64ch_df['Z'].values)
     
+    dataflow_helen_64ch_df.insert(dataflow_helen_64ch_df.shape[1],
+        'Srt',
+        dataflow_helen_64ch_df.index.values + 1)
+    return dataflow_helen_64ch_df
+
+
+## Diagnostic Biochips probes
+# These are defined in dbc, registered here so they can be used by name
+@_dataflow('h3_64ch_assy_325')
+def _build_h3_64ch_assy_325():
+    return dbc.h3_64ch_assy_325()
 
-## Sort by depth
-dataflow_h3_ON4_df = dataflow_h3_ON4_df.sort_values('Z')
-dataflow_h3_ON4_df.index = np.arange(len(dataflow_h3_ON4_df), dtype=int)
-
-# This isn't necessary for the Janelia ones because they were sorted above
-assert np.all(
-    np.sort(dataflow_janelia_64ch_ON2_df['Z'].values) == 
-    dataflow_janelia_64ch_ON4_df['Z'].values)
-assert np.all(
-    np.sort(dataflow_janelia_64ch_ON2_df['Z'].values) == 
-    dataflow_janelia_64ch_ON4_df['Z'].values)
-assert np.all(
-    np.sort(dataflow_helen_64ch_df['Z'].values) == 
-    dataflow_helen_64ch_df['Z'].values)
-
-# Join a Sorted column, which is 1+index after we've sorted by depth
-dataflow_janelia_64ch_ON2_df.insert(dataflow_janelia_64ch_ON2_df.shape[1],
-    'Srt',
-    dataflow_janelia_64ch_ON2_df.index.values + 1)
-dataflow_janelia_64ch_ON4_df.insert(dataflow_janelia_64ch_ON4_df.shape[1],
-    'Srt',
-    dataflow_janelia_64ch_ON4_df.index.values + 1)
-dataflow_h3_ON4_df.insert(dataflow_h3_ON4_df.shape[1],
-    'Srt',
-    dataflow_h3_ON4_df.index.values + 1)
-dataflow_helen_64ch_df.insert(dataflow_helen_64ch_df.shape[1],
-    'Srt',
-    dataflow_helen_64ch_df.index.values + 1)
+@_dataflow('h12_128ch_assy_350')
+def _build_h12_128ch_assy_350():
+    return dbc.h12_128ch_assy_350()
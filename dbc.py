@@ -6,9 +6,92 @@ probe type.
 And each individual probe should be a function, so if there's an error
 somewhere it doesn't break the whole module. 
 """
-
+import string
 import numpy as np
-import pandas
+
+
+## Probe factory
+# DataFrame of each probe, by parameter set
+_probes = {}
+
+def make_probe(sort_by_depth, n_shanks=None, site_pitch=20,
+    shank_spacing=None, channels_per_shank=None, shank_names=None):
+    """Return the dataflow of a probe with one or more identical shanks
+    
+    sort_by_depth : the Intan numbers of the sites of each shank, from
+        superficial to deep. Either one array, for the first shank, or
+        a list of arrays, one per shank.
+        With a single array, each shank after the first is wired like the
+        first one, `channels_per_shank` channels later.
+    n_shanks : number of shanks
+        Only needed with a single array. Defaults to 1.
+    site_pitch : distance between the sites on a shank, in Z
+    shank_spacing : distance between shanks. If not None, an 'X' column
+        is added with the position of each shank.
+    channels_per_shank : by default the number of sites per shank
+    shank_names : name of each shank, by default 'A', 'B', etc
+    
+    Returns : DataFrame with one row per site, in the standard ordering
+        (shank A and then shank B etc, each from superficial to deep) and
+        columns 'site', 'shank' and 'shank_site' (only if there is more
+        than one shank), 'Intan', 'Z', 'X' (only if `shank_spacing` is
+        given), and 'GUI'.
+    
+    The DataFrame is cached for each parameter set, and a copy of it is
+    returned at each call.
+    """
+    import pandas
+    
+    sort_by_depth = np.asarray(sort_by_depth)
+    key = (sort_by_depth.tobytes(), sort_by_depth.dtype.str,
+        sort_by_depth.shape, n_shanks, site_pitch, shank_spacing,
+        channels_per_shank,
+        None if shank_names is None else tuple(shank_names))
+    if key not in _probes:
+        _probes[key] = pandas.DataFrame(_probe_columns(sort_by_depth,
+            n_shanks, site_pitch, shank_spacing, channels_per_shank,
+            shank_names))
+    return _probes[key].copy()
+
+def _probe_columns(sort_by_depth, n_shanks, site_pitch, shank_spacing,
+    channels_per_shank, shank_names):
+    """Return the dict of columns of make_probe"""
+    # The Intan numbers of every shank, as (shank, shank_site)
+    if sort_by_depth.ndim == 1:
+        if n_shanks is None:
+            n_shanks = 1
+        if channels_per_shank is None:
+            channels_per_shank = len(sort_by_depth)
+        intan = sort_by_depth[None, :] + (
+            channels_per_shank * np.arange(n_shanks)[:, None])
+    else:
+        if n_shanks is not None and n_shanks != len(sort_by_depth):
+            raise ValueError("n_shanks doesn't match sort_by_depth")
+        intan = sort_by_depth
+        n_shanks = len(intan)
+    sites_per_shank = intan.shape[1]
+    
+    if shank_names is None:
+        if n_shanks > len(string.ascii_uppercase):
+            raise ValueError("give shank_names for more than 26 shanks")
+        shank_names = list(string.ascii_uppercase[:n_shanks])
+    
+    shank_site = np.tile(np.arange(sites_per_shank), n_shanks)
+    columns = {'site': np.arange(intan.size)}
+    if n_shanks > 1:
+        columns['shank'] = np.repeat(
+            np.array(shank_names, dtype=object), sites_per_shank)
+        columns['shank_site'] = shank_site
+    columns['Intan'] = intan.ravel()
+    columns['Z'] = shank_site * site_pitch
+    if shank_spacing is not None:
+        columns['X'] = np.repeat(
+            np.arange(n_shanks) * shank_spacing, sites_per_shank)
+    
+    # GUI order is just 1 + Intan order
+    columns['GUI'] = columns['Intan'] + 1
+    return columns
+
 
 def h3_64ch_assy_325():
     """Return dataflow for Diagnostic Biochips 64-4
@@ -32,25 +115,7 @@ def h3_64ch_assy_325():
 
 
     ## Make dataflow for assy-325
-    # Take each of the entries in the lists above and rename them Intan because
-    # they are Intan numbers in geometric order
-    assy325_dataflow = pandas.Series(
-        assy325_sort_by_depth).rename('Intan').to_frame()
-
-    # Define a site number which really just defines a geometric ordering
-    assy325_dataflow.index.name = 'site'
-    assy325_dataflow = assy325_dataflow.reset_index()
-
-    # Add depth
-    assy325_dataflow['Z'] = assy325_dataflow['site'] * 20
-
-    # Add GUI order, which is just 1 + Intan order
-    assy325_dataflow['GUI'] = assy325_dataflow['Intan'] + 1
-
-    # Always index by site
-    assy325_dataflow = assy325_dataflow.sort_index()
-    
-    return assy325_dataflow
+    return make_probe(assy325_sort_by_depth, site_pitch=20)
 
 def h12_128ch_assy_350():
     """Return dataflow for Diagnostic Biochips 128-2
@@ -68,39 +133,8 @@ def h12_128ch_assy_350():
         63, 62, 61, 60, 59, 58, 57, 56, 55, 54, 53, 52, 51, 50, 49, 48,
         ])
 
-    assy350_shank_b_sort_by_depth = assy350_shank_a_sort_by_depth + 64
-
+    # Shank B is wired like shank A, 64 channels later
     # By convention, sort first Shank A and then Shank B, both from 
     # superficial to deep
-    assy350_both_shanks_canonical_sort_order = np.concatenate([
-        assy350_shank_a_sort_by_depth,
-        assy350_shank_b_sort_by_depth,
-        ])
-
-
-    ## Make dataflow for assy-350
-    # Concatenate the Intan numbers for each shank
-    assy350_dataflow = pandas.concat([
-        pandas.Series(assy350_shank_a_sort_by_depth).rename('A'),
-        pandas.Series(assy350_shank_b_sort_by_depth).rename('B'),
-        ], axis=1)
-    assy350_dataflow.columns.name = 'shank'
-    assy350_dataflow.index.name = 'shank_site'
-
-    # Stack them (shank first) and label them Intan
-    assy350_dataflow = assy350_dataflow.T.stack().rename('Intan').reset_index()
-
-    # Define and pop a 'site' index, which defines the standard ordering
-    assy350_dataflow.index.name = 'site'
-    assy350_dataflow = assy350_dataflow.reset_index()
-
-    # Add depth
-    assy350_dataflow['Z'] = assy350_dataflow['shank_site'] * 20
-
-    # Add GUI order, which is just 1 + Intan order
-    assy350_dataflow['GUI'] = assy350_dataflow['Intan'] + 1
-
-    # Always index by site
-    assy350_dataflow = assy350_dataflow.sort_index()
-    
-    return assy350_dataflow
+    return make_probe(assy350_shank_a_sort_by_depth, n_shanks=2,
+        site_pitch=20)
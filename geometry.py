@@ -0,0 +1,310 @@
+"""Spatial index of the recording sites of a dataflow.
+
+The geometry of a dataflow is in its DataFrame: 'Z' (depth) for the
+Janelia, H3, Helen and dbc probes, and 'xcoord' and 'ycoord' for the wire
+EIBs. Sites are grouped by 'shank' (dbc H12) or by 'kcoord' (the tetrode
+of the wire EIBs), and two sites in different groups are never neighbors.
+
+`GridIndex` bins the sites into a regular grid, so that radius and
+k-nearest neighbor queries only look at the nearby cells.
+`neighbor_graph` uses it to build the sparse adjacency of every site, in
+acquisition channel order, and caches it for dataflows given by name.
+"""
+from __future__ import division
+from __future__ import absolute_import
+import itertools
+import numpy as np
+
+from . import raw
+
+
+# Candidate columns, in order of preference
+COORD_COLUMNS = [['xcoord', 'ycoord'], ['Z']]
+GROUP_COLUMNS = ['shank', 'kcoord']
+
+
+def positions(dataflow, coords=None):
+    """Return the position of each row of `dataflow`
+
+    coords : list of columns with the coordinates
+        If None, the first of COORD_COLUMNS that is in `dataflow`
+
+    Returns : float array of shape (n_rows, n_coords)
+    """
+    df = raw.get_dataflow(dataflow)
+    if coords is None:
+        for candidate in COORD_COLUMNS:
+            if all(col in df.columns for col in candidate):
+                coords = candidate
+                break
+        else:
+            raise ValueError("dataflow has no coordinate columns")
+    return df[list(coords)].values.astype(float)
+
+def groups(dataflow, group_col=None):
+    """Return the group (shank or tetrode) of each row of `dataflow`
+
+    group_col : column with the groups
+        If None, the first of GROUP_COLUMNS that is in `dataflow`, or
+        a single group if there is none of them.
+        If False, a single group.
+
+    Returns : int array of group numbers, starting at 0
+    """
+    df = raw.get_dataflow(dataflow)
+    if group_col is None:
+        group_col = next(
+            (col for col in GROUP_COLUMNS if col in df.columns), False)
+    if group_col is False:
+        return np.zeros(len(df), dtype=int)
+    return np.unique(df[group_col].values, return_inverse=True)[1].ravel()
+
+
+class GridIndex(object):
+    """Sites binned into a regular grid, for neighbor queries
+
+    Rows are identified by their position in `positions`. Queries
+    only return rows in the same group as the query.
+
+    Methods:
+        radius : rows within a distance of a row
+        knn : the k nearest rows to a row
+        radius_graph, knn_graph : the neighbors of every row
+    """
+    def __init__(self, positions, groups=None, cell_size=None):
+        """Bin the positions
+
+        positions : array of shape (n_rows, n_coords), all finite
+        groups : int array of the group of each row, or None for one group
+        cell_size : side of the cells of the grid
+            If None, chosen so there is about one row per cell
+        """
+        self.positions = np.asarray(positions, dtype=float)
+        if self.positions.ndim == 1:
+            self.positions = self.positions[:, None]
+        if not np.all(np.isfinite(self.positions)):
+            raise ValueError("positions must be finite, rows {} are "
+                "not".format(np.flatnonzero(
+                    ~np.all(np.isfinite(self.positions), axis=1)).tolist()))
+        n_rows, n_dims = self.positions.shape
+        if groups is None:
+            groups = np.zeros(n_rows, dtype=int)
+        self.groups = np.asarray(groups, dtype=int)
+
+        self.origin = self.positions.min(axis=0) if n_rows else (
+            np.zeros(n_dims))
+        extent = self.positions.max(axis=0) - self.origin if n_rows else (
+            np.zeros(n_dims))
+        if cell_size is None:
+            cell_size = extent.max() / max(n_rows, 1) ** (1. / n_dims)
+        self.cell_size = float(cell_size) if cell_size > 0 else 1.
+
+        # Every row gets the key of its cell, unique across groups, and
+        # the rows are sorted by key so the rows in a run of cells along
+        # the last coordinate are contiguous
+        self.shape = np.floor(extent / self.cell_size).astype(int) + 1
+        cells = self._cell(self.positions)
+        self.keys = self._key(self.groups, cells)
+        self.order = np.argsort(self.keys, kind='mergesort')
+        self.sorted_keys = self.keys[self.order]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cell(self, points):
+        cells = np.floor((points - self.origin) / self.cell_size)
+        return np.clip(cells, 0, self.shape - 1).astype(np.int64)
+
+    def _key(self, group, cells):
+        return (np.asarray(group, dtype=np.int64) * np.prod(self.shape) +
+            np.ravel_multi_index(np.asarray(cells).T, self.shape))
+
+    def _candidates(self, point, group, distance):
+        """Return the rows in the cells within `distance` of `point`"""
+        lo = self._cell(point - distance)
+        hi = self._cell(point + distance)
+        res = []
+        for cell in itertools.product(
+                *[range(l, h + 1) for l, h in zip(lo[:-1], hi[:-1])]):
+            first = self._key(group, tuple(cell) + (lo[-1],))
+            last = self._key(group, tuple(cell) + (hi[-1],))
+            start, stop = np.searchsorted(
+                self.sorted_keys, [first, last + 1])
+            res.append(self.order[start:stop])
+        return np.concatenate(res) if res else np.array([], dtype=int)
+
+    def _sorted_by_distance(self, row, rows, include_self):
+        if not include_self:
+            rows = rows[rows != row]
+        dists = np.sqrt(np.sum(
+            (self.positions[rows] - self.positions[row]) ** 2, axis=1))
+        idx = np.lexsort((rows, dists))
+        return rows[idx], dists[idx]
+
+    def radius(self, row, distance, include_self=False):
+        """Return the rows within `distance` of `row`, nearest first
+
+        Returns : (rows, distances)
+        """
+        point = self.positions[row]
+        rows, dists = self._sorted_by_distance(row,
+            self._candidates(point, self.groups[row], distance),
+            include_self)
+        keep = dists <= distance
+        return rows[keep], dists[keep]
+
+    def knn(self, row, k, include_self=False):
+        """Return the `k` rows nearest to `row`, nearest first
+
+        Fewer are returned if the group of `row` has fewer rows.
+
+        Returns : (rows, distances)
+        """
+        group = self.groups[row]
+        n_available = np.sum(self.groups == group) - (not include_self)
+        k = min(k, n_available)
+
+        # Grow the search until it contains k rows. They are then the
+        # nearest ones, because every row within the search distance
+        # was a candidate.
+        distance = self.cell_size
+        while True:
+            rows, dists = self.radius(row, distance, include_self)
+            if len(rows) >= k:
+                return rows[:k], dists[:k]
+            distance *= 2
+
+    def radius_graph(self, distance, include_self=False):
+        """Return the NeighborGraph of the rows within `distance`"""
+        return NeighborGraph.from_lists([self.radius(row, distance,
+            include_self) for row in range(len(self))])
+
+    def knn_graph(self, k, include_self=False):
+        """Return the NeighborGraph of the `k` nearest rows"""
+        return NeighborGraph.from_lists([self.knn(row, k, include_self)
+            for row in range(len(self))])
+
+
+class NeighborGraph(object):
+    """Sparse adjacency, in compressed sparse row form
+
+    The neighbors of node i are indices[indptr[i]:indptr[i + 1]], nearest
+    first, at the corresponding distances.
+    """
+    def __init__(self, indptr, indices, distances):
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+
+    @classmethod
+    def from_lists(cls, lists):
+        """Build from a list of (neighbors, distances) of each node"""
+        counts = [len(neighbors) for neighbors, dists in lists]
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        if len(lists) and indptr[-1]:
+            indices = np.concatenate([nn for nn, dd in lists]).astype(int)
+            distances = np.concatenate([dd for nn, dd in lists])
+        else:
+            indices = np.array([], dtype=int)
+            distances = np.array([], dtype=float)
+        return cls(indptr, indices, distances)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __repr__(self):
+        return "NeighborGraph({} nodes, {} edges)".format(
+            len(self), len(self.indices))
+
+    def neighbors(self, node):
+        """Return the neighbors of `node`, nearest first"""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbor_distances(self, node):
+        return self.distances[self.indptr[node]:self.indptr[node + 1]]
+
+    def relabel(self, labels, n_nodes=None):
+        """Return the graph with node i renamed labels[i]
+
+        n_nodes : number of nodes of the result, by default max(labels) + 1
+            Nodes that aren't in `labels` have no neighbors.
+        """
+        labels = np.asarray(labels, dtype=int)
+        if n_nodes is None:
+            n_nodes = labels.max() + 1 if len(labels) else 0
+        lists = [(np.array([], dtype=int), np.array([], dtype=float))
+            ] * n_nodes
+        for node, label in enumerate(labels):
+            lists[label] = (
+                labels[self.neighbors(node)], self.neighbor_distances(node))
+        return NeighborGraph.from_lists(lists)
+
+    def to_scipy(self):
+        """Return the distances as a scipy.sparse.csr_matrix
+
+        Requires scipy.
+        """
+        import scipy.sparse
+        return scipy.sparse.csr_matrix(
+            (self.distances, self.indices, self.indptr),
+            shape=(len(self), len(self)))
+
+    def to_dense(self):
+        """Return the boolean adjacency matrix"""
+        res = np.zeros((len(self), len(self)), dtype=bool)
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        res[rows, self.indices] = True
+        return res
+
+
+## Indexes and graphs of dataflows
+# Built indexes and graphs of the dataflows given by name
+_indexes = {}
+_graphs = {}
+
+def get_index(dataflow, coords=None, group_col=None, cell_size=None):
+    """Return the GridIndex of the rows of `dataflow`
+
+    Cached if `dataflow` is given by name.
+    """
+    key = (dataflow, tuple(coords or ()), group_col, cell_size)
+    if isinstance(dataflow, str) and key in _indexes:
+        return _indexes[key]
+    index = GridIndex(positions(dataflow, coords),
+        groups(dataflow, group_col), cell_size)
+    if isinstance(dataflow, str):
+        _indexes[key] = index
+    return index
+
+def neighbor_graph(dataflow, radius=None, k=None, coords=None,
+    group_col=None, acq_col=None, include_self=False):
+    """Return the NeighborGraph of `dataflow` in acquisition channel order
+
+    Node i is 0-based acquisition channel i, ie the column of a raw
+    (time, channel) array, as in `raw.acquisition_channels`.
+
+    radius : neighbors are the sites within this distance
+    k : neighbors are the k nearest sites
+        Exactly one of radius and k must be given.
+    coords, group_col : see `positions` and `groups`
+    acq_col : see `raw.acquisition_channels`
+
+    Cached if `dataflow` is given by name.
+    """
+    if (radius is None) == (k is None):
+        raise ValueError("give exactly one of radius and k")
+    key = (dataflow, radius, k, tuple(coords or ()), group_col, acq_col,
+        include_self)
+    if isinstance(dataflow, str) and key in _graphs:
+        return _graphs[key]
+
+    index = get_index(dataflow, coords, group_col)
+    if radius is not None:
+        graph = index.radius_graph(radius, include_self)
+    else:
+        graph = index.knn_graph(k, include_self)
+    graph = graph.relabel(raw.acquisition_channels(dataflow, acq_col))
+
+    if isinstance(dataflow, str):
+        _graphs[key] = graph
+    return graph
@@ -17,14 +17,8 @@ omnetics2intan = Adapters.Adapter(
 
 # This is just a 64-channel version of omnetics2intan
 # I'm assuming that MISO1 is first and MISO2 is second\
-omnetics2intan_64ch = Adapters.Adapter(
-    list(range(1, 73)), [
-    'GND', 7, 6, 5, 4, 3, 2, 1, 0, 31, 30, 29, 28, 27, 26, 25, 24, 'REF',
-    'GND', 23, 22, 21, 20, 19, 18, 17, 16, 15, 14, 13, 12, 11, 10, 9, 8, 'REF',
-    'GND', 39, 38, 37, 36, 35, 34, 33, 32, 63, 62, 61, 60, 59, 58, 57, 56, 'REF',
-    'GND', 55, 54, 53, 52, 51, 50, 49, 48, 47, 46, 45, 44, 43, 42, 41, 40, 'REF',
-    ],
-    )
+omnetics2intan_64ch = Adapters.Adapter.stack(
+    [omnetics2intan, omnetics2intan], in_offsets=36, out_offsets=32)
 
 # This is the 64-channel Intan headstage RHD2164
 # (not the double 32-channel stuff above)
@@ -48,4 +42,10 @@ omnetics2rhd2164 = Adapters.Adapter(
 intan2gui = Adapters.Adapter(list(range(36)), list(range(1, 37)))
 
 # This is a 64-ch version
-intan2gui_64ch = Adapters.Adapter(list(range(72)), list(range(1, 73)))
\ No newline at end of file
+intan2gui_64ch = Adapters.Adapter(list(range(72)), list(range(1, 73)))
+
+# The same as RangeAdapters, which are computed arithmetically and fold
+# into the other RangeAdapters they are chained with. routes uses these.
+# Unlike the ones above, they can't be edited in place.
+intan2gui_range = Adapters.RangeAdapter(36, starts=[0, 1])
+intan2gui_64ch_range = Adapters.RangeAdapter(72, starts=[0, 1])
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""Loading nanoZ impedance measurements of many EIBs at once.
+
+The nanoZ reports the impedance of each of its MUX channels. The wire
+dataflows (eg `wire64_big_dataflow`) already map each MUX channel through
+`nza_SSB6_64` and `nanoz_mux2samtec` to the headstage channel, the Samtec
+pin and the EIB hole, so `load_directory` parses every nanoZ file in a
+directory, in parallel, and joins them all to the dataflow at once.
+
+The files are expected to be laid out as
+    directory/session/eib_name.txt
+but see `load_directory` for other layouts.
+
+The result is cached next to the files, and reused until any file is
+added, removed, or modified.
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from . import cache
+from . import raw
+
+
+# Candidate headers of the columns of a nanoZ file, compared in lower case
+# without the unit in parentheses. A header also matches if it starts
+# with a candidate and a space, eg 'Impedance magnitude at 1004 Hz'.
+MUX_HEADERS = ['mux', 'channel', 'chan', 'ch', 'site']
+IMPEDANCE_HEADERS = ['z', 'impedance', '|z|', 'zmag', 'z magnitude']
+PHASE_HEADERS = ['phase', 'z phase', 'impedance phase']
+
+# Multipliers of the units that can follow an impedance
+UNITS = {'': 1., 'ohm': 1., 'k': 1e3, 'kohm': 1e3, 'm': 1e6, 'mohm': 1e6}
+
+# Extensions of the files that are parsed
+EXTENSIONS = ['.txt', '.csv', '.tsv']
+
+# Name of the cache file in the directory
+CACHE_FILENAME = '.impedance_cache.npz'
+
+COLUMNS = ['session', 'eib', 'mux', 'hs', 'samtec', 'enum', 'ename',
+    'impedance', 'phase']
+
+
+## Parsing single files
+def _split(line):
+    for delimiter in ('\t', ',', ';'):
+        if delimiter in line:
+            return [field.strip() for field in line.split(delimiter)]
+    return line.split()
+
+def _unit(unit):
+    """Return the key in UNITS of a unit like 'MOhms' or 'kΩ'"""
+    unit = unit.lower().replace(u'ω', 'ohm')
+    return unit[:-1] if unit.endswith('ohms') else unit
+
+def _header_unit(header):
+    """Return the multiplier of the unit in a header like 'Z (kOhm)'"""
+    match = re.search(r'\(\s*(\w+)\s*\)', header)
+    if match is None:
+        return 1.
+    return UNITS.get(_unit(match.group(1)), 1.)
+
+def _find_column(headers, candidates, exclude=()):
+    lowered = [re.sub(r'\s*\(.*\)', '', header).strip().lower()
+        for header in headers]
+    for candidate in candidates:
+        for ncol, header in enumerate(lowered):
+            if ncol not in exclude and (header == candidate or
+                    header.startswith(candidate + ' ')):
+                return ncol
+    return None
+
+def _parse_number(field, multiplier=1.):
+    """Parse '1.2', '1.2 MOhm' or '1.2k' into a float, or NaN"""
+    match = re.match(r'^\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)'
+        r'\s*([a-zA-Z]*)', field)
+    if match is None:
+        return np.nan
+    unit = _unit(match.group(2))
+    if unit:
+        multiplier = UNITS.get(unit, multiplier)
+    return float(match.group(1)) * multiplier
+
+def read_nanoz(path):
+    """Parse a nanoZ output file
+
+    The file is a table with one row per MUX channel, eg
+        nanoZ impedance test, 1004 Hz
+        MUX	Z (MOhm)	Phase (deg)
+        1	0.52	-62.1
+        2	1.3	-58.0
+    Lines before the header row, such as the test settings, are skipped.
+    The header row is the first one with a MUX column and an impedance
+    column (see MUX_HEADERS, IMPEDANCE_HEADERS and PHASE_HEADERS), in any
+    order and among any other columns. Columns can be separated by tabs,
+    commas, semicolons, or spaces. MUX channels can be written as eg '12'
+    or 'MUX12', and rows without one are skipped. Impedances are
+    converted to ohms, from the unit in the header (eg 'Z (MOhm)') or
+    after the value (eg '1.2 MOhm'), and are NaN if they can't be parsed,
+    eg for open channels.
+
+    Returns : (mux, impedance, phase)
+        Arrays with one entry per row of the file. The phase is NaN if
+        the file doesn't have one.
+    """
+    with open(path) as fi:
+        lines = [line.rstrip('\r\n') for line in fi]
+
+    for nline, line in enumerate(lines):
+        headers = _split(line)
+        phase_col = _find_column(headers, PHASE_HEADERS)
+        mux_col = _find_column(headers, MUX_HEADERS)
+        z_col = _find_column(headers, IMPEDANCE_HEADERS, exclude=[phase_col])
+        if mux_col is not None and z_col is not None:
+            break
+    else:
+        raise ValueError("no header row in {} with a MUX column (one of {}) "
+            "and an impedance column (one of {})".format(
+            path, MUX_HEADERS, IMPEDANCE_HEADERS))
+    z_unit = _header_unit(headers[z_col])
+
+    mux, impedance, phase = [], [], []
+    for line in lines[nline + 1:]:
+        fields = _split(line)
+        if len(fields) <= max(mux_col, z_col):
+            continue
+        # MUX channels may be written as eg '12' or 'MUX12'
+        match = re.search(r'\d+', fields[mux_col])
+        if match is None:
+            continue
+        mux.append(int(match.group()))
+        impedance.append(_parse_number(fields[z_col], z_unit))
+        phase.append(_parse_number(fields[phase_col])
+            if phase_col is not None and phase_col < len(fields) else np.nan)
+    return (np.array(mux, dtype=int), np.array(impedance, dtype=float),
+        np.array(phase, dtype=float))
+
+
+## Loading directories
+def find_files(directory):
+    """Return the sorted paths of the nanoZ files under `directory`"""
+    res = []
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [dirname for dirname in dirnames
+            if not dirname.startswith('.')]
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in EXTENSIONS:
+                res.append(os.path.join(root, filename))
+    return sorted(res)
+
+def parse_path(path, directory):
+    """Return the (session, eib) of a file, from its path in `directory`
+
+    The EIB name is the filename without its extension, and the session
+    is the subdirectory it is in, or '' if it is directly in `directory`.
+    """
+    relative = os.path.relpath(path, directory)
+    session, filename = os.path.split(relative)
+    return session, os.path.splitext(filename)[0]
+
+def _fingerprint(paths, dataflow):
+    """Return a key that changes when any file or the dataflow does"""
+    sha = hashlib.sha1()
+    sha.update(repr(dataflow).encode())
+    sha.update(cache.source_hash().encode())
+    with open(os.path.abspath(__file__), 'rb') as fi:
+        sha.update(fi.read())
+    for path in paths:
+        stat = os.stat(path)
+        sha.update('{}:{}:{}\n'.format(
+            path, stat.st_size, stat.st_mtime_ns).encode())
+    return sha.hexdigest()
+
+def _load_cached(cache_path, fingerprint):
+    try:
+        with np.load(cache_path) as npz:
+            if npz['fingerprint'].item() != fingerprint:
+                return None
+            return cache.frame_from_arrays(npz)
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+def _store_cached(cache_path, fingerprint, df):
+    arrays = cache.frame_to_arrays(df)
+    arrays['fingerprint'] = np.array(fingerprint)
+    tmp_path = '{}.{}.tmp.npz'.format(cache_path[:-4], os.getpid())
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, cache_path)
+
+def load_directory(directory, dataflow='wire64_big_dataflow',
+    parse_path=parse_path, n_workers=None, use_cache=True):
+    """Load every nanoZ file under `directory` into one table
+
+    directory : where the files are, see `find_files`
+    dataflow : DataFrame, or name of a dataflow (see `dataflow.get`) with
+        a 'mux' column, eg wire64_big_dataflow or wire128_big_dataflow
+    parse_path : function (path, directory) -> (session, eib)
+        The default expects directory/session/eib_name.txt
+    n_workers : number of processes that parse the files
+        If None, the number of cores. If 0, parse in this process.
+    use_cache : reuse the table cached in the directory if no file has
+        changed, and otherwise save it there. Only when `dataflow` is
+        given by name.
+
+    Returns : DataFrame
+        One row per (session, EIB name, headstage channel) with the
+        columns in COLUMNS. MUX channels that aren't in the dataflow are
+        dropped. Sorted by session, eib, and hs.
+    """
+    import pandas
+
+    paths = find_files(directory)
+    use_cache = use_cache and isinstance(dataflow, str)
+    if use_cache:
+        cache_path = os.path.join(directory, CACHE_FILENAME)
+        fingerprint = _fingerprint(paths, dataflow)
+        res = _load_cached(cache_path, fingerprint)
+        if res is not None:
+            return res
+
+    # Parse all the files
+    if n_workers == 0 or len(paths) < 2:
+        parsed = [read_nanoz(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(n_workers) as executor:
+            parsed = list(executor.map(read_nanoz, paths, chunksize=16))
+
+    # Concatenate them into columns
+    names = [parse_path(path, directory) for path in paths]
+    sessions = np.array([session for session, eib in names], dtype=object)
+    eibs = np.array([eib for session, eib in names], dtype=object)
+    counts = [len(mux) for mux, impedance, phase in parsed]
+    file_idx = np.repeat(np.arange(len(paths)), counts)
+    if len(paths):
+        mux, impedance, phase = [np.concatenate(arrays)
+            for arrays in zip(*parsed)]
+    else:
+        mux = np.array([], dtype=int)
+        impedance = phase = np.array([], dtype=float)
+
+    # Look up every MUX channel in the dataflow at once
+    df = raw.get_dataflow(dataflow)
+    rows = pandas.Index(df['mux'].values.astype(int)).get_indexer(mux)
+    keep = rows >= 0
+    rows, file_idx = rows[keep], file_idx[keep]
+
+    res = pandas.DataFrame({
+        'session': sessions[file_idx],
+        'eib': eibs[file_idx],
+        'mux': mux[keep],
+        'hs': df['hs'].values[rows],
+        'samtec': df['samtec'].values[rows],
+        'enum': df['enum'].values[rows],
+        'ename': df['ename'].values[rows],
+        'impedance': impedance[keep],
+        'phase': phase[keep],
+        }, columns=COLUMNS).infer_objects()
+    res = res.sort_values(['session', 'eib', 'hs'], kind='mergesort')
+    res.index = pandas.RangeIndex(len(res))
+
+    if use_cache:
+        _store_cached(cache_path, fingerprint, res)
+    return res
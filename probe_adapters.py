@@ -14,7 +14,6 @@ goes from 1-36 and the second goes from 37-72.
 
 """
 
-from builtins import zip
 from builtins import range
 import Adapters
 import numpy as np
@@ -25,6 +24,21 @@ def inclusive_list(start, stop):
     """
     return list(range(start, stop + 1))
 
+def stack_boards(board, n_boards, offset):
+    """Return `board` repeated `n_boards` times, each time offset further
+    
+    This is for stacked implants, where each board is wired like the
+    first one. The ints of each repeat are offset by `offset` more than
+    the previous one. Other entries (eg 'GND') are repeated as they are.
+    """
+    values = np.tile(np.array(board, dtype=object), n_boards)
+    shifts = np.repeat(
+        np.arange(n_boards) * offset, len(board)).astype(object)
+    is_int = np.tile(
+        [isinstance(value, (int, np.integer)) for value in board], n_boards)
+    values[is_int] += shifts[is_int]
+    return values.tolist()
+
 
 ## wire64 and wire128 EIB 
 # This is the White Matter EIB
@@ -42,17 +56,14 @@ wire64_level0_eib_numbers = list(range(64))
 wire128_level0_eib_numbers = list(range(128))
 
 # level 1
-wire64_level1_eib_names = []
-for column_number in inclusive_list(1, 16):
-    for row_name in inclusive_list(ord('A'), ord('D')):
-        name = '{:02}{}'.format(column_number, chr(row_name))
-        wire64_level1_eib_names.append(name)
-        
-wire128_level1_eib_names = []
-for column_number in inclusive_list(1, 32):
-    for row_name in inclusive_list(ord('A'), ord('D')):
-        name = '{:02}{}'.format(column_number, chr(row_name))
-        wire128_level1_eib_names.append(name)
+def eib_names(n_channels):
+    """Return the EIB hole names in EIB number order: '01A' to '01D', etc"""
+    return ['{:02}{}'.format(column_number, row_name)
+        for column_number in inclusive_list(1, n_channels // 4)
+        for row_name in 'ABCD']
+
+wire64_level1_eib_names = eib_names(64)
+wire128_level1_eib_names = eib_names(128)
 
 # Create adaptor
 wire64_eib_numbers2names = Adapters.Adapter(
@@ -85,24 +96,17 @@ wire64_eib_names2headstage = Adapters.Adapter(
     wire64_eib_names_sorted_by_hs,
     inclusive_list(1, 64))
     
-wire128_eib_names_sorted_by_hs = [
-    '01B', '05C', '01C', '05A', '01A', '05D', '05B', '01D', 
-    '02A', '06A', '06C', '02C', '06B', '02B', '06D', '07A', 
-    '02D', '03A', '07B', '07C', '03C', '08A', '03B', '07D', 
-    '08B', '04A', '09A', '08C', '03D', '09B', '04B', '08D', 
-    '10A', '04C', '13A', '10B', '09C', '04D', '11A', '13B', 
-    '09D', '11B', '13D', '14B', '12A', '10C', '13C', '12B', 
-    '14A', '14C', '16D', '10D', '15A', '11C', '14D', '16A', 
-    '11D', '15C', '15B', '15D', '12C', '16B', '12D', '16C',
-    '17B', '21C', '17C', '21A', '17A', '21D', '21B', '17D', 
-    '18A', '22A', '22C', '18C', '22B', '18B', '22D', '23A', 
-    '18D', '19A', '23B', '23C', '19C', '24A', '19B', '23D', 
-    '24B', '20A', '25A', '24C', '19D', '25B', '20B', '24D', 
-    '26A', '20C', '29A', '26B', '25C', '20D', '27A', '29B', 
-    '25D', '27B', '29D', '30B', '28A', '26C', '29C', '28B', 
-    '30A', '30C', '32D', '26D', '31A', '27C', '30D', '32A', 
-    '27D', '31C', '31B', '31D', '28C', '32B', '28D', '32C',
-    ]
+# The second board is wired like the first one, 16 columns later
+def stack_eib_names(names, n_boards):
+    """Return EIB hole `names` repeated for `n_boards` boards of 16 columns
+    
+    eg '01B' on the first board is '17B' on the second one
+    """
+    return ['{:02}{}'.format(int(name[:2]) + 16 * n_board, name[2:])
+        for n_board in range(n_boards) for name in names]
+
+wire128_eib_names_sorted_by_hs = stack_eib_names(
+    wire64_eib_names_sorted_by_hs, 2)
 wire128_eib_names2headstage = Adapters.Adapter(
     wire128_eib_names_sorted_by_hs,
     inclusive_list(1, 128))
@@ -130,16 +134,9 @@ wire64_slimstack2headstage_hs_sorted_by_slimstack_geometry = [
      4,  7, 10, 13, 16, 19, 22, 25, 27, 30, 33, 36, 39, 42, 45, 48, 'REF',
     ]
 
-wire128_slimstack2headstage_hs_sorted_by_slimstack_geometry = [ 
-     3,  8, 12, 17, 21, 29, 34, 38, 47, 43, 50, 55, 58, 60, 64, 51, 'GND',
-     2,  6, 11, 15, 20, 24, 28, 32, 37, 41, 46, 52, 54, 57, 61, 63, 'REF',
-     1,  5,  9, 14, 18, 23, 26, 31, 35, 40, 44, 49, 59, 53, 56, 62, 'GND',
-     4,  7, 10, 13, 16, 19, 22, 25, 27, 30, 33, 36, 39, 42, 45, 48, 'REF',
-     67,72,76,81,85,93,98,102,111,107,114,119,122,124,128,115,'GND',
-     66,70,75,79,84,88,92,96,101,105,110,116,118,121,125,127,'REF',
-     65,69,73,78,82,87,90,95,99,104,108,113,123,117,120,126,'GND',
-     68,71,74, 77,80,83, 86,89,91,94,97,100,103,106,109,112, 'REF',
-     ]
+wire128_slimstack2headstage_hs_sorted_by_slimstack_geometry = stack_boards(
+    wire64_slimstack2headstage_hs_sorted_by_slimstack_geometry, 2, 64)
+
 # SlimStack channel numbers. These are the pins on the SlimStack
 # connector on the EIB. 
 # They are labeled top_00 to top_33, and bot_00 to bot_33, corresponding
@@ -158,12 +155,20 @@ wire64_slimstack2headstage = Adapters.Adapter(
     wire64_slimstack2headstage_hs_sorted_by_slimstack_geometry,
     )
 #Similar to code above but extened for 128 channels
-wire128_slimstack_sorted_geometrically = (
-    ['top1_{:02d}'.format(num) for num in range(34)] + 
-    ['bot1_{:02d}'.format(num) for num in range(34)] +
-    ['top2_{:02d}'.format(num) for num in range(34)] + 
-    ['bot2_{:02d}'.format(num) for num in range(34)]
-    )
+def slimstack_names(n_boards):
+    """Return the SlimStack pin names of `n_boards` boards, eg 'top_00'
+    
+    With more than one board they are numbered from 1, eg 'top1_00'
+    """
+    if n_boards == 1:
+        prefixes = ['top', 'bot']
+    else:
+        prefixes = ['{}{}'.format(connector, n_board + 1)
+            for n_board in range(n_boards) for connector in ['top', 'bot']]
+    return ['{}_{:02d}'.format(prefix, num)
+        for prefix in prefixes for num in range(34)]
+
+wire128_slimstack_sorted_geometrically = slimstack_names(2)
 
 wire128_slimstack2headstage = Adapters.Adapter(
     wire128_slimstack_sorted_geometrically,
@@ -177,23 +182,18 @@ wire128_slimstack2headstage = Adapters.Adapter(
 # I assume these MUX numbers are in the same order as the headstage channels
 # So I extracted the MUX numbers, and map them to inclusive_list(1, 64)
 #I added an additional 64 channels for dual implant recordings. 
-mux_sorted_by_headstage = [
+mux_sorted_by_headstage = stack_boards([
      1, 57, 42, 10,  2, 33,  9, 41,  3, 12, 34, 44, 11,  4, 35, 14, 
     43,  6, 13, 36, 46, 16,  5, 38, 15,  8, 24, 37, 48, 23, 7, 40, 
     22, 45, 32, 21, 39, 47, 20, 31, 64, 19, 54, 30, 18, 63, 56, 17, 
     29, 55, 49, 62, 27, 61, 53, 26, 60, 52, 28, 51, 59, 25, 58, 50,
-    65, 121, 106, 74, 66, 97, 73, 105, 67, 76, 98, 108, 75, 68, 99,  
-    78, 107, 70, 77, 100, 110, 80, 69, 102, 79, 72, 88, 101, 112, 87,
-    71, 104,  86, 109, 96, 85, 103, 111, 84, 95, 128, 83, 118, 94, 82, 127, 
-    120, 81, 93, 119, 113, 126, 91, 125, 117, 90, 124, 116, 92, 115, 123, 89, 122, 114    
-]
+    ], 2, 64)
 nza_SSB6_64 = Adapters.Adapter(
     mux_sorted_by_headstage,
     inclusive_list(1, 64))
     
-nza_SSB6_128 = Adapters.Adapter(
-    mux_sorted_by_headstage,
-    inclusive_list(1, 128))
+nza_SSB6_128 = Adapters.Adapter.stack(
+    [nza_SSB6_64, nza_SSB6_64], in_offsets=64, out_offsets=64)
 
 ## nanoZ mux mapping
 # This is taken from the image from the nanoZ manual
@@ -239,6 +239,52 @@ nanoz_mux2samtec128 = Adapters.Adapter(
     nanoZ_mux_numbers, inclusive_list(1, 160))
 
 
+## Wire EIBs with any number of boards
+# Stacked implants use several boards of 64 channels, each one wired like
+# the first, with everything numbered on from the previous board. This
+# generates the adapters above for any number of boards, eg 256 channels
+# for four boards.
+_wire_adapters = {}
+
+def wire_adapters(n_channels):
+    """Return the adapters of a wire EIB with `n_channels` channels
+    
+    n_channels : a multiple of 64, one board per 64 channels
+    
+    Returns : dict with the same adapters as for wire64, under the keys
+        'eib_numbers2names', 'eib_names2headstage', 'slimstack2headstage',
+        'nza_SSB6', and 'nanoz_mux2samtec'.
+        These are cached, so don't modify them.
+    """
+    if n_channels <= 0 or n_channels % 64 != 0:
+        raise ValueError("n_channels must be a multiple of 64")
+    if n_channels in _wire_adapters:
+        return _wire_adapters[n_channels]
+    
+    n_boards = n_channels // 64
+    res = {
+        'eib_numbers2names': Adapters.Adapter(
+            list(range(n_channels)),
+            eib_names(n_channels)),
+        'eib_names2headstage': Adapters.Adapter(
+            stack_eib_names(wire64_eib_names_sorted_by_hs, n_boards),
+            inclusive_list(1, n_channels)),
+        'slimstack2headstage': Adapters.Adapter(
+            slimstack_names(n_boards),
+            stack_boards(
+            wire64_slimstack2headstage_hs_sorted_by_slimstack_geometry, 
+            n_boards, 64)),
+        'nza_SSB6': Adapters.Adapter.stack(
+            [nza_SSB6_64] * n_boards, in_offsets=64, out_offsets=64),
+        # Each board has its own 80 Samtec pins and 64 MUX channels
+        'nanoz_mux2samtec': Adapters.Adapter.stack(
+            [nanoz_mux2samtec] * n_boards, in_offsets=64, out_offsets=80,
+            tag_symbols=True),
+        }
+    _wire_adapters[n_channels] = res
+    return res
+
+
 ## Adapter ON4
 # This is the Neuronexus A64-OM32x2 Adaptor
 # level 0 : Canonical Samtec ordering, looking into adaptor, top connector
@@ -288,34 +334,19 @@ ON4_omnetics2internal = Adapters.Adapter(
     inclusive_list(1, 72),
     ON4_internal_ordered_by_omnetics)
 
-# Invert the intermediate adapter and take the omnetics pins in the ordering
-# of ON4_level1_internal
-ON4_level2_omnetics = []
-for internal_pin in ON4_level1_internal:
-    # Try to invert the mapping to get the omnetics pin
-    try:
-        omnetics_pin = ON4_omnetics2internal.out2in[internal_pin]
-    except KeyError:
-        # e.g., 'HR' or whatever
-        omnetics_pin = 'X'
-
-    ON4_level2_omnetics.append(omnetics_pin)
-
-# Finally, drop all non-integer values from each list
-ON4_inputs_samtec = []
-ON4_outputs_omnetics = []
-assert len(ON4_level0_samtec) == 80
-assert len(ON4_level1_internal) == 80
+# Chain through the inverted intermediate adapter to get the omnetics pins
+# in the ordering of ON4_level1_internal. Internal pins that aren't on the
+# Omnetics (eg 'G') get 'X'.
+ON4_samtec2nn2omnetics = ON4_samtec2nn + ON4_omnetics2internal.inv
+ON4_level2_omnetics = ['X' if pin is None else pin
+    for pin in ON4_samtec2nn2omnetics.outs]
 assert len(ON4_level2_omnetics) == 80
-zobj = list(zip(ON4_level0_samtec, ON4_level1_internal, ON4_level2_omnetics))
-for val0, val1, val2 in zobj:
-    if type(val0) is str or type(val1) is str or type(val2) is str:
-        continue
-    else:
-        ON4_inputs_samtec.append(val0)
-        ON4_outputs_omnetics.append(val2)
 
-# Generate the adapter
+# Finally, drop the ground, reference and unconnected pins at any level,
+# and generate the adapter
+ON4_signal = ON4_samtec2nn2omnetics.drop_nonsignal()
+ON4_inputs_samtec = list(ON4_signal.ins)
+ON4_outputs_omnetics = list(ON4_signal.outs)
 ON4_samtec2omnetics = Adapters.Adapter(ON4_inputs_samtec, ON4_outputs_omnetics)
 
 
@@ -375,38 +406,18 @@ A64OM32x2sm_omnetics2internal = Adapters.Adapter(
     inclusive_list(1, 72),
     A64OM32x2sm_internal_ordered_by_omnetics)
 
-# Invert the intermediate adapter and take the omnetics pins in the ordering
-# of ON4_level1_internal
-A64OM32x2sm_level2_omnetics = []
-for internal_pin in A64OM32x2sm_level1_internal:
-    # Try to invert the mapping to get the omnetics pin
-    try:
-        omnetics_pin = A64OM32x2sm_omnetics2internal.out2in[internal_pin]
-    except KeyError:
-        # e.g., 'HR' or whatever
-        omnetics_pin = 'X'
-
-    A64OM32x2sm_level2_omnetics.append(omnetics_pin)
-
-# Finally, drop all non-integer values from each list
-A64OM32x2sm_inputs_samtec = []
-A64OM32x2sm_outputs_omnetics = []
-assert len(A64OM32x2sm_level0_samtec) == 80
-assert len(A64OM32x2sm_level1_internal) == 80
+# Chain through the inverted intermediate adapter to get the omnetics pins
+# in the ordering of A64OM32x2sm_level1_internal
+A64OM32x2sm_samtec2nn2omnetics = (
+    A64OM32x2sm_samtec2nn + A64OM32x2sm_omnetics2internal.inv)
+A64OM32x2sm_level2_omnetics = ['X' if pin is None else pin
+    for pin in A64OM32x2sm_samtec2nn2omnetics.outs]
 assert len(A64OM32x2sm_level2_omnetics) == 80
-zobj = list(zip(
-    A64OM32x2sm_level0_samtec, 
-    A64OM32x2sm_level1_internal, 
-    A64OM32x2sm_level2_omnetics,
-))
-for val0, val1, val2 in zobj:
-    if type(val0) is str or type(val1) is str or type(val2) is str:
-        continue
-    else:
-        A64OM32x2sm_inputs_samtec.append(val0)
-        A64OM32x2sm_outputs_omnetics.append(val2)
 
-# Generate the adapter
+# Finally, drop the unconnected pins at any level, and generate the adapter
+A64OM32x2sm_signal = A64OM32x2sm_samtec2nn2omnetics.drop_nonsignal()
+A64OM32x2sm_inputs_samtec = list(A64OM32x2sm_signal.ins)
+A64OM32x2sm_outputs_omnetics = list(A64OM32x2sm_signal.outs)
 A64OM32x2sm_samtec2omnetics = Adapters.Adapter(
     A64OM32x2sm_inputs_samtec, A64OM32x2sm_outputs_omnetics)
 
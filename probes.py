@@ -55,26 +55,5 @@ samtec2janelia_bottom = Adapters.Adapter(list(range(1, 41)), [
     ])    
 
 # A 64-channel version with two samtecs, 1-40 on the top and 41-80 on the bottom
-samtec2janelia_64ch = Adapters.Adapter(list(range(1, 81)),
-    [
-        1, 'NC', 'NC', 64,
-        2, 'NC', 'NC', 63,
-        3, 'NC', 'NC', 62,
-        4, 'NC', 'NC', 61,
-        5, 6, 59, 60,
-        7, 8, 57, 58,
-        9, 10, 55, 56,
-        11, 12, 53, 54,
-        13, 14, 51, 52,
-        15, 16, 49, 50,
-        17, 'NC', 'NC', 48,
-        18, 'NC', 'NC', 47,
-        19, 'NC', 'NC', 46,
-        20, 'NC', 'NC', 45,
-        21, 22, 43, 44,
-        23, 28, 37, 42,
-        24, 32, 33, 41,
-        25, 29, 36, 40,
-        26, 30, 35, 39,
-        27, 31, 34, 38,
-    ])
\ No newline at end of file
+samtec2janelia_64ch = Adapters.Adapter.stack(
+    [samtec2janelia_top, samtec2janelia_bottom], in_offsets=[0, 40])
@@ -0,0 +1,462 @@
+"""Reading and reordering raw recordings using a dataflow.
+
+Raw files (eg the .dat files saved during acquisition) are a flat array
+of samples, usually int16, interleaved by channel: every channel at the
+first timepoint, then every channel at the second timepoint, and so on.
+The channels are in acquisition order, which is the GUI order (or the
+headstage order 'hs' for the wire EIBs), minus one.
+
+The functions here memory-map the input and process it in chunks of
+timepoints, so memory use doesn't depend on the length of the recording.
+
+Usage from the command line:
+    python -m Adapters.raw reorder h3_ON4 input.dat output.dat
+    python -m Adapters.raw extract h12_128ch_assy_350 input.dat output.dat \
+        --select shank=A --select Z=0:300
+"""
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+import argparse
+import os
+import time
+import numpy as np
+
+from .base import Adapter, NONE_CODE, decode_column
+from . import dataflow as dataflow_module
+
+
+# Candidate columns, in order of preference
+ACQUISITION_COLUMNS = ['GUI', 'hs']
+ORDER_COLUMNS = ['Srt', 'site', 'Z', 'enum']
+
+# Default number of timepoints per chunk
+CHUNK_SAMPLES = 65536
+
+
+def get_dataflow(dataflow):
+    """Return the DataFrame `dataflow`, which may be given by name"""
+    if isinstance(dataflow, str):
+        return dataflow_module.get(dataflow)
+    return dataflow
+
+def _pick_column(df, column, candidates):
+    if column is not None:
+        return column
+    for candidate in candidates:
+        if candidate in df.columns:
+            return candidate
+    raise ValueError("dataflow has none of the columns {}".format(candidates))
+
+def acquisition_channels(dataflow, acq_col=None, base=1):
+    """Return the 0-based acquisition channel of each row of `dataflow`
+
+    acq_col : column with the acquisition channel numbers
+        If None, the first one of ACQUISITION_COLUMNS in `dataflow`
+    base : the number of the first channel in `acq_col`, ie 1 for GUI
+    """
+    df = get_dataflow(dataflow)
+    acq_col = _pick_column(df, acq_col, ACQUISITION_COLUMNS)
+    return df[acq_col].values.astype(int) - base
+
+def channel_order(dataflow, acq_col=None, order_col=None, base=1):
+    """Return the acquisition channels sorted geometrically
+
+    order_col : column to sort by, eg 'Srt' or 'Z'
+        If None, the first one of ORDER_COLUMNS in `dataflow`
+        Ties keep the order of the rows.
+
+    Returns : 1d int array
+        The 0-based acquisition channel of each output channel, ie the
+        column indices to take from a (time, channel) array of raw data.
+    """
+    df = get_dataflow(dataflow)
+    order_col = _pick_column(df, order_col, ORDER_COLUMNS)
+    acq = acquisition_channels(df, acq_col=acq_col, base=base)
+    return acq[np.argsort(df[order_col].values, kind='mergesort')]
+
+
+## Permutations between orderings
+# Permutations of the dataflows given by name, by (dataflow, src, dst)
+_permutations = {}
+
+def _column_values(dataflow, column):
+    if isinstance(dataflow, Adapter):
+        ncol = dataflow.column(column)
+        codes = dataflow.codes[:, ncol]
+        if dataflow.symbols[ncol] or np.any(codes == NONE_CODE):
+            return decode_column(codes, dataflow.symbols[ncol])
+        return codes
+    return dataflow[column].values
+
+def _channel_ranks(values):
+    """Return the position of each row when sorted by `values`, or -1
+    for the rows with no value (None or NaN), eg unconnected pins"""
+    if values.dtype.kind == 'O':
+        present = np.array([not (val is None or (
+            isinstance(val, float) and np.isnan(val))) for val in values],
+            dtype=bool)
+    elif values.dtype.kind == 'f':
+        present = ~np.isnan(values)
+    else:
+        present = np.ones(len(values), dtype=bool)
+    rows = np.flatnonzero(present)
+    ranks = np.full(len(values), -1, dtype=int)
+    ranks[rows[np.argsort(values[rows], kind='mergesort')]] = (
+        np.arange(len(rows)))
+    return ranks
+
+def permutation(dataflow, src='GUI', dst='Srt'):
+    """Return the permutation from the `src` ordering to the `dst` ordering
+
+    In the `src` ordering, the channels are sorted by their value in
+    column `src`, and likewise for `dst`. Ties keep the order of the rows.
+
+    dataflow : DataFrame or Adapter, or name of a dataflow
+        (see `dataflow.get`)
+    src, dst : columns, eg 'GUI', 'Intan', 'Srt', 'site', 'Prb' or 'Om'
+
+    Returns : read-only 1d int array `perm`
+        For data with channels in `src` order, np.take(data, perm, axis=-1)
+        has them in `dst` order. And the channel in position `perm[i]` in
+        `src` order is in position `i` in `dst` order.
+        `permutation(dataflow, dst, src)` is its inverse, which is
+        computed at the same time.
+        Rows with no value (None or NaN) in a column, eg unconnected
+        pins, are not channels of that ordering. Only the rows with a
+        value in both `src` and `dst` are in `perm`.
+
+    Cached if `dataflow` is given by name.
+    """
+    key = (dataflow, src, dst)
+    if isinstance(dataflow, str) and key in _permutations:
+        return _permutations[key]
+
+    df = get_dataflow(dataflow)
+
+    # Position of each row in the src and dst orderings, then the rows
+    # that are in both, in the order of the other one
+    src_ranks = _channel_ranks(_column_values(df, src))
+    dst_ranks = _channel_ranks(_column_values(df, dst))
+    both = (src_ranks >= 0) & (dst_ranks >= 0)
+    perm = src_ranks[both][np.argsort(dst_ranks[both])]
+    inverse = dst_ranks[both][np.argsort(src_ranks[both])]
+    perm.flags.writeable = False
+    inverse.flags.writeable = False
+
+    if isinstance(dataflow, str):
+        _permutations[key] = perm
+        _permutations[(dataflow, dst, src)] = inverse
+    return perm
+
+def memmap_raw(path, n_channels, dtype=np.int16, mode='r'):
+    """Memory-map a raw file as a (time, channel) array"""
+    data = np.memmap(path, dtype=dtype, mode=mode)
+    if len(data) % n_channels != 0:
+        raise ValueError("{} does not contain a whole number of samples "
+            "of {} channels".format(path, n_channels))
+    return data.reshape(-1, n_channels)
+
+def _chunk_starts(n_samples, chunk_samples, start=0):
+    return list(range(start, n_samples, chunk_samples))
+
+def _permute_chunk(data, start, stop, order, stages=()):
+    # Fancy indexing the memmap reads the rows and copies the columns
+    chunk = np.take(data[start:stop], order, axis=1)
+    for stage in stages:
+        chunk = stage(chunk)
+    return chunk
+
+def read_checkpoint(checkpoint_path):
+    """Return the number of timepoints recorded in a checkpoint file, or
+    0 if it doesn't exist"""
+    try:
+        with open(checkpoint_path) as fi:
+            return int(fi.read())
+    except (IOError, OSError, ValueError):
+        return 0
+
+def write_checkpoint(checkpoint_path, n_samples):
+    # Replace atomically so an interruption never leaves a partial file
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as fi:
+        fi.write(str(n_samples))
+    os.replace(tmp_path, checkpoint_path)
+
+def reorder_file(dataflow, input_path, output_path, n_channels=None,
+    dtype=np.int16, acq_col=None, order_col=None,
+    chunk_samples=CHUNK_SAMPLES, n_threads=0, verbose=False,
+    checkpoint_path=None, stages=()):
+    """Write a copy of a raw file with the channels in geometric order.
+
+    dataflow : DataFrame, or name of a dataflow (see `dataflow.get`)
+    input_path : raw file in acquisition order
+    output_path : where to write the raw file in geometric order
+        It will contain only the channels in `dataflow`
+    n_channels : number of channels in `input_path`
+        If None, the largest acquisition channel in `dataflow` + 1
+    dtype : dtype of the samples
+    acq_col, order_col : see `channel_order`
+    chunk_samples : number of timepoints read, permuted, and written at
+        a time. Memory use is a few chunks.
+    n_threads : if greater than 0, read and permute chunks in a pool of
+        this many threads while the previous ones are being written.
+    verbose : print the throughput at the end
+    checkpoint_path : if not None, the number of timepoints written so far
+        is saved in this file after every chunk. If it already exists, 
+        the output is resumed from that point instead of restarted. It
+        is written before the output is created, and deleted when the
+        output is complete.
+    stages : list of functions applied in turn to each permuted chunk,
+        of shape (time, channel) in geometric order, before it is written.
+        Each returns the new chunk, eg a `reference.Referencer`.
+
+    Returns : dict
+        Throughput report with keys 'n_samples', 'n_channels_in',
+        'n_channels_out', 'bytes_read', 'bytes_written', 'seconds',
+        'mb_per_s' (MB read per second), and 'resumed_from' (timepoint)
+    """
+    order = channel_order(dataflow, acq_col=acq_col, order_col=order_col)
+    if n_channels is None:
+        n_channels = order.max() + 1
+    data = memmap_raw(input_path, n_channels, dtype=dtype)
+    n_samples = data.shape[0]
+    itemsize = np.dtype(dtype).itemsize
+
+    # Resume from the checkpoint if there is one
+    resumed_from = 0
+    if checkpoint_path is not None and os.path.exists(output_path):
+        resumed_from = min(read_checkpoint(checkpoint_path), n_samples)
+    starts = _chunk_starts(n_samples, chunk_samples, start=resumed_from)
+
+    def write(output, chunk, stop):
+        chunk.tofile(output)
+        if checkpoint_path is not None:
+            output.flush()
+            write_checkpoint(checkpoint_path, min(stop, n_samples))
+
+    if checkpoint_path is not None and resumed_from == 0:
+        # Before the output exists, so that an output without a checkpoint
+        # is always complete (see batch.is_complete)
+        write_checkpoint(checkpoint_path, 0)
+
+    t_start = time.perf_counter()
+    with open(output_path, 'r+b' if resumed_from > 0 else 'wb') as output:
+        # Drop anything written after the checkpoint
+        output.truncate(resumed_from * len(order) * itemsize)
+        output.seek(0, os.SEEK_END)
+
+        if n_threads > 0:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(n_threads) as executor:
+                # Keep a bounded number of chunks in flight
+                pending = []
+                for start in starts:
+                    pending.append((start + chunk_samples, executor.submit(
+                        _permute_chunk,
+                        data, start, start + chunk_samples, order, stages)))
+                    if len(pending) > n_threads:
+                        stop, future = pending.pop(0)
+                        write(output, future.result(), stop)
+                for stop, future in pending:
+                    write(output, future.result(), stop)
+        else:
+            for start in starts:
+                write(output, _permute_chunk(
+                    data, start, start + chunk_samples, order, stages),
+                    start + chunk_samples)
+    seconds = time.perf_counter() - t_start
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    n_processed = n_samples - resumed_from
+    report = {
+        'n_samples': n_samples,
+        'n_channels_in': n_channels,
+        'n_channels_out': len(order),
+        'bytes_read': n_processed * n_channels * itemsize,
+        'bytes_written': n_processed * len(order) * itemsize,
+        'seconds': seconds,
+        'resumed_from': resumed_from,
+        }
+    report['mb_per_s'] = report['bytes_read'] / 1e6 / max(seconds, 1e-9)
+    if verbose:
+        print_report(report)
+    return report
+
+def select_rows(dataflow, select=None, order_col=None):
+    """Return the rows of `dataflow` selected in probe terms, sorted
+    geometrically.
+
+    select : dict of {column: condition}, or None to select everything
+        Each condition can be
+            a single value, eg {'shank': 'A'} or {'kcoord': 3}
+            a list or array of values, eg {'site': [0, 1, 2]}
+            a tuple (low, high), an inclusive range, eg {'Z': (0, 300)}
+        A row is selected if it meets every condition.
+    order_col : see `channel_order`
+    """
+    df = get_dataflow(dataflow)
+    mask = np.ones(len(df), dtype=bool)
+    for column, condition in (select or {}).items():
+        values = df[column].values
+        if isinstance(condition, tuple):
+            low, high = condition
+            mask &= (values >= low) & (values <= high)
+        elif isinstance(condition, (list, np.ndarray, set)):
+            mask &= np.isin(values, list(condition))
+        else:
+            mask &= values == condition
+
+    order_col = _pick_column(df, order_col, ORDER_COLUMNS)
+    selected = df[mask]
+    return selected.iloc[
+        np.argsort(selected[order_col].values, kind='mergesort')]
+
+def _coalesce(channels, max_gap):
+    """Split sorted unique `channels` into runs of (start, stop)
+
+    Channels less than `max_gap` apart are put in the same run, because
+    reading a few extra columns is cheaper than another strided read.
+    """
+    if len(channels) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(channels) > max_gap) + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(channels)]])
+    return [(channels[start], channels[stop - 1] + 1)
+        for start, stop in zip(starts, stops)]
+
+def read_channels(dataflow, input_path, select=None, n_channels=None,
+    dtype=np.int16, acq_col=None, order_col=None, start=0, stop=None,
+    chunk_samples=CHUNK_SAMPLES, max_gap=8):
+    """Read only some probe sites from a raw file.
+
+    The selection is made in probe terms (see `select_rows`) and resolved
+    through the dataflow to acquisition channels. Only the spans of the
+    file that hold those channels are read, as strided views of the
+    memmap, one run of nearby channels at a time.
+
+    Since the file is interleaved, the disk still has to deliver whole
+    pages, so this helps most when the selected channels are close to
+    each other in acquisition order and the file has many channels.
+
+    dataflow : DataFrame, or name of a dataflow (see `dataflow.get`)
+    input_path : raw file in acquisition order
+    select : dict, see `select_rows`
+    n_channels, dtype, acq_col : see `reorder_file`
+    order_col : see `channel_order`
+    start, stop : range of timepoints to read
+    chunk_samples : number of timepoints to read at a time
+    max_gap : channels closer than this are read in a single run
+
+    Returns : array of shape (time, selected channel)
+        The channels are in geometric order, like `select_rows`
+    """
+    df = get_dataflow(dataflow)
+    rows = select_rows(df, select, order_col=order_col)
+    channels = acquisition_channels(rows, acq_col=acq_col)
+    if n_channels is None:
+        n_channels = acquisition_channels(df, acq_col=acq_col).max() + 1
+    data = memmap_raw(input_path, n_channels, dtype=dtype)
+    if stop is None:
+        stop = data.shape[0]
+
+    # Read each run of channels once, and scatter it to the output
+    unique_channels = np.unique(channels)
+    runs = []
+    for run_start, run_stop in _coalesce(unique_channels, max_gap):
+        wanted = np.flatnonzero(
+            (channels >= run_start) & (channels < run_stop))
+        runs.append((run_start, run_stop, wanted, channels[wanted] - run_start))
+
+    res = np.empty((max(stop - start, 0), len(channels)), dtype=dtype)
+    for chunk_start in _chunk_starts(stop, chunk_samples, start=start):
+        chunk_stop = min(chunk_start + chunk_samples, stop)
+        out = res[chunk_start - start:chunk_stop - start]
+        for run_start, run_stop, wanted, columns in runs:
+            block = data[chunk_start:chunk_stop, run_start:run_stop]
+            out[:, wanted] = block[:, columns]
+    return res
+
+def print_report(report):
+    print("{} samples x {} channels -> {} channels: {:.1f} MB in {:.2f} s, "
+        "{:.1f} MB/s".format(report['n_samples'], report['n_channels_in'],
+        report['n_channels_out'], report['bytes_read'] / 1e6,
+        report['seconds'], report['mb_per_s']))
+
+
+## Command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m Adapters.raw', description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    reorder = subparsers.add_parser('reorder',
+        help='write a copy of a raw file with channels in geometric order')
+    reorder.add_argument('dataflow', help="name of the dataflow, eg h3_ON4")
+    reorder.add_argument('input_path')
+    reorder.add_argument('output_path')
+    reorder.add_argument('--n-channels', type=int, default=None)
+    reorder.add_argument('--dtype', default='int16')
+    reorder.add_argument('--acq-col', default=None)
+    reorder.add_argument('--order-col', default=None)
+    reorder.add_argument('--chunk-samples', type=int, default=CHUNK_SAMPLES)
+    reorder.add_argument('--threads', type=int, default=0)
+    reorder.add_argument('--reference', choices=['median', 'mean'],
+        default=None, help='reference each channel within its group')
+
+    extract = subparsers.add_parser('extract',
+        help='write only some probe sites of a raw file, in geometric order')
+    extract.add_argument('dataflow', help="name of the dataflow, eg h3_ON4")
+    extract.add_argument('input_path')
+    extract.add_argument('output_path')
+    extract.add_argument('--select', action='append', default=[],
+        metavar='COLUMN=VALUE',
+        help="eg shank=A, kcoord=3,4 or Z=0:300 (inclusive range)")
+    extract.add_argument('--n-channels', type=int, default=None)
+    extract.add_argument('--dtype', default='int16')
+
+    args = parser.parse_args(argv)
+    if args.command == 'reorder':
+        kwargs = dict(n_channels=args.n_channels, dtype=args.dtype,
+            acq_col=args.acq_col, order_col=args.order_col,
+            chunk_samples=args.chunk_samples, n_threads=args.threads,
+            verbose=True)
+        if args.reference is None:
+            reorder_file(args.dataflow, args.input_path, args.output_path,
+                **kwargs)
+        else:
+            from . import reference
+            reference.reference_file(args.dataflow, args.input_path,
+                args.output_path, method=args.reference, **kwargs)
+    elif args.command == 'extract':
+        select = dict(_parse_select(arg) for arg in args.select)
+        read_channels(args.dataflow, args.input_path, select=select,
+            n_channels=args.n_channels, dtype=args.dtype).tofile(
+            args.output_path)
+
+def _parse_value(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+def _parse_select(arg):
+    """Parse 'column=value', 'column=v1,v2' or 'column=low:high'"""
+    column, value = arg.split('=', 1)
+    if ':' in value:
+        low, high = value.split(':', 1)
+        return column, (_parse_value(low), _parse_value(high))
+    if ',' in value:
+        return column, [_parse_value(val) for val in value.split(',')]
+    return column, _parse_value(value)
+
+
+if __name__ == '__main__':
+    main()
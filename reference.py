@@ -0,0 +1,274 @@
+"""Re-referencing raw data within groups of channels.
+
+Each channel is referenced to the median (or mean) of the channels in its
+group: the tetrode ('kcoord') for the wire EIBs, the shank ('shank') for
+dbc H12, or all channels if the dataflow has no groups (see
+`geometry.groups`).
+
+A `Referencer` works out the group of every column once, and then
+references arrays of shape (time, channel) in place, one block of
+timepoints at a time, with buffers that are allocated only once. The same
+object is used on in-memory arrays and as a stage of `raw.reorder_file`:
+    reference_file('wire128_big_dataflow', 'in.dat', 'out.dat')
+"""
+from __future__ import division
+from __future__ import absolute_import
+import threading
+import numpy as np
+
+from . import geometry
+from . import raw
+
+
+METHODS = ['median', 'mean']
+
+
+class Referencer(object):
+    """Subtracts the median or mean of each group from its channels
+
+    Call it on an array of shape (time, channel) to reference it in place.
+    """
+    def __init__(self, labels, method='median', block_samples=None):
+        """Work out the groups
+
+        labels : the group of each column of the arrays, as ints
+            Columns labeled -1 are left alone.
+        method : 'median' or 'mean'
+        block_samples : number of timepoints referenced at a time, which
+            sets the size of the buffers. By default raw.CHUNK_SAMPLES.
+        """
+        if method not in METHODS:
+            raise ValueError("method must be one of {}".format(METHODS))
+        self.method = method
+        self.block_samples = block_samples or raw.CHUNK_SAMPLES
+        self.labels = np.asarray(labels, dtype=int)
+
+        # The referenced columns, sorted by group
+        columns = np.flatnonzero(self.labels >= 0)
+        self.columns = columns[
+            np.argsort(self.labels[columns], kind='mergesort')]
+        sorted_labels = self.labels[self.columns]
+        self.starts = np.flatnonzero(
+            np.diff(sorted_labels, prepend=-2) != 0)
+        self.sizes = np.diff(np.append(self.starts, len(self.columns)))
+        self.n_groups = len(self.starts)
+        self.equal_sizes = bool(np.all(self.sizes == self.sizes[:1]))
+
+        # Group of each referenced column, in self.columns order
+        self.column_group = np.repeat(np.arange(self.n_groups), self.sizes)
+
+        # If the groups are contiguous, work on views instead of copies.
+        # Otherwise the columns are gathered in this order, which puts
+        # the referenced ones first, and scattered back afterwards.
+        self.contiguous = bool(np.all(
+            self.columns == np.arange(len(self.columns)) + (
+                self.columns[0] if len(self.columns) else 0)))
+        self.permutation = np.concatenate(
+            [self.columns, np.flatnonzero(self.labels < 0)])
+        self.inverse = np.argsort(self.permutation)
+
+        # One set of buffers per thread, made on first use
+        self._local = threading.local()
+
+    @classmethod
+    def from_dataflow(cls, dataflow, method='median', columns=None,
+        group_col=None, acq_col=None, **kwargs):
+        """Build from the groups of a dataflow
+
+        dataflow : DataFrame, or name of a dataflow (see `dataflow.get`)
+        columns : the 0-based acquisition channel of each column of the
+            arrays. If None, the arrays are in acquisition order, as in a
+            raw file. Use `raw.channel_order` for arrays in geometric order.
+            Acquisition channels that aren't in the dataflow are left alone.
+        group_col : see `geometry.groups`
+        acq_col : see `raw.acquisition_channels`
+        """
+        acq = raw.acquisition_channels(dataflow, acq_col=acq_col)
+        groups = geometry.groups(dataflow, group_col)
+        if columns is None:
+            columns = np.arange(acq.max() + 1)
+        columns = np.asarray(columns, dtype=int)
+
+        lut = np.full(max(acq.max(), columns.max()) + 1, -1, dtype=int)
+        lut[acq] = groups
+        return cls(lut[columns], method=method, **kwargs)
+
+    def __getstate__(self):
+        # Buffers are not pickled, eg when sent to another process
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _buffers(self, n_samples, dtype):
+        """Return (gathered, scratch, ref, res) buffers for a block of
+        `n_samples` timepoints of `dtype`"""
+        local = self._local
+        if getattr(local, 'dtype', None) is None or local.dtype != dtype:
+            # Integers are referenced as float32, which is exact for int16
+            float_dtype = np.result_type(dtype, np.float32)
+            n_samples_max = self.block_samples
+            local.dtype = dtype
+            local.gathered = np.empty(
+                (0 if self.contiguous else n_samples_max, len(self.labels)),
+                dtype=dtype)
+            local.scratch = np.empty(
+                (n_samples_max if self.method == 'median' else 0,
+                len(self.columns)), dtype=dtype)
+            local.ref = np.empty(
+                (n_samples_max, self.n_groups), dtype=float_dtype)
+            local.res = np.empty(
+                (n_samples_max, len(self.columns)), dtype=float_dtype)
+        return (local.gathered[:n_samples], local.scratch[:n_samples],
+            local.ref[:n_samples], local.res[:n_samples])
+
+    def reference(self, block, ref):
+        """Write the median or mean of each group of `block` into `ref`
+
+        block : array of the referenced columns, sorted by group
+            With 'median', it is overwritten.
+        ref : float array of shape (time, group)
+        """
+        if self.equal_sizes:
+            # Groups of equal size, eg tetrodes, all at once
+            of_groups = (_mean_of_groups if self.method == 'mean' else
+                _median_of_groups)
+            of_groups(block.reshape(len(block), self.n_groups, -1), ref)
+        elif self.method == 'mean':
+            np.add.reduceat(block, self.starts, axis=1, dtype=ref.dtype,
+                out=ref)
+            ref /= self.sizes
+        else:
+            for group, (start, size) in enumerate(
+                    zip(self.starts, self.sizes)):
+                _median_of_groups(
+                    block[:, start:start + size, None].transpose(0, 2, 1),
+                    ref[:, group:group + 1])
+        return ref
+
+    def __call__(self, data):
+        """Reference `data` in place, and return it
+
+        data : array of shape (time, channel)
+            Integer data is rounded and clipped to its dtype.
+        """
+        if self.n_groups == 0:
+            return data
+        dtype = data.dtype
+        is_int = dtype.kind in 'iu'
+
+        for start in range(0, len(data), self.block_samples):
+            chunk = data[start:start + self.block_samples]
+            gathered, scratch, ref, res = self._buffers(len(chunk), dtype)
+            if self.contiguous:
+                source = chunk[:, self.columns[0]:self.columns[-1] + 1]
+            else:
+                np.take(chunk, self.permutation, axis=1, out=gathered)
+                source = gathered[:, :len(self.columns)]
+
+            # The median overwrites its input, so give it a copy
+            if self.method == 'median':
+                scratch[...] = source
+                self.reference(scratch, ref)
+            else:
+                self.reference(source, ref)
+            if is_int:
+                np.rint(ref, out=ref)
+
+            if self.equal_sizes:
+                # Broadcast the reference of each group over its channels
+                shape = (len(chunk), self.n_groups, -1)
+                np.subtract(source.reshape(shape), ref[:, :, None],
+                    out=res.reshape(shape))
+            else:
+                np.take(ref, self.column_group, axis=1, out=res)
+                np.subtract(source, res, out=res)
+            if is_int:
+                info = np.iinfo(dtype)
+                np.clip(res, info.min, info.max, out=res)
+
+            source[...] = res
+            if not self.contiguous:
+                np.take(gathered, self.inverse, axis=1, out=chunk)
+        return data
+
+# Groups up to this size are reduced one column at a time
+SMALL_GROUP = 8
+
+def _mean_of_groups(block, out):
+    """Write the mean along the last axis of `block` into `out`
+
+    block : array of shape (time, group, channel)
+    out : float array of shape (time, group)
+    """
+    size = block.shape[2]
+    if size <= SMALL_GROUP:
+        # Reducing along a short axis is slow, so add whole columns
+        out[...] = block[:, :, 0]
+        for ncol in range(1, size):
+            out += block[:, :, ncol]
+    else:
+        np.sum(block, axis=2, dtype=out.dtype, out=out)
+    out /= size
+    return out
+
+def _median_of_groups(block, out):
+    """Write the median along the last axis of `block` into `out`
+
+    block : array of shape (time, group, channel), which is overwritten
+    out : float array of shape (time, group)
+
+    np.median partitions each row separately, which is slow for rows of
+    a few channels. Instead, small groups use min and max across whole
+    columns, and larger groups are sorted in place, which numpy does
+    with SIMD instructions.
+    """
+    size = block.shape[2]
+    columns = [block[:, :, ncol] for ncol in range(min(size, 4))]
+    if size == 1:
+        out[...] = columns[0]
+        return out
+    elif size == 2:
+        low, high = columns
+    elif size == 3:
+        aa, bb, cc = columns
+        low = high = np.maximum(np.minimum(aa, bb),
+            np.minimum(np.maximum(aa, bb), cc))
+    elif size == 4:
+        aa, bb, cc, dd = columns
+        low = np.maximum(np.minimum(aa, bb), np.minimum(cc, dd))
+        high = np.minimum(np.maximum(aa, bb), np.maximum(cc, dd))
+    else:
+        block.sort(axis=2)
+        low = block[:, :, (size - 1) // 2]
+        high = block[:, :, size // 2]
+    np.add(low, high, out=out, dtype=out.dtype)
+    out *= 0.5
+    return out
+
+def reference_array(data, dataflow, method='median', columns=None,
+    group_col=None, acq_col=None):
+    """Reference an in-memory array of shape (time, channel) in place
+
+    See `Referencer.from_dataflow` for the arguments.
+    """
+    return Referencer.from_dataflow(dataflow, method=method,
+        columns=columns, group_col=group_col, acq_col=acq_col)(data)
+
+def reference_file(dataflow, input_path, output_path, method='median',
+    group_col=None, acq_col=None, order_col=None, **kwargs):
+    """Write a copy of a raw file in geometric order, referenced
+
+    Like `raw.reorder_file`, to which the other kwargs are passed, with
+    a Referencer as a stage applied to each chunk.
+    """
+    stage = Referencer.from_dataflow(dataflow, method=method,
+        columns=raw.channel_order(
+            dataflow, acq_col=acq_col, order_col=order_col),
+        group_col=group_col, acq_col=acq_col,
+        block_samples=kwargs.get('chunk_samples'))
+    return raw.reorder_file(dataflow, input_path, output_path,
+        acq_col=acq_col, order_col=order_col, stages=[stage], **kwargs)
@@ -0,0 +1,186 @@
+"""Routes between naming systems, found in a graph of adapters.
+
+Each naming system of channels (probe site, Samtec pin, Omnetics pin,
+Intan channel, GUI number, and for the wire EIBs EIB number, EIB name,
+headstage channel, MUX channel and SlimStack pin) is a level. Each adapter
+in `probes`, `probe_adapters` and `headstages` is an edge between two
+levels, which can be followed in either direction.
+
+`route` finds the path between two levels and chains its adapters into
+one Adapter, with a column for each level on the way, eg
+    route('janelia', 'gui', via='ON4').map([1, 2, 3])
+
+Where there is a choice of adapter, eg between the ON2 and the ON4 from
+Samtec to Omnetics, the edges are named and `via` chooses between them.
+Most edges are only used when they are named in `via`. The default edges
+are the ones that are always there, like the Intan headstage.
+
+Routes are chained once and cached, until `register` adds an edge.
+"""
+from __future__ import absolute_import
+import collections
+
+from .base import Adapter, FrozenAdapter
+from . import headstages
+from . import probe_adapters
+from . import probes
+
+
+Edge = collections.namedtuple(
+    'Edge', ['src', 'dst', 'name', 'adapter', 'default'])
+
+# Edges in order of registration, which breaks ties between routes
+_edges = []
+
+# Chained routes, by (src, dst, via)
+_routes = {}
+
+
+def register(src, dst, adapter, name, default=False):
+    """Add an adapter from level `src` to level `dst` to the graph
+
+    name : the name that selects this edge in `via`. Several edges can
+        have the same name, eg both adapters of the Plexon.
+    default : if True, the edge is used without being named in `via`.
+        There can be only one default edge between two levels.
+    """
+    if default and any(edge.default and set([edge.src, edge.dst]) == set(
+            [src, dst]) for edge in _edges):
+        raise ValueError("there already is a default edge between {!r} and "
+            "{!r}".format(src, dst))
+    _edges.append(Edge(src, dst, name, adapter, default))
+    _routes.clear()
+
+def levels():
+    """Return the names of all levels"""
+    return sorted(set(
+        level for edge in _edges for level in (edge.src, edge.dst)))
+
+def edge_names():
+    """Return the names that can be used in `via`"""
+    return sorted(set(edge.name for edge in _edges))
+
+def path(src, dst, via=()):
+    """Return the shortest path from level `src` to level `dst`
+
+    via : name or list of names of edges that the path must use
+        Between two levels joined by a named edge, only the named edges
+        are used, otherwise only the default ones.
+
+    Returns : list of (Edge, forward)
+        forward is False for edges that are followed from dst to src
+    """
+    via = _as_tuple(via)
+    unknown = set(via) - set(edge_names())
+    if unknown:
+        raise KeyError("no edges named {}".format(sorted(unknown)))
+    if src == dst:
+        raise ValueError("src and dst are the same level")
+
+    # Pairs of levels where a named edge replaces the default one
+    named_pairs = set(frozenset([edge.src, edge.dst])
+        for edge in _edges if edge.name in via)
+    usable = [edge for edge in _edges if edge.name in via or (
+        edge.default and frozenset([edge.src, edge.dst]) not in named_pairs)]
+
+    # Breadth first search over (level, names used so far), so that the
+    # shortest path that uses every name in `via` is found
+    start = (src, frozenset())
+    goal = (dst, frozenset(via))
+    previous = {start: None}
+    queue = collections.deque([start])
+    while queue:
+        state = queue.popleft()
+        if state == goal:
+            break
+        level, used = state
+        for edge in usable:
+            for forward, here, there in [
+                    (True, edge.src, edge.dst), (False, edge.dst, edge.src)]:
+                if here != level:
+                    continue
+                next_state = (there, used | (
+                    frozenset([edge.name]) & frozenset(via)))
+                if next_state not in previous:
+                    previous[next_state] = (state, edge, forward)
+                    queue.append(next_state)
+    else:
+        raise ValueError("no route from {!r} to {!r}{}".format(src, dst,
+            " via {}".format(list(via)) if via else
+            ", it may need one of {} in via".format(edge_names())))
+
+    res = []
+    state = goal
+    while previous[state] is not None:
+        state, edge, forward = previous[state]
+        res.append((edge, forward))
+    return res[::-1]
+
+def route(src, dst, via=()):
+    """Return the Adapter from level `src` to level `dst`
+
+    via : see `path`
+
+    Returns : FrozenAdapter
+        With a column for each level on the way, named after it. Use
+        `lookup` to go between any two of them, and `thaw` for a mutable
+        copy. It is cached, with its indexes.
+    """
+    key = (src, dst, _as_tuple(via))
+    if key not in _routes:
+        edges = path(src, dst, via)
+        res = Adapter.chain(*[edge.adapter if forward else edge.adapter.inv
+            for edge, forward in edges])
+        _routes[key] = FrozenAdapter(res, names=[src] + [
+            edge.dst if forward else edge.src for edge, forward in edges])
+    return _routes[key]
+
+def _as_tuple(via):
+    if isinstance(via, str):
+        return (via,)
+    return tuple(sorted(via))
+
+
+## The adapters
+# Probes, from Samtec pins to probe sites
+register('samtec', 'nn', probes.samtec2nn, 'A32', default=True)
+register('samtec', 'janelia', probes.samtec2janelia_64ch, 'janelia_64ch',
+    default=True)
+register('samtec', 'janelia', probes.samtec2janelia_top, 'janelia_top')
+register('samtec', 'janelia', probes.samtec2janelia_bottom, 'janelia_bottom')
+
+# Probe adapters, from Samtec pins to Omnetics pins
+register('samtec', 'omnetics', probe_adapters.samtecflipped2omnetics, 'ON1')
+register('samtec', 'omnetics', probe_adapters.ON2_samtec2omnetics, 'ON2')
+register('samtec', 'omnetics', probe_adapters.ON4_samtec2omnetics, 'ON4')
+register('samtec', 'omnetics',
+    probe_adapters.A64OM32x2sm_samtec2omnetics, 'A64OM32x2sm')
+register('samtec', 'plexon',
+    probe_adapters.plexon64ch_samtec2plexonnumbers, 'plexon')
+register('omnetics', 'plexon',
+    probe_adapters.plexon64ch_omnetics2plexonnumbers, 'plexon')
+
+# Headstages. The 64 channel versions start with the 32 channel ones.
+register('omnetics', 'intan', headstages.omnetics2intan_64ch, 'intan',
+    default=True)
+register('omnetics', 'intan', headstages.omnetics2rhd2164, 'rhd2164')
+register('intan', 'gui', headstages.intan2gui_64ch_range, 'gui',
+    default=True)
+
+# Wire EIBs, 64 channels by default. See probe_adapters.wire_adapters for
+# more boards.
+register('enum', 'ename', probe_adapters.wire64_eib_numbers2names, 'wire64',
+    default=True)
+register('ename', 'hs', probe_adapters.wire64_eib_names2headstage, 'wire64',
+    default=True)
+register('slimstack', 'hs', probe_adapters.wire64_slimstack2headstage,
+    'wire64', default=True)
+register('mux', 'hs', probe_adapters.nza_SSB6_64, 'wire64', default=True)
+register('mux', 'samtec', probe_adapters.nanoz_mux2samtec, 'nanoz')
+register('enum', 'ename', probe_adapters.wire128_eib_numbers2names,
+    'wire128')
+register('ename', 'hs', probe_adapters.wire128_eib_names2headstage,
+    'wire128')
+register('slimstack', 'hs', probe_adapters.wire128_slimstack2headstage,
+    'wire128')
+register('mux', 'hs', probe_adapters.nza_SSB6_128, 'wire128')
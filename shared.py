@@ -0,0 +1,281 @@
+"""Dataflows in shared memory, for many worker processes.
+
+Every process that calls `dataflow.get` builds its own copy of each
+dataflow, and of the indexes that look channels up in it. With many
+acquisition or sorting workers on one machine, that is the same tables
+built and held again in every worker. Instead, one process publishes them
+once:
+    store = shared.publish()
+and each worker attaches to them by name:
+    shared.attach(store.name)
+after which `dataflow.get` returns the shared ones in that worker.
+
+Everything is stored as arrays in one block of shared memory (or in a
+file, with `path`), and attaching makes read-only NumPy views of it
+without copying or building anything:
+    Adapters become FrozenAdapters, whose codes and ColumnIndexes are
+        views of the block, so `map`, `lookup` and `inv` are ready to use
+    DataFrames have their numeric columns as views of the block. Columns
+        of strings (eg 'ename') are decoded in each worker.
+
+The publishing process owns the block. It must keep the store open while
+workers use it, and then call `unlink` (or use it as a context manager).
+"""
+from __future__ import absolute_import
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+from .base import Adapter, ColumnIndex, FrozenAdapter
+from . import cache
+from . import dataflow
+
+
+# The block starts with SHARED_MAGIC and the length of a JSON directory
+# as a little-endian uint64, followed by the directory and then the
+# arrays, each one aligned to SHARED_ALIGN bytes
+SHARED_MAGIC = b'ADSHARE1'
+SHARED_ALIGN = 64
+_PREFIX = struct.Struct('<8sQ')
+
+
+class SharedStore(object):
+    """Dataflows published in shared memory or in a file
+
+    Returned by `publish` and `attach`. `name` is what workers pass to
+    `attach`.
+    """
+    def __init__(self, buf, directory, name, shm=None, mapped=None):
+        self.buf = buf
+        self.directory = directory
+        self.name = name
+        self._shm = shm
+        self._mmap = mapped
+        self._objects = {}
+        # Names that `install` put into dataflow._built
+        self._installed = []
+
+    def __repr__(self):
+        return "SharedStore({!r}, {} dataflows, {} bytes)".format(
+            self.name, len(self.directory), len(self.buf))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+    def names(self):
+        """Return the names of the dataflows in the store"""
+        return sorted(self.directory)
+
+    def _array(self, entry):
+        offset, dtype, shape = entry
+        res = np.ndarray(tuple(shape), dtype=np.dtype(dtype),
+            buffer=self.buf, offset=offset)
+        res.flags.writeable = False
+        return res
+
+    def get(self, name):
+        """Return dataflow `name`, as views of the store"""
+        if name not in self._objects:
+            entry = self.directory[name]
+            arrays = dict((key, self._array(val))
+                for key, val in entry['arrays'].items())
+            if entry['kind'] == 'adapter':
+                res = _adapter_from_arrays(entry, arrays)
+            else:
+                res = cache.frame_from_arrays(arrays, copy=False)
+            self._objects[name] = res
+        return self._objects[name]
+
+    def install(self):
+        """Make `dataflow.get` return the dataflows of this store"""
+        for name in self.directory:
+            dataflow._built[name] = self.get(name)
+            self._installed.append(name)
+
+    def uninstall(self):
+        """Make `dataflow.get` build the dataflows again, as before
+        `install`. Done by `close`."""
+        for name in self._installed:
+            # Unless they were replaced since
+            if dataflow._built.get(name) is self._objects.get(name):
+                del dataflow._built[name]
+        self._installed = []
+
+    def close(self):
+        """Stop using the store in this process
+
+        The views that were returned by `get` must not be used anymore.
+        `dataflow.get` no longer returns them.
+        """
+        self.uninstall()
+        self._objects.clear()
+        if self._mmap is not None:
+            self.buf.release()
+            self._mmap.close()
+        if self._shm is not None:
+            self._shm.close()
+        self.buf = None
+
+    def unlink(self):
+        """Close, and free the shared memory, in the publishing process"""
+        shm = self._shm
+        self.close()
+        if shm is not None:
+            shm.unlink()
+
+
+## Adapters as arrays, with their indexes
+def _adapter_to_arrays(adapter):
+    """Return (metadata, arrays) of an adapter and the ColumnIndex of
+    each of its columns"""
+    meta = {
+        'symbols': [list(col_symbols) for col_symbols in adapter.symbols],
+        'names': adapter.names,
+        'n_duplicates': [],
+        }
+    arrays = {'codes': adapter.codes}
+    for ncol in range(adapter.ncols):
+        index = adapter._index(ncol)
+        meta['n_duplicates'].append(int(index.n_duplicates))
+        arrays['keys{}'.format(ncol)] = index.keys
+        arrays['rows{}'.format(ncol)] = index.rows
+        if index.lut is not None:
+            arrays['lut{}'.format(ncol)] = index.lut
+    return meta, arrays
+
+def _adapter_from_arrays(entry, arrays):
+    symbols = [tuple(col_symbols) for col_symbols in entry['symbols']]
+    res = FrozenAdapter._frozen(arrays['codes'], symbols, entry['names'])
+    for ncol in range(res.ncols):
+        res._cache[('index', ncol, 'last')] = ColumnIndex.from_arrays(
+            arrays['keys{}'.format(ncol)], arrays['rows{}'.format(ncol)],
+            arrays.get('lut{}'.format(ncol)), symbols[ncol],
+            n_duplicates=entry['n_duplicates'][ncol])
+    return res
+
+
+## Publishing and attaching
+def publish(names=None, path=None, shm_name=None):
+    """Build dataflows and copy them into shared memory or a file
+
+    names : names of dataflows, see `dataflow.get`. By default all of
+        `dataflow.names()`.
+    path : if given, write a file there instead, which workers memory-map.
+        This works across machines on a shared filesystem, and survives
+        the publishing process.
+    shm_name : name of the shared memory block, or None for a random one
+
+    Returns : SharedStore, whose `name` is passed to `attach`
+    """
+    if names is None:
+        names = dataflow.names()
+
+    # Work out the layout before allocating the block
+    directory = {}
+    chunks = []
+    for name in names:
+        obj = dataflow.get(name)
+        if isinstance(obj, Adapter):
+            entry, arrays = _adapter_to_arrays(obj)
+            entry['kind'] = 'adapter'
+        else:
+            entry, arrays = {'kind': 'frame'}, cache.frame_to_arrays(obj)
+        entry['arrays'] = {}
+        for key, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            entry['arrays'][key] = [None, arr.dtype.str, list(arr.shape)]
+            chunks.append((entry['arrays'][key], arr))
+        directory[name] = entry
+
+    # The offsets are in the directory, so its size depends on them. Pad
+    # it generously and lay out the arrays after it.
+    header_size = _PREFIX.size + len(json.dumps(directory)) + (
+        24 * len(chunks))
+    offset = header_size
+    for layout, arr in chunks:
+        offset += -offset % SHARED_ALIGN
+        layout[0] = offset
+        offset += arr.nbytes
+    header = json.dumps(directory).encode('utf-8')
+    assert _PREFIX.size + len(header) <= header_size
+    size = max(offset, 1)
+
+    if path is not None:
+        with open(path, 'wb') as fi:
+            fi.truncate(size)
+        store = _open_file(path, write=True)
+    else:
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(
+            name=shm_name, create=True, size=size)
+        store = SharedStore(shm.buf, directory, shm.name, shm=shm)
+
+    buf = store.buf
+    buf[:_PREFIX.size] = _PREFIX.pack(SHARED_MAGIC, len(header))
+    buf[_PREFIX.size:_PREFIX.size + len(header)] = header
+    for (offset, dtype, shape), arr in chunks:
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=buf,
+            offset=offset)[...] = arr
+    if path is not None:
+        # Reopen read-only, like the workers
+        store.close()
+        store = _open_file(path)
+    return store
+
+def _read_directory(buf):
+    magic, length = _PREFIX.unpack_from(buf)
+    if magic != SHARED_MAGIC:
+        raise ValueError("not a store of shared dataflows")
+    return json.loads(bytes(buf[_PREFIX.size:_PREFIX.size + length]))
+
+def _open_file(path, write=False):
+    with open(path, 'r+b' if write else 'rb') as fi:
+        mapped = mmap.mmap(fi.fileno(), 0,
+            access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+    buf = memoryview(mapped)
+    directory = {} if write else _read_directory(buf)
+    return SharedStore(buf, directory, path, mapped=mapped)
+
+def _attach_shm(name):
+    from multiprocessing import shared_memory
+    try:
+        # Python 3.13 and later
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Workers started by the publishing process share its resource tracker,
+    # and must leave the block registered there. Otherwise this process
+    # has its own tracker, which would free the block when it exits,
+    # although the publishing process owns it.
+    from multiprocessing import resource_tracker
+    inherited = getattr(
+        resource_tracker._resource_tracker, '_fd', None) is not None
+    shm = shared_memory.SharedMemory(name=name)
+    if not inherited:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+def attach(name, install=True):
+    """Attach to dataflows published by `publish`
+
+    name : the `name` of the published SharedStore, ie the name of the
+        shared memory block, or the path of the file
+    install : if True, `dataflow.get` returns the shared dataflows in
+        this process from now on
+
+    Returns : SharedStore
+    """
+    if os.path.isfile(name):
+        store = _open_file(name)
+    else:
+        shm = _attach_shm(name)
+        store = SharedStore(
+            shm.buf, _read_directory(shm.buf), name, shm=shm)
+    if install:
+        store.install()
+    return store
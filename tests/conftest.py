@@ -0,0 +1,7 @@
+"""The tests import the package as `Adapters`, from the directory that
+contains this checkout, or from anywhere else on the path."""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
@@ -0,0 +1,334 @@
+import copy
+import pickle
+import threading
+
+import numpy as np
+import pytest
+
+from Adapters import Adapter, FrozenAdapter, RangeAdapter, base
+from Adapters import pin_class, SIGNAL, GROUND, REFERENCE, NOCONNECT
+
+
+## Looking up channel ids
+def test_getitem():
+    a = Adapter([1, 2, 'GND'], [10, 20, 30])
+    assert a[2] == 20
+    assert a['GND'] == 30
+    assert a[99] is None
+    assert list(a[[1, 'GND']]) == [10, 30]
+    with pytest.raises(KeyError):
+        a[[1, 99]]
+
+def test_float_ids():
+    # Channel ids taken from DataFrame columns are often floats
+    a = Adapter(np.array([0., 20., 40.]), [5, 6, 7])
+    assert a[20] == 6
+    assert a[20.] == 6
+    assert list(a[[0, 20]]) == [5, 6]
+    assert list(a[np.array([0., 20.])]) == [5, 6]
+    assert list(a.map([0., 20.])) == [5, 6]
+    assert a.lookup(0, 1, 20.) == 6
+    assert list(a.lookup(0, 1, [20.])) == [6]
+    assert list(a.inv.map([5, 7])) == [0, 40]
+
+    b = Adapter([0.5, 1, -1., 'x'], [1, 2, 3, 4])
+    assert list(b[[0.5, 1., -1, 'x']]) == [1, 2, 3, 4]
+
+
+## Pickling and the binary format
+@pytest.mark.parametrize('adapter', [
+    Adapter([1, 2, 'GND', None], [10, 20, 30, 40]),
+    Adapter([('A', 1), ('A', 2), ('B', 1)], [10, 20, 30]),
+    Adapter([b'a', b'b'], [1.5, 2.5], coded=True),
+    Adapter([1, 2, 3], [3, 2, 1]).freeze(),
+    RangeAdapter(8, starts=[0, 1]),
+    ])
+def test_pickle(adapter):
+    for res in [pickle.loads(pickle.dumps(adapter)), copy.deepcopy(adapter)]:
+        assert type(res) is type(adapter)
+        assert res.table.tolist() == adapter.table.tolist()
+        assert res.coded == adapter.coded
+        ins = list(adapter.ins)
+        assert res.map(ins).tolist() == adapter.map(ins).tolist()
+        assert [res[key] for key in ins] == [adapter[key] for key in ins]
+
+def test_binary_format(tmp_path):
+    adapter = Adapter([1, 2, 'GND', 'x'], [10, 20, 30, None])
+    res = Adapter.from_bytes(adapter.to_bytes())
+    assert res.table.tolist() == adapter.table.tolist()
+    path = str(tmp_path / 'adapter.bin')
+    adapter.save(path)
+    assert Adapter.load(path).table.tolist() == adapter.table.tolist()
+
+    # Tuples would come back as lists from JSON
+    adapter = Adapter([('A', 1)], [10])
+    with pytest.raises(TypeError):
+        adapter.to_bytes()
+    with pytest.raises(TypeError):
+        adapter.save(path)
+
+def test_map_out_of_range_keys():
+    a = Adapter([-1, 0, 1.5, 'x', 3], [1, 2, 3, 4, 5])
+    keys = np.array([-1, 0, 3, 7, 2 ** 40, -1])
+    assert a.map(keys).tolist() == [1, 2, 5, -1, -1, 1]
+    keys = np.array([-1., 1.5, np.nan, np.inf, 3.])
+    assert a.map(keys).tolist() == [1, 3, -1, -1, 5]
+
+    # A -1 sentinel among keys that are all channel ids
+    b = Adapter(np.arange(100), np.arange(100)[::-1])
+    keys = np.tile(np.arange(100), (3, 1))
+    keys[1, 5] = -1
+    expected = 99 - keys
+    expected[1, 5] = -1
+    assert np.array_equal(b.map(keys), expected)
+
+
+## Stacking blocks
+def test_stack():
+    block = Adapter([1, 2, 3, 4], ['GND', 0, 1, 'REF'])
+    res = Adapter.stack([block, block], in_offsets=4, out_offsets=2)
+    expected = Adapter(list(range(1, 9)),
+        ['GND', 0, 1, 'REF', 'GND', 2, 3, 'REF'])
+    assert res.table.tolist() == expected.table.tolist()
+    assert res.map([6, 7]).tolist() == [2, 3]
+
+    res = Adapter.stack([block, block, block], in_offsets=[0, 10, 20],
+        tag_symbols=True)
+    assert res.outs.tolist() == ['GND', 0, 1, 'REF', 'GND_2', 0, 1,
+        'REF_2', 'GND_3', 0, 1, 'REF_3']
+    assert res.ins.tolist() == [1, 2, 3, 4, 11, 12, 13, 14, 21, 22, 23, 24]
+
+def test_stack_errors():
+    block = Adapter([1, 2], [3, 4])
+    with pytest.raises(ValueError):
+        Adapter.stack([])
+    with pytest.raises(ValueError):
+        Adapter.stack([block, block + block])
+    with pytest.raises(ValueError):
+        Adapter.stack([block, block], in_offsets=[0])
+    with pytest.raises(ValueError):
+        Adapter.stack([block, block], in_offsets=2 ** 31)
+
+
+## RangeAdapter
+def _as_table(adapter):
+    # The same channels as an ordinary Adapter
+    return Adapter(adapter.table.copy())
+
+@pytest.mark.parametrize('chain', [
+    [RangeAdapter(36, starts=[0, 1]), RangeAdapter(36, starts=[1, 101])],
+    [RangeAdapter(10, starts=[0, 20], steps=[1, -2]),
+        RangeAdapter(5, starts=[2, 7], steps=[2, 3])],
+    [RangeAdapter(8, starts=[0, 3]), RangeAdapter(20, starts=[0, 50]),
+        RangeAdapter(4, starts=[55, 0], steps=[-1, 1])],
+    # Channels that don't go through, so there is nothing to fold
+    [RangeAdapter(4, starts=[0, 10]), RangeAdapter(4, starts=[0, 0])],
+    ])
+def test_range_chain(chain):
+    expected = Adapter.chain(*[_as_table(adapter) for adapter in chain])
+    res = Adapter.chain(*chain)
+    assert res.table.tolist() == expected.table.tolist()
+    res = chain[0]
+    for adapter in chain[1:]:
+        res = res + adapter
+    assert res.table.tolist() == expected.table.tolist()
+
+def test_range_folds():
+    res = Adapter.chain(RangeAdapter(36, starts=[0, 1]),
+        RangeAdapter(36, starts=[1, 101]))
+    assert isinstance(res, RangeAdapter)
+    assert res.starts.tolist() == [0, 1, 101]
+
+def test_range_with_tables():
+    table = Adapter([1, 2, 3, 'GND'], [5, 'x', 40, 41])
+    for chain in [[RangeAdapter(6, starts=[0, 1]), table],
+            [table, RangeAdapter(30, starts=[10, 100], steps=[2, -3])]]:
+        expected = Adapter.chain(*[_as_table(adapter) for adapter in chain])
+        assert Adapter.chain(*chain).table.tolist() == (
+            expected.table.tolist())
+
+def test_range_lookups():
+    adapter = RangeAdapter(10, starts=[0, 20], steps=[1, -2])
+    expected = _as_table(adapter)
+    keys = [0, 3, 9, 10, -1, 'GND']
+    assert adapter.map(keys).tolist() == expected.map(keys).tolist()
+    assert adapter.inv.map([20, 2, 3]).tolist() == (
+        expected.inv.map([20, 2, 3]).tolist())
+    assert adapter[3] == 14
+    assert adapter[99] is None
+    assert list(adapter[[0, 1]]) == [20, 18]
+    assert adapter.sorted_by([3, 1]).table.tolist() == [[3, 14], [1, 18]]
+    with pytest.raises(TypeError):
+        adapter.sort_by([3, 1])
+
+
+## Pin classes
+@pytest.mark.parametrize('val, cls', [
+    ('GND', GROUND), ('G1', GROUND), ('GND_2', GROUND), ('REF', REFERENCE),
+    ('PR1', REFERENCE), ('HR4', REFERENCE), ('NC', NOCONNECT),
+    ('NE', NOCONNECT), ('X', NOCONNECT), (None, NOCONNECT), (3, SIGNAL),
+    ('01A', SIGNAL),
+    ])
+def test_pin_class(val, cls):
+    assert pin_class(val) == cls
+
+def test_pin_class_strict():
+    assert pin_class('GND', strict=True) == GROUND
+    assert pin_class(3, strict=True) == SIGNAL
+    with pytest.raises(ValueError):
+        pin_class('GDN', strict=True)
+
+def test_drop_nonsignal():
+    adapter = Adapter([1, 2, 3, 4, 5], ['GND', 10, None, 'REF_2', 11])
+    assert adapter.signal_mask.tolist() == [False, True, False, False, True]
+    assert adapter.drop_nonsignal().table.tolist() == [[2, 10], [5, 11]]
+    assert adapter.inv.drop_nonsignal().table.tolist() == [[10, 2], [11, 5]]
+
+    misspelled = Adapter([1, 2, 3], ['GDN', 10, 11])
+    with pytest.raises(ValueError):
+        misspelled.drop_nonsignal()
+    assert misspelled.drop_nonsignal(strict=False).ins.tolist() == [1, 2, 3]
+
+
+## Composition cache
+@pytest.fixture
+def composition_cache():
+    size = base.composition_cache_info()['maxsize']
+    base.clear_composition_cache()
+    yield
+    base.set_composition_cache_size(size)
+    base.clear_composition_cache()
+
+def test_composition_cache_hit(composition_cache):
+    a1 = Adapter([1, 2, 3, 'GND'], [10, 20, 30, 'GND'])
+    a2 = Adapter([30, 20, 10], ['x', 'y', 'z'])
+    expected = Adapter.chain(a1, a2)
+    first = a1 + a2
+    assert base.composition_cache_info()['misses'] == 1
+    # Also for an equal adapter that is another object
+    for res in [a1 + a2, Adapter(a1.table) + a2]:
+        assert type(res) is Adapter
+        assert res.table.tolist() == expected.table.tolist()
+        assert res.names == expected.names
+    assert base.composition_cache_info()['hits'] == 2
+    assert first.table.tolist() == expected.table.tolist()
+
+    # Modifying the result or the operands doesn't change the cache
+    first.sort_by([3, 2, 1])
+    a1.table = [[1, 20], [2, 10]]
+    assert (a1 + a2).table.tolist() == [[1, 20, 'y'], [2, 10, 'z']]
+    assert (Adapter([1, 2, 3, 'GND'], [10, 20, 30, 'GND']) + a2).table.tolist(
+        ) == expected.table.tolist()
+
+    frozen = a1.freeze() + a2.freeze()
+    assert isinstance(frozen, FrozenAdapter)
+    assert frozen is a1.freeze() + a2.freeze()
+
+def test_composition_cache_size(composition_cache):
+    a1 = Adapter([1, 2], [10, 20])
+    a2 = Adapter([10, 20], [5, 6])
+    base.set_composition_cache_size(0)
+    assert (a1 + a2).table.tolist() == [[1, 10, 5], [2, 20, 6]]
+    assert base.composition_cache_info()['size'] == 0
+
+    base.set_composition_cache_size(1)
+    a1 + a2
+    a2 + a1
+    info = base.composition_cache_info()
+    assert info['size'] == 1 and info['evictions'] == 1
+    base.clear_composition_cache()
+    assert base.composition_cache_info() == {'hits': 0, 'misses': 0,
+        'evictions': 0, 'size': 0, 'maxsize': 1}
+
+def test_composition_of_ranges(composition_cache):
+    # RangeAdapters bypass the cache and fold arithmetically
+    r1 = RangeAdapter(36, starts=[0, 1])
+    r2 = RangeAdapter(36, starts=[1, 101])
+    res = r1 + r2
+    assert isinstance(res, RangeAdapter)
+    assert res.starts.tolist() == [0, 1, 101]
+
+    table = Adapter([1, 2, 3, 'GND'], [5, 'x', 40, 41])
+    for a1, a2 in [(r1, table), (table, r2), (table.freeze(), r2)]:
+        expected = Adapter.chain(_as_table(a1) if a1 is r1 else a1,
+            _as_table(a2) if a2 is r2 else a2)
+        assert (a1 + a2).table.tolist() == expected.table.tolist()
+    assert base.composition_cache_info()['size'] == 0
+
+def test_composition_cache_threads(composition_cache):
+    base.set_composition_cache_size(4)
+    adapters = [Adapter([1, 2, 3], [n, n + 1, n + 2]) for n in range(8)]
+    targets = Adapter(list(range(10)), list(range(100, 110)))
+    expected = [Adapter.chain(a, targets).table.tolist() for a in adapters]
+    errors = []
+
+    def work():
+        for repeat in range(50):
+            for a, table in zip(adapters, expected):
+                if (a + targets).table.tolist() != table:
+                    errors.append(table)
+
+    threads = [threading.Thread(target=work) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert base.composition_cache_info()['size'] == 4
+
+
+## FrozenAdapter
+def test_frozen_equality():
+    a = FrozenAdapter([1, 2, 'GND'], [10, 20, 30], names=['in', 'out'])
+    b = Adapter([1, 2, 'GND'], [10, 20, 30], names=['in', 'out']).freeze()
+    assert a == b and hash(a) == hash(b)
+    assert len(set([a, b])) == 1
+    assert a != a.renamed(['x', 'y'])
+    assert a != FrozenAdapter([1, 2, 'GND'], [10, 20, 31],
+        names=['in', 'out'])
+    assert a.freeze() is a
+
+def test_frozen_is_immutable():
+    a = FrozenAdapter([1, 2], [10, 20])
+    with pytest.raises(TypeError):
+        a.sort_by([2, 1])
+    with pytest.raises(TypeError):
+        a.table = [[1, 2]]
+    with pytest.raises(TypeError):
+        a.names = ['x', 'y']
+    with pytest.raises(ValueError):
+        a.table[0, 0] = 5
+    with pytest.raises(ValueError):
+        a.codes[0, 0] = 5
+
+    thawed = a.thaw()
+    assert type(thawed) is Adapter
+    thawed.sort_by([2, 1])
+    assert thawed.ins.tolist() == [2, 1]
+    assert a.ins.tolist() == [1, 2]
+
+def test_frozen_inv_is_a_view():
+    a = FrozenAdapter([1, 2, 3], [30, 10, 20])
+    inv = a.inv
+    assert inv.inv is a
+    assert np.shares_memory(inv.codes, a.codes)
+    assert inv.map([10, 20, 30]).tolist() == [2, 3, 1]
+    # The inverse uses the indexes and dicts of `a`
+    assert inv._index(0) is a._index(1)
+    assert inv.in2out is a.out2in
+    assert inv == FrozenAdapter([30, 10, 20], [1, 2, 3])
+
+def test_frozen_rows():
+    a = FrozenAdapter([1, 2, 3], [30, 10, 20])
+    a.map([1])
+    assert a.rows(slice(1, None)).table.tolist() == [[2, 10], [3, 20]]
+    res = a.sorted_by([3, 1, 2])
+    assert isinstance(res, FrozenAdapter)
+    assert res.map([1, 2, 3]).tolist() == [30, 10, 20]
+    assert res.table.tolist() == [[3, 20], [1, 30], [2, 10]]
+
+def test_adapter_attributes():
+    # Mutable Adapters can carry attributes of their own
+    a = Adapter([1, 2], [10, 20])
+    a.description = 'test'
+    assert a.description == 'test'
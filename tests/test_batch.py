@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+
+from Adapters import Adapter, batch, dataflow, raw
+
+
+DATAFLOW = 'wire64_big_dataflow'
+
+def _input(tmp_path, n_samples=1000):
+    n_channels = raw.channel_order(DATAFLOW).max() + 1
+    rs = np.random.RandomState(0)
+    data = rs.randint(-1000, 1000, (n_samples, n_channels)).astype(np.int16)
+    path = str(tmp_path / 'in.dat')
+    data.tofile(path)
+    return path, data
+
+def test_reorder_file(tmp_path):
+    input_path, data = _input(tmp_path)
+    output_path = str(tmp_path / 'out.dat')
+    raw.reorder_file(DATAFLOW, input_path, output_path, chunk_samples=300)
+    order = raw.channel_order(DATAFLOW)
+    out = np.fromfile(output_path, dtype=np.int16).reshape(-1, len(order))
+    assert np.array_equal(out, data[:, order])
+
+def test_interrupted_job_is_resumed(tmp_path):
+    input_path, data = _input(tmp_path)
+    output_path = str(tmp_path / 'out.dat')
+    job = (input_path, DATAFLOW, output_path)
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(chunk):
+        raise Interrupted()
+
+    # Interrupted during its first chunk, so nothing was written
+    with pytest.raises(Interrupted):
+        batch.run_job(job, chunk_samples=300, stages=[interrupt])
+    assert os.path.exists(output_path)
+    assert not batch.is_complete(output_path)
+
+    report = batch.run_job(job, chunk_samples=300)
+    assert report is not None
+    assert batch.is_complete(output_path)
+    order = raw.channel_order(DATAFLOW)
+    out = np.fromfile(output_path, dtype=np.int16).reshape(-1, len(order))
+    assert np.array_equal(out, data[:, order])
+    assert batch.run_job(job) is None
+
+
+## Permutations between orderings
+def test_permutation_with_unconnected_pins(tmp_path):
+    # Rows 1 and 3 are unconnected in one of the orderings
+    adapter = Adapter([1, 2, 3, None, 5], [30, None, 10, 40, 20],
+        names=['GUI', 'Srt'])
+    perm = raw.permutation(adapter, 'GUI', 'Srt')
+    inverse = raw.permutation(adapter, 'Srt', 'GUI')
+
+    # Channels 1, 2, 3, 5 in GUI order, and 10, 20, 30, 40 in Srt order
+    path = str(tmp_path / 'gui.dat')
+    gui_data = np.arange(40, dtype=np.int16).reshape(10, 4)
+    gui_data.tofile(path)
+    data = raw.memmap_raw(path, 4)
+    res = np.take(data, perm, axis=-1)
+    # Srt 10, 20, 30 are GUI 3, 5, 1, ie columns 2, 3, 0
+    assert np.array_equal(res, gui_data[:, [2, 3, 0]])
+
+    srt_data = np.arange(40, dtype=np.int16).reshape(10, 4)
+    # GUI 1, 3, 5 are Srt 30, 10, 20, ie columns 2, 0, 1
+    assert np.array_equal(np.take(srt_data, inverse, axis=-1),
+        srt_data[:, [2, 0, 1]])
+
+def test_permutation_of_dataflow():
+    df = dataflow.get('h3_ON4')
+    perm = raw.permutation('h3_ON4', 'GUI', 'Srt')
+    gui_order = np.argsort(df['GUI'].values, kind='mergesort')
+    srt_order = np.argsort(df['Srt'].values, kind='mergesort')
+    assert np.array_equal(gui_order[perm], srt_order)
+    assert np.array_equal(raw.permutation('h3_ON4', 'Srt', 'GUI')[perm],
+        np.arange(len(perm)))
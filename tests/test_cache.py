@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Adapters import cache, dataflow
+
+
+def test_source_modules():
+    # Every module of the package that the dataflows are built from must
+    # be hashed, or editing it would leave stale cache entries
+    code = ("import sys; from Adapters import dataflow; "
+        "print(' '.join(sorted(name.split('.')[-1] for name in sys.modules "
+        "if name.startswith('Adapters.'))))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.check_output([sys.executable, '-c', code], env=env)
+    modules = set(out.decode().split())
+    assert modules <= set(cache.SOURCE_MODULES)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    old = cache.get_cache_dir()
+    cache.enable(str(tmp_path / 'cache'))
+    yield str(tmp_path / 'cache')
+    if old is None:
+        cache.disable()
+    else:
+        cache.enable(old)
+
+def test_round_trip(cache_dir):
+    df = dataflow.get('wire64_big_dataflow')
+    cache.store('wire64_big_dataflow', df)
+    assert cache.load('wire64_big_dataflow').equals(df)
+
+@pytest.mark.parametrize('contents', [b'', b'PK\x03\x04 truncated'])
+def test_corrupt_entry_is_deleted(cache_dir, contents):
+    df = dataflow.get('wire64_big_dataflow')
+    cache.store('wire64_big_dataflow', df)
+    path = cache.entry_path('wire64_big_dataflow')
+    with open(path, 'rb') as fi:
+        data = fi.read()
+    with open(path, 'wb') as fi:
+        fi.write(contents or data[:len(data) // 2])
+    assert cache.load('wire64_big_dataflow') is None
+    assert not os.path.exists(path)
+
+def test_store_failure_is_not_fatal(cache_dir, tmp_path):
+    # The cache directory can't be created under a file
+    (tmp_path / 'file').write_text('')
+    cache.enable(str(tmp_path / 'file' / 'cache'))
+    cache.store('wire64_big_dataflow', dataflow.get('wire64_big_dataflow'))
+    assert cache.load('wire64_big_dataflow') is None
@@ -0,0 +1,59 @@
+import pytest
+
+from Adapters import dataflow
+
+
+def test_wire_dataflows():
+    df = dataflow.get('wire192_big_dataflow')
+    assert len(df) == 192
+    assert 'wire192_big_dataflow' in dataflow.names()
+
+@pytest.mark.parametrize('name', [
+    'wire0_big_dataflow', 'wire100_big_dataflow', 'nonexistent'])
+def test_unknown_dataflows(name):
+    with pytest.raises(KeyError):
+        dataflow.get(name)
+    assert name not in dataflow.names()
+
+def test_wire_dataflow_with_custom_mux2samtec():
+    from Adapters import probe_adapters
+    df = dataflow.wire_big_dataflow(128,
+        mux2samtec=probe_adapters.nanoz_mux2samtec128)
+    assert df.equals(dataflow.get('wire128_big_dataflow'))
+    # Not cached in place of the default one
+    assert dataflow.wire_big_dataflow(128) is not df
+
+def test_moved_names():
+    # These used to be imported into dataflow
+    from Adapters import channels, headstages, probes
+    assert dataflow.samtec2nn is probes.samtec2nn
+    assert dataflow.intan2gui is headstages.intan2gui
+    assert dataflow.h3_depth_df is channels.h3_depth_df
+    assert 'samtec2nn' in dir(dataflow)
+    with pytest.raises(AttributeError):
+        dataflow.nonexistent
+
+def test_headstages_are_editable():
+    from Adapters import Adapter, RangeAdapter, headstages
+    for adapter in [headstages.intan2gui, headstages.intan2gui_64ch]:
+        assert type(adapter) is Adapter
+        assert adapter.table.tolist() == (
+            RangeAdapter(len(adapter), starts=[0, 1]).table.tolist())
+    adapter = Adapter(headstages.intan2gui.table.copy())
+    adapter.sort_by([2, 1, 0] + list(range(3, 36)))
+    assert adapter.outs[:3].tolist() == [3, 2, 1]
+
+def test_probe_adapter_lists():
+    # The lists that the probe adapters used to be built from
+    from Adapters import probe_adapters
+    for prefix in ['ON4', 'A64OM32x2sm']:
+        adapter = getattr(probe_adapters, prefix + '_samtec2omnetics')
+        ins = getattr(probe_adapters, prefix + '_inputs_samtec')
+        outs = getattr(probe_adapters, prefix + '_outputs_omnetics')
+        assert adapter.ins.tolist() == ins
+        assert adapter.outs.tolist() == outs
+        assert all(type(val) is int for val in ins + outs)
+        level2 = getattr(probe_adapters, prefix + '_level2_omnetics')
+        assert len(level2) == 80
+        assert None not in level2
+        assert set(val for val in level2 if isinstance(val, str)) == {'X'}
@@ -0,0 +1,24 @@
+import numpy as np
+
+from Adapters import dbc
+
+
+def test_make_probe():
+    df = dbc.make_probe([2, 0, 1], n_shanks=2, shank_spacing=250)
+    assert df['site'].tolist() == [0, 1, 2, 3, 4, 5]
+    assert df['shank'].tolist() == ['A', 'A', 'A', 'B', 'B', 'B']
+    assert df['Intan'].tolist() == [2, 0, 1, 5, 3, 4]
+    assert df['Z'].tolist() == [0, 20, 40, 0, 20, 40]
+    assert df['X'].tolist() == [0, 0, 0, 250, 250, 250]
+    assert (df['GUI'] == df['Intan'] + 1).all()
+
+def test_make_probe_cache():
+    df = dbc.make_probe(np.arange(4), n_shanks=2)
+    df['Z'] = -1
+    res = dbc.make_probe(np.arange(4), n_shanks=2)
+    # A copy of the cached DataFrame, not changed by editing another copy
+    assert res['Z'].tolist() == [0, 20, 40, 60] * 2
+    assert res['Intan'].dtype.kind == 'i'
+    # The dtype of sort_by_depth is part of the cache key
+    assert dbc.make_probe(np.arange(4.), n_shanks=2)[
+        'Intan'].dtype.kind == 'f'
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from Adapters.geometry import GridIndex
+
+
+def _brute_force(positions, groups, row, include_self):
+    dists = np.sqrt(np.sum((positions - positions[row]) ** 2, axis=1))
+    rows = np.flatnonzero(groups == groups[row])
+    if not include_self:
+        rows = rows[rows != row]
+    order = np.lexsort((rows, dists[rows]))
+    return rows[order], dists[rows[order]]
+
+@pytest.mark.parametrize('n_dims', [1, 2])
+@pytest.mark.parametrize('include_self', [False, True])
+def test_queries(n_dims, include_self):
+    rs = np.random.RandomState(0)
+    positions = rs.rand(200, n_dims) * 100
+    groups = rs.randint(0, 3, 200)
+    index = GridIndex(positions, groups)
+    for row in range(0, 200, 7):
+        rows, dists = _brute_force(positions, groups, row, include_self)
+        for distance in [0, 5, 20, 1000]:
+            res_rows, res_dists = index.radius(row, distance, include_self)
+            keep = dists <= distance
+            assert np.array_equal(res_rows, rows[keep])
+            assert np.allclose(res_dists, dists[keep])
+        for k in [1, 4, 500]:
+            res_rows, res_dists = index.knn(row, k, include_self)
+            assert np.array_equal(res_rows, rows[:k])
+            assert np.allclose(res_dists, dists[:k])
+
+def test_positions_must_be_finite():
+    with pytest.raises(ValueError):
+        GridIndex([[0., 0.], [1., np.nan], [2., 2.]])
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from Adapters import impedance
+
+
+SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'nanoz_sample.txt')
+
+def _equal(a, b):
+    return np.allclose(a, b, equal_nan=True)
+
+def test_read_nanoz():
+    mux, z, phase = impedance.read_nanoz(SAMPLE)
+    assert mux.tolist() == [1, 2, 3, 4]
+    assert _equal(z, [0.523e6, 1.31e6, np.nan, 0.044e6])
+    assert _equal(phase, [-62.1, -58.0, np.nan, -71.5])
+
+@pytest.mark.parametrize('text', [
+    'Channel,Impedance (kOhms)\nMUX1,523\nMUX2,1310\n',
+    'ch;Phase (deg);|Z|\n1;-62.1;523 kOhm\n2;-58.0;1.31 MOhm\n',
+    'Site Impedance Phase\n1 523k -62.1\n2 1.31M -58.0\n',
+    'MUX,Impedance Phase at 1004 Hz (degrees),'
+        'Impedance Magnitude at 1004 Hz (ohms)\n1,-62.1,523000\n'
+        '2,-58.0,1310000\n',
+    ])
+def test_header_variants(tmp_path, text):
+    path = str(tmp_path / 'eib.txt')
+    with open(path, 'w') as fi:
+        fi.write(text)
+    mux, z, phase = impedance.read_nanoz(path)
+    assert mux.tolist() == [1, 2]
+    assert _equal(z, [523e3, 1.31e6])
+    if 'hase' in text:
+        assert _equal(phase, [-62.1, -58.0])
+
+def test_no_header(tmp_path):
+    path = str(tmp_path / 'eib.txt')
+    with open(path, 'w') as fi:
+        fi.write('Electrode,Resistance\n1,523\n')
+    with pytest.raises(ValueError):
+        impedance.read_nanoz(path)
+
+def test_load_directory(tmp_path):
+    for session in ['day1', 'day2']:
+        os.mkdir(str(tmp_path / session))
+        shutil.copy(SAMPLE, str(tmp_path / session / 'eib01.txt'))
+    res = impedance.load_directory(str(tmp_path), n_workers=0)
+    assert list(res.columns) == impedance.COLUMNS
+    assert sorted(set(res['session'])) == ['day1', 'day2']
+    assert len(res) == 8
+    assert impedance.load_directory(str(tmp_path), n_workers=0).equals(res)
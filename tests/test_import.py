@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+
+def _imports_pandas(statement):
+    # In a fresh process, since this one may have imported pandas already
+    code = "import sys; {}; print('pandas' in sys.modules)".format(statement)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return out.split()[-1] == b'True'
+
+def test_import_without_pandas():
+    assert not _imports_pandas("import Adapters")
+
+def test_adapters_without_pandas():
+    # Adapters from the package are usable without building a DataFrame
+    assert not _imports_pandas("from Adapters import routes; "
+        "routes.route('samtec', 'gui', via='ON4').map([1, 2, 3])")
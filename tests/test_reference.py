@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from Adapters.reference import Referencer
+
+
+def _naive(data, labels, method):
+    func = np.median if method == 'median' else np.mean
+    res = data.astype(float)
+    for group in np.unique(labels[labels >= 0]):
+        columns = np.flatnonzero(labels == group)
+        res[:, columns] -= func(data[:, columns], axis=1)[:, None]
+    return res
+
+@pytest.mark.parametrize('dtype', [np.int16, np.float32, np.float64])
+@pytest.mark.parametrize('method', ['median', 'mean'])
+@pytest.mark.parametrize('labels', [
+    [0, 0, 0, 0, 1, 1, 1, 1],       # equal groups
+    [0, 0, 0, 1, 1, 1, 1, 1],       # unequal groups
+    [0, 1, 0, 1, 0, 1, 0, 1],       # interleaved
+    [0, 0, -1, 1, 1, 1, -1, 0],     # partly unlabeled
+    ])
+def test_referencer(dtype, method, labels):
+    labels = np.array(labels)
+    rs = np.random.RandomState(0)
+    data = (rs.randn(1000, len(labels)) * 1000).astype(dtype)
+    expected = _naive(data, labels, method)
+
+    # Blocks smaller than the data, to go through several of them
+    res = Referencer(labels, method=method, block_samples=300)(data.copy())
+    assert res.dtype == dtype
+    if np.dtype(dtype).kind == 'i':
+        assert np.abs(res - expected).max() <= 1
+    else:
+        assert np.allclose(res, expected, rtol=1e-4, atol=1e-2)
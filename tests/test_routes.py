@@ -0,0 +1,56 @@
+import pytest
+
+from Adapters import Adapter, FrozenAdapter, routes
+from Adapters import headstages, probe_adapters, probes
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    # A copy of the graph, which the tests can add edges to
+    monkeypatch.setattr(routes, '_edges', list(routes._edges))
+    monkeypatch.setattr(routes, '_routes', {})
+
+def _names(path):
+    return [(edge.name, forward) for edge, forward in path]
+
+def test_path():
+    assert _names(routes.path('samtec', 'gui', via='ON4')) == [
+        ('ON4', True), ('intan', True), ('gui', True)]
+    assert _names(routes.path('gui', 'nn', via=['ON2'])) == [
+        ('gui', False), ('intan', False), ('ON2', False), ('A32', True)]
+    # A named edge replaces the default one between the same levels
+    assert _names(routes.path('omnetics', 'intan', via='rhd2164')) == [
+        ('rhd2164', True)]
+
+def test_path_errors():
+    with pytest.raises(ValueError):
+        # Samtec to Omnetics needs a probe adapter
+        routes.path('samtec', 'gui')
+    with pytest.raises(KeyError):
+        routes.path('samtec', 'gui', via='ON5')
+    with pytest.raises(ValueError):
+        routes.path('gui', 'gui')
+
+def test_route():
+    res = routes.route('janelia', 'gui', via='ON4')
+    assert isinstance(res, FrozenAdapter)
+    assert res.names == ['janelia', 'samtec', 'omnetics', 'intan', 'gui']
+    expected = Adapter.chain(probes.samtec2janelia_64ch.inv,
+        probe_adapters.ON4_samtec2omnetics, headstages.omnetics2intan_64ch,
+        headstages.intan2gui_64ch)
+    assert res.table.tolist() == expected.table.tolist()
+    # Cached, with the order of via not mattering
+    assert routes.route('janelia', 'gui', via=['ON4']) is res
+
+def test_register(graph):
+    res = routes.route('intan', 'gui')
+    routes.register('gui', 'display', Adapter([1, 2], [10, 20]), 'display',
+        default=True)
+    assert 'display' in routes.levels()
+    assert routes.route('intan', 'display').map([0, 1, 2]).tolist() == [
+        10, 20, -1]
+    # Registering clears the cached routes
+    assert routes.route('intan', 'gui') is not res
+    with pytest.raises(ValueError):
+        routes.register('display', 'gui', Adapter([1], [1]), 'other',
+            default=True)
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Adapters import FrozenAdapter, dataflow, shared
+
+
+NAMES = ['dataflow_janelia_64ch_ON4', 'dataflow_h3_ON4_df']
+
+@pytest.fixture
+def built():
+    # The dataflows as built, and dataflow.get left as it was
+    saved = dict(dataflow._built)
+    yield dict((name, dataflow.get(name)) for name in NAMES)
+    dataflow._built.clear()
+    dataflow._built.update(saved)
+
+def _check_store(store, built):
+    assert store.names() == sorted(NAMES)
+    adapter = store.get(NAMES[0])
+    assert isinstance(adapter, FrozenAdapter)
+    assert adapter == built[NAMES[0]].freeze()
+    assert adapter.map([1, 2]).tolist() == built[NAMES[0]].map(
+        [1, 2]).tolist()
+    assert store.get(NAMES[1]).equals(built[NAMES[1]])
+
+@pytest.mark.parametrize('in_file', [False, True])
+def test_publish_and_attach(built, tmp_path, in_file):
+    path = str(tmp_path / 'dataflows') if in_file else None
+    with shared.publish(NAMES, path=path) as store:
+        _check_store(store, built)
+        worker = shared.attach(store.name)
+        _check_store(worker, built)
+        assert dataflow.get(NAMES[0]) is worker.get(NAMES[0])
+        worker.close()
+
+        # Built again rather than returning the closed views
+        assert dataflow.get(NAMES[0]) is not built[NAMES[0]]
+        assert dataflow.get(NAMES[0]).table.tolist() == (
+            built[NAMES[0]].table.tolist())
+        assert dataflow.get(NAMES[1]).equals(built[NAMES[1]])
+
+def test_close_keeps_other_dataflows(built):
+    with shared.publish(NAMES) as store:
+        worker = shared.attach(store.name)
+        replacement = dataflow._built[NAMES[1]] = built[NAMES[1]]
+        worker.close()
+        assert NAMES[0] not in dataflow._built
+        assert dataflow._built[NAMES[1]] is replacement
+
+def test_get_after_unlink():
+    # This used to crash, so it runs in another process
+    script = (
+        "from Adapters import dataflow, shared\n"
+        "with shared.publish({names!r}) as store:\n"
+        "    shared.attach(store.name).close()\n"
+        "    store.install()\n"
+        "print(dataflow.get({name!r}).map([1]).tolist())\n"
+        ).format(names=NAMES, name=NAMES[0])
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p])
+    res = subprocess.run([sys.executable, '-c', script], env=env,
+        capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    expected = dataflow.get(NAMES[0]).map([1]).tolist()
+    assert res.stdout.strip() == str(expected)